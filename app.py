@@ -1,4 +1,5 @@
 import os
+import json
 import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
@@ -27,6 +28,75 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Multiplayer: with more than one worker, rooms must live in a shared registry
+# and broadcasts must go through a Socket.IO message queue (e.g. redis://)
+app.config["ROOM_REGISTRY"] = os.environ.get("ROOM_REGISTRY", "memory")
+app.config["ROOM_REGISTRY_PATH"] = os.environ.get("ROOM_REGISTRY_PATH")
+app.config["SOCKETIO_MESSAGE_QUEUE"] = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+
+# Game pages of these types load the Socket.IO client. It asks for MessagePack,
+# which needs the 'binary' extra on the server, and otherwise stays on JSON
+app.config["MULTIPLAYER_GAME_TYPES"] = os.environ.get("MULTIPLAYER_GAME_TYPES", "fpsgame").split(",")
+
+# 'threading' for the dev server and sync gunicorn; serve.py switches to 'gevent'.
+# Set explicitly so an installed gevent/eventlet isn't picked up by autodetection.
+app.config["SOCKETIO_ASYNC_MODE"] = os.environ.get("SOCKETIO_ASYNC_MODE", "threading")
+
+# Per-game_type tick rates (Hz) for batching game actions, e.g. '{"fpsgame": 20}'.
+# Game types without a rate broadcast every action immediately.
+app.config["GAME_TICK_RATES"] = json.loads(os.environ.get("GAME_TICK_RATES", "{}"))
+
+# Overrides for the per-event socket rate limits in throttle.py, e.g.
+# '{"chat_message": {"rate": 2, "burst": 10, "policy": "drop"}}', and the send
+# queue length at which a client counts as a slow consumer
+app.config["SOCKET_RATE_LIMITS"] = json.loads(os.environ.get("SOCKET_RATE_LIMITS", "{}"))
+app.config["SLOW_CONSUMER_QUEUE"] = int(os.environ.get("SLOW_CONSUMER_QUEUE", 256))
+
+# Matchmaking: room size per game_type (default 4), and how long the oldest
+# queued player waits before a room is opened with fewer players
+app.config["MATCH_ROOM_SIZES"] = json.loads(os.environ.get("MATCH_ROOM_SIZES", "{}"))
+app.config["MATCH_MAX_WAIT"] = float(os.environ.get("MATCH_MAX_WAIT", 10))
+app.config["MATCH_MIN_PLAYERS"] = int(os.environ.get("MATCH_MIN_PLAYERS", 2))
+
+# Chat history kept per room (messages and bytes), and an optional directory
+# where older messages are appended so chat_history can page back further
+app.config["CHAT_HISTORY_SIZE"] = int(os.environ.get("CHAT_HISTORY_SIZE", 50))
+app.config["CHAT_HISTORY_BYTES"] = int(os.environ.get("CHAT_HISTORY_BYTES", 16384))
+app.config["CHAT_MAX_MESSAGE_LENGTH"] = int(os.environ.get("CHAT_MAX_MESSAGE_LENGTH", 500))
+app.config["CHAT_SPILL_DIR"] = os.environ.get("CHAT_SPILL_DIR")
+
+# Seconds without any event before a player is disconnected, or without game
+# actions, chat or joins before a room is closed
+app.config["PLAYER_IDLE_TIMEOUT"] = float(os.environ.get("PLAYER_IDLE_TIMEOUT", 900))
+app.config["ROOM_IDLE_TIMEOUT"] = float(os.environ.get("ROOM_IDLE_TIMEOUT", 1800))
+
+# Uploaded thumbnails: where they're stored (default static/uploads/thumbnails),
+# the fixed-size variants rendered for each, e.g. '{"card": [320, 180]}', the
+# upload size limit, render threads, and how often and after how long
+# unreferenced images are deleted (seconds)
+app.config["THUMBNAIL_DIR"] = os.environ.get("THUMBNAIL_DIR")
+app.config["THUMBNAIL_SIZES"] = json.loads(os.environ.get("THUMBNAIL_SIZES", "{}"))
+app.config["THUMBNAIL_MAX_BYTES"] = int(os.environ.get("THUMBNAIL_MAX_BYTES", 5 * 1024 * 1024))
+app.config["THUMBNAIL_WORKERS"] = int(os.environ.get("THUMBNAIL_WORKERS", 2))
+app.config["THUMBNAIL_GC_INTERVAL"] = float(os.environ.get("THUMBNAIL_GC_INTERVAL", 3600))
+app.config["THUMBNAIL_GC_GRACE"] = float(os.environ.get("THUMBNAIL_GC_GRACE", 3600))
+
+# User game plays are buffered and written in batches, rolled up per hour and
+# day; raw plays and hourly rollups are deleted after these many days
+app.config["PLAY_BUFFER_ENABLED"] = os.environ.get("PLAY_BUFFER_ENABLED", "1") != "0"
+app.config["PLAY_RETENTION_DAYS"] = int(os.environ.get("PLAY_RETENTION_DAYS", 30))
+app.config["PLAY_HOURLY_RETENTION_DAYS"] = int(os.environ.get("PLAY_HOURLY_RETENTION_DAYS", 90))
+
+# Half-lives, in hours, of the trending and top rated rankings of user games,
+# and how often each worker syncs its scores with the others (seconds)
+app.config["TRENDING_HALF_LIFE_HOURS"] = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 24))
+app.config["TOP_RATED_HALF_LIFE_HOURS"] = float(os.environ.get("TOP_RATED_HALF_LIFE_HOURS", 7 * 24))
+app.config["TRENDING_SYNC_INTERVAL"] = float(os.environ.get("TRENDING_SYNC_INTERVAL", 5))
+
+# Where user game code is published as precompressed, fingerprinted JS files
+# (default static/uploads/code)
+app.config["GAME_CODE_DIR"] = os.environ.get("GAME_CODE_DIR")
+
 # Initialize the database
 db.init_app(app)
 
@@ -35,11 +105,16 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Schema creation and seeding live in `flask bootstrap` (see bootstrap.py);
+# importing the app does no database work so workers start quickly.
 with app.app_context():
-    # Import models and create tables
+    # Import models
     import models
-    db.create_all()
     
     # Import and register routes
     from routes import register_routes
     register_routes(app)
+    
+    # Register CLI maintenance commands
+    from commands import register_commands
+    register_commands(app)
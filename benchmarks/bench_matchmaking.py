@@ -0,0 +1,98 @@
+"""Simulate thousands of players queueing for matches and report wait times and room fill.
+
+Players arrive at --arrival-rate per second over --duration simulated
+seconds, each for a random game type, play for an exponentially distributed
+session and leave, so rooms lose players and get backfilled. The matchmaker
+runs a pass every --interval simulated seconds; wall-clock time per pass is
+reported alongside simulated queue waits.
+
+Usage: python benchmarks/bench_matchmaking.py [--arrival-rate 50] [--duration 600] [--registry memory]
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matchmaking import Matchmaker
+from rooms import MemoryRoomRegistry, SqliteRoomRegistry
+
+GAME_TYPES = ['fpsgame', 'pong', 'snake', 'tetris']
+
+class SimulatedRunner:
+    # Passes are driven by the simulation loop instead of a background task
+    def start_background_task(self, target):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--arrival-rate', type=float, default=50, help="players joining the queue per second")
+    parser.add_argument('--duration', type=float, default=600, help="simulated seconds")
+    parser.add_argument('--session', type=float, default=120, help="mean seconds a player stays in a room")
+    parser.add_argument('--room-size', type=int, default=4)
+    parser.add_argument('--max-wait', type=float, default=10)
+    parser.add_argument('--interval', type=float, default=0.25)
+    parser.add_argument('--registry', default='memory', choices=['memory', 'sqlite'])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    if args.registry == 'sqlite':
+        registry = SqliteRoomRegistry(os.path.join(tempfile.mkdtemp(), 'rooms.db'))
+    else:
+        registry = MemoryRoomRegistry()
+
+    departures = []  # heap of (time, sid)
+
+    def place(sid, room_id, backfill):
+        heapq.heappush(departures, (now + rng.expovariate(1 / args.session), sid))
+
+    matchmaker = Matchmaker(SimulatedRunner(), registry, place, default_room_size=args.room_size,
+                            max_wait=args.max_wait, interval=args.interval)
+
+    now = 0.0
+    next_arrival = rng.expovariate(args.arrival_rate)
+    arrivals = 0
+    pass_seconds = []
+    occupancy = []
+    while now < args.duration:
+        while next_arrival <= now:
+            sid = f"sid-{arrivals}"
+            registry.add_player(sid, f"player-{arrivals}")
+            matchmaker.enqueue(sid, rng.choice(GAME_TYPES), now=next_arrival)
+            arrivals += 1
+            next_arrival += rng.expovariate(args.arrival_rate)
+        while departures and departures[0][0] <= now:
+            _, sid = heapq.heappop(departures)
+            player = registry.remove_player(sid)
+            if player and player.room:
+                registry.leave_room(player.room, player.id)
+
+        started = time.perf_counter()
+        matchmaker.match(now)
+        pass_seconds.append(time.perf_counter() - started)
+
+        if int(now / args.interval) % int(10 / args.interval) == 0:
+            rooms = [room for game_type in GAME_TYPES for room in map(registry.get_room, registry.rooms_for_game_type(game_type))]
+            if rooms:
+                occupancy.append(sum(len(room['players']) for room in rooms) / (len(rooms) * args.room_size))
+        now += args.interval
+
+    stats = matchmaker.stats()
+    pass_seconds.sort()
+    print(f"arrivals:          {arrivals}")
+    print(f"matched:           {stats['matched']} ({stats['backfilled']} backfilled)")
+    print(f"rooms formed:      {stats['rooms_formed']}")
+    print(f"still queued:      {sum(stats['queued'].values())}")
+    print(f"queue wait (sim):  p50 {stats['wait_seconds']['p50']}s  p95 {stats['wait_seconds']['p95']}s  "
+          f"max {stats['wait_seconds']['max']}s")
+    print(f"room occupancy:    {sum(occupancy) / max(len(occupancy), 1):.0%} average")
+    print(f"pass time (wall):  p50 {pass_seconds[len(pass_seconds) // 2] * 1000:.2f}ms  "
+          f"p99 {pass_seconds[int(len(pass_seconds) * 0.99)] * 1000:.2f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Simulate weeks of uptime with abandoned rooms and ghost players and track registry memory.
+
+Each simulated minute, --arrivals players connect and either create a room or
+join one; a --ghost-ratio share of them vanish without disconnecting and
+their rooms go quiet. With the reaper the traced memory should level off
+after the first timeout window; with --no-reaper it grows without bound.
+
+Usage: python benchmarks/bench_reaper.py [--days 14] [--arrivals 20] [--ghost-ratio 0.3] [--no-reaper]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reaper import Reaper
+from rooms import MemoryRoomRegistry
+
+class SimulatedRunner:
+    # Passes are driven by the simulation loop instead of a background task
+    def start_background_task(self, target):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--arrivals', type=int, default=20, help="players connecting per simulated minute")
+    parser.add_argument('--ghost-ratio', type=float, default=0.3)
+    parser.add_argument('--session', type=float, default=600, help="seconds a well-behaved player stays")
+    parser.add_argument('--no-reaper', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    registry = MemoryRoomRegistry()
+
+    def drop_player(sid):
+        player = registry.remove_player(sid)
+        if player and player.room:
+            registry.leave_room(player.room, player.id)
+
+    def close_room(room_id):
+        room = registry.get_room(room_id)
+        for member in room['players'] if room else ():
+            sid = registry.player_sid(member['id'])
+            if sid:
+                registry.set_player_room(sid, None)
+            registry.leave_room(room_id, member['id'])
+
+    reaper = Reaper(SimulatedRunner(), registry, drop_player, close_room)
+    tracemalloc.start()
+
+    leaving = {}  # minute -> sids disconnecting cleanly then
+    open_rooms = []
+    serial = 0
+    # Simulated time starts at the wall clock, since the registry stamps new rooms with it
+    start = time.time()
+    print(f"{'day':>4} {'players':>9} {'rooms':>7} {'traced MB':>10}")
+    for minute in range(args.days * 24 * 60):
+        now = start + minute * 60.0
+        for _ in range(args.arrivals):
+            serial += 1
+            sid = f"sid-{serial}"
+            registry.add_player(sid, f"player-{serial}")
+            reaper.touch(sid, now=now)
+            room_id = open_rooms.pop() if open_rooms and rng.random() < 0.6 else None
+            if room_id is None or registry.get_room(room_id) is None:
+                room_id = f"room-{serial}"
+                registry.create_room(room_id, 'pong', 4)
+                open_rooms.append(room_id)
+            registry.join_room(room_id, {'id': f"player-{serial}", 'username': 'Anonymous'})
+            registry.set_player_room(sid, room_id)
+            reaper.touch(sid, room_id, now=now)
+            if rng.random() >= args.ghost_ratio:
+                leaving.setdefault(minute + int(rng.expovariate(60 / args.session)) + 1, []).append(sid)
+        for sid in leaving.pop(minute, ()):
+            player = registry.get_player(sid)
+            if player:
+                if player.room:
+                    reaper.touch(sid, player.room, now=now)
+                drop_player(sid)
+                reaper.forget_player(sid)
+        if not args.no_reaper:
+            reaper.reap(now)
+        if minute % (24 * 60) == 24 * 60 - 1:
+            current, _ = tracemalloc.get_traced_memory()
+            print(f"{minute // (24 * 60) + 1:>4} {len(registry._players):>9} {len(registry._rooms):>7} "
+                  f"{current / 1e6:>10.1f}")
+        # Keep the pool of rooms to join small, like a lobby list
+        del open_rooms[:-50]
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Micro-benchmark join/leave churn and per-connection memory of the in-process room registry.
+
+Usage: python benchmarks/bench_room_churn.py [--players 50000] [--room-size 4] [--ops 500000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rooms import MemoryRoomRegistry, JOINED
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=50000)
+    parser.add_argument('--room-size', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=500000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    tracemalloc.start()
+    registry = MemoryRoomRegistry()
+    sids = [f"sid-{i}" for i in range(args.players)]
+    for sid in sids:
+        registry.add_player(sid, str(uuid.UUID(int=rng.getrandbits(128))))
+    room_ids = [f"room-{i}" for i in range(args.players // args.room_size)]
+    for room_id in room_ids:
+        registry.create_room(room_id, rng.choice(['fpsgame', 'pong']), args.room_size)
+    for index, sid in enumerate(sids):
+        player = registry.get_player(sid)
+        room_id = room_ids[index // args.room_size]
+        registry.join_room(room_id, {'id': player.id, 'username': player.username})
+        registry.set_player_room(sid, room_id)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"players: {args.players:,} in {len(room_ids):,} rooms, {current / args.players:,.0f} bytes per player")
+
+    # Churn: a random player leaves their room and joins another one with a free seat
+    started = time.perf_counter()
+    joins = 0
+    for _ in range(args.ops):
+        sid = rng.choice(sids)
+        player = registry.get_player(sid)
+        if player.room is not None:
+            registry.leave_room(player.room, player.id)
+            registry.set_player_room(sid, None)
+        room_id = rng.choice(room_ids)
+        if registry.room_game_type(room_id) is None:
+            registry.create_room(room_id, 'fpsgame', args.room_size)
+        if registry.join_room(room_id, {'id': player.id, 'username': player.username}) == JOINED:
+            registry.set_player_room(sid, room_id)
+            joins += 1
+    elapsed = time.perf_counter() - started
+    print(f"churn: {args.ops:,} leave+join cycles in {elapsed:.2f}s "
+          f"({args.ops / elapsed:,.0f}/s, {elapsed / args.ops * 1e6:.2f}us each, {joins:,} joins succeeded)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Benchmark the main HTTP routes over a large seeded database.
+
+Seeds the database with synthetic.load_synthetic (by default 100k users, 10M
+scores, 1M ratings and comments, 20k user games and 2M plays; use --scale to
+shrink everything),
+then drives each route through the Flask test client and reports latency
+percentiles and SQL statements per request. A database that already holds
+generated players is reused, so repeated runs against the same
+--database-url skip seeding.
+
+Runs on SQLite by default; pass --database-url postgresql://... for a local
+PostgreSQL.
+
+Usage: python benchmarks/bench_routes.py [--scale 0.01] [--requests 200] [--database-url URL]
+                                         [--no-cache] [--output report.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def summarize(latencies, queries, statuses):
+    latencies = sorted(latencies)
+    def at(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+    return {
+        'requests': len(latencies),
+        'p50_ms': at(0.5), 'p95_ms': at(0.95), 'p99_ms': at(0.99), 'max_ms': round(latencies[-1] * 1000, 2),
+        'queries_mean': round(sum(queries) / len(queries), 1), 'queries_max': max(queries),
+        'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every row count by this")
+    parser.add_argument('--requests', type=int, default=200, help="measured requests per route")
+    parser.add_argument('--warmup', type=int, default=5, help="unmeasured requests per route first")
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--no-cache', action='store_true', help="disable the response cache")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp()}/bench_routes.db"
+    os.environ['DATABASE_URL'] = args.database_url
+    sys.path.insert(0, ROOT)
+
+    from app import app, db
+    from models import User, Game
+    from bootstrap import bootstrap
+    from cache import response_cache
+    from synthetic import DEFAULT_COUNTS, load_synthetic
+    counts = {name: max(1, int(count * args.scale)) for name, count in DEFAULT_COUNTS.items()}
+    logging.getLogger().setLevel(logging.WARNING)
+    # Failing routes show up in the statuses column rather than as a traceback per request
+    app.logger.setLevel(logging.CRITICAL)
+
+    with app.app_context():
+        bootstrap()
+        # Generated players are the only ones named like this; the first is the most active
+        player = User.query.filter(User.username.like('player%')).order_by(User.id).first()
+        if player is None:
+            load_synthetic(counts, seed=args.seed, password='bench', progress=lambda name, rows, elapsed: print(
+                f"seeded {rows:>10,} {name:<10} in {elapsed:6.1f}s", flush=True))
+            player = User.query.filter(User.username.like('player%')).order_by(User.id).first()
+        else:
+            print("reusing seeded database")
+        username = player.username
+        game_ids = [game_id for (game_id,) in db.session.query(Game.id)]
+        counter = QueryCounter(db.engine)
+    response_cache.enabled = not args.no_cache
+
+    rng = random.Random(args.seed)
+    anonymous = app.test_client()
+    member = app.test_client()
+    member.post('/login', data={'username': username, 'password': 'bench'})
+
+    routes = [
+        ('GET /', anonymous, lambda: anonymous.get('/')),
+        ('GET / (logged in)', member, lambda: member.get('/')),
+        ('GET /games', anonymous, lambda: anonymous.get('/games')),
+        ('GET /game/<id>', anonymous, lambda: anonymous.get(f"/game/{rng.choice(game_ids)}")),
+        ('GET /game/<id> (logged in)', member, lambda: member.get(f"/game/{rng.choice(game_ids)}")),
+        ('GET /leaderboard', anonymous, lambda: anonymous.get('/leaderboard')),
+        ('GET /profile', member, lambda: member.get('/profile')),
+        ('GET /user-games', anonymous, lambda: anonymous.get('/user-games')),
+        ('POST /submit_score', member, lambda: member.post('/submit_score', data={
+            'game_id': rng.choice(game_ids), 'score': rng.randint(0, 10000)})),
+    ]
+
+    report = {'database': args.database_url.split('://', 1)[0], 'rows': counts, 'cache': not args.no_cache,
+              'routes': {}}
+    print(f"\n{'route':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}  statuses")
+    for name, client, call in routes:
+        for _ in range(args.warmup):
+            call()
+        latencies, queries, statuses = [], [], []
+        for _ in range(args.requests):
+            before = counter.count
+            started = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - started)
+            queries.append(counter.count - before)
+            statuses.append(response.status_code)
+        result = report['routes'][name] = summarize(latencies, queries, statuses)
+        print(f"{name:<28} {result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} "
+              f"{result['queries_mean']:>8}  {result['statuses']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Compare score inserts per second: one INSERT+COMMIT per score vs the write-behind buffer.
+
+Usage: python benchmarks/bench_score_ingest.py [--scores 20000] [--database-url URL]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scores', type=int, default=20000)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp()}/bench_ingest.db"
+    os.environ['DATABASE_URL'] = args.database_url
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import logging
+    from app import app, db
+    from models import User, Game, Score
+    from stats import bump_game_stats
+    from ingest import score_buffer
+    from bootstrap import bootstrap
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        bootstrap()
+        user = User(username='bench_ingest', email='bench_ingest@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        game_id = Game.query.first().id
+
+        started = time.perf_counter()
+        for i in range(args.scores):
+            db.session.add(Score(score=i, user_id=user_id, game_id=game_id))
+            bump_game_stats(game_id, score_count=1)
+            db.session.commit()
+        direct = args.scores / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(args.scores):
+        while not score_buffer.submit(user_id, 'bench_ingest', game_id, i):
+            score_buffer.flush()
+    score_buffer.flush()
+    buffered = args.scores / (time.perf_counter() - started)
+
+    print(f"database:          {args.database_url}")
+    print(f"direct inserts/s:  {direct:,.0f}")
+    print(f"buffered inserts/s: {buffered:,.0f} ({buffered / direct:.1f}x)")
+    print(f"buffer stats:      {score_buffer.stats()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Measure cold-start cost: importing the app and serving the first request, in fresh processes.
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--database-url URL]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter each time so nothing is already imported or cached
+PROBE = """
+import json, logging, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+logging.getLogger().setLevel(logging.WARNING)
+response = main.app.test_client().get('/games')
+finished = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000,
+                  'first_request_ms': (finished - imported) * 1000,
+                  'status': response.status_code}))
+"""
+
+def run_probe(env):
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['DATABASE_URL'] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench_startup.db"
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'bootstrap'],
+                   cwd=ROOT, env=env, capture_output=True, check=True)
+
+    results = [run_probe(env) for _ in range(args.runs)]
+    if any(result['status'] != 200 for result in results):
+        raise SystemExit(f"First request failed: {results}")
+
+    for name in ('import_ms', 'first_request_ms'):
+        values = sorted(result[name] for result in results)
+        print(f"{name:18} median {statistics.median(values):8.1f}  min {values[0]:8.1f}  max {values[-1]:8.1f}")
+
+if __name__ == '__main__':
+    main()
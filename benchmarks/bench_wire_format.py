@@ -0,0 +1,86 @@
+"""Compare JSON and MessagePack Socket.IO packets for 2D Shooter Arena traffic.
+
+Builds game_frame broadcasts like the tick scheduler sends for fpsgame
+(--players moving, aiming and shooting each tick) plus a room_joined
+snapshot, and reports bytes per packet and encode/decode time per packet
+with the server's packet classes.
+
+Needs msgpack: pip install msgpack
+
+Usage: python benchmarks/bench_wire_format.py [--players 8] [--iterations 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet
+from packing import BinaryPacket, NegotiatedPacket
+
+def shooter_frame(rng, players, tick):
+    actions = []
+    for player_id in players:
+        x, y = round(rng.uniform(0, 800), 2), round(rng.uniform(0, 600), 2)
+        actions.append({'player_id': player_id, 'action': 'move',
+                        'data': {'x': x, 'y': y, 'vx': round(rng.uniform(-200, 200), 2),
+                                 'vy': round(rng.uniform(-200, 200), 2)}})
+        actions.append({'player_id': player_id, 'action': 'aim', 'data': {'angle': round(rng.uniform(-3.14, 3.14), 3)}})
+        if rng.random() < 0.3:
+            actions.append({'player_id': player_id, 'action': 'shoot',
+                            'data': {'x': x, 'y': y, 'angle': round(rng.uniform(-3.14, 3.14), 3),
+                                     'bullet_id': rng.getrandbits(32)}})
+    return {'tick': tick, 'actions': actions}
+
+def room_snapshot(rng, players):
+    return {
+        'room_id': uuid.UUID(int=rng.getrandbits(128)).hex[:8],
+        'game_type': 'fpsgame',
+        'players': [{'id': player_id, 'username': f"player{index}"} for index, player_id in enumerate(players)],
+        'tick_rate': 20,
+        'state_version': 1532,
+        'game_state': {
+            'scores': {player_id: rng.randint(0, 40) for player_id in players},
+            'health': {player_id: rng.randint(0, 100) for player_id in players},
+            'positions': {player_id: [round(rng.uniform(0, 800), 2), round(rng.uniform(0, 600), 2)]
+                          for player_id in players},
+            'round_ends_at': 1760000000.5,
+        },
+        'chat': [{'player_id': players[0], 'username': 'player0', 'message': 'gg', 'timestamp': '12:00:00',
+                  'seq': seq} for seq in range(1, 21)],
+    }
+
+def measure(packet_class, event, payload, iterations):
+    pkt = packet_class(packet.EVENT, namespace='/', data=[event, payload])
+    encoded = pkt.encode()
+    size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+    encode = timeit.timeit(lambda: packet_class(packet.EVENT, namespace='/', data=[event, payload]).encode(),
+                           number=iterations) / iterations
+    decode = timeit.timeit(lambda: NegotiatedPacket(encoded_packet=encoded), number=iterations) / iterations
+    return size, encode, decode
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    players = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.players)]
+
+    cases = [('game_frame', shooter_frame(rng, players, 4200)), ('room_joined', room_snapshot(rng, players))]
+    print(f"{'event':<12} {'format':<8} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    for event, payload in cases:
+        results = {}
+        for name, packet_class in (('json', NegotiatedPacket), ('msgpack', BinaryPacket)):
+            size, encode, decode = results[name] = measure(packet_class, event, payload, args.iterations)
+            print(f"{event:<12} {name:<8} {size:>7} {encode * 1e6:>10.1f} {decode * 1e6:>10.1f}")
+        json_result, msgpack_result = results['json'], results['msgpack']
+        print(f"{'':<12} {'ratio':<8} {msgpack_result[0] / json_result[0]:>7.2f} "
+              f"{msgpack_result[1] / json_result[1]:>10.2f} {msgpack_result[2] / json_result[2]:>10.2f}")
+
+if __name__ == '__main__':
+    main()
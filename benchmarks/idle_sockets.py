@@ -0,0 +1,173 @@
+"""Open many idle Socket.IO websockets against one server process and report how many stay up.
+
+Starts serve.py (or attaches to --url), connects --sockets clients over raw
+websockets with asyncio, answers Engine.IO pings for --hold seconds, then
+reports how many are still connected and the server's RSS. The server needs
+two descriptors per websocket (see serve.py); the client side needs one each
+plus enough local ports.
+
+Usage: python benchmarks/idle_sockets.py [--sockets 10000] [--hold 30] [--url http://127.0.0.1:5000]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+class IdleSocket:
+    """A bare Engine.IO v4 websocket client that only joins the default namespace and answers pings."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.connected = False
+
+    async def run(self, stop):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((f"GET /socket.io/?EIO=4&transport=websocket HTTP/1.1\r\n"
+                      f"Host: {self.host}:{self.port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        status = await reader.readuntil(b'\r\n\r\n')
+        if b' 101 ' not in status.split(b'\r\n', 1)[0]:
+            raise ConnectionError(status.split(b'\r\n', 1)[0].decode())
+        try:
+            while not stop.is_set():
+                message = await self._recv(reader)
+                if message is None:
+                    break
+                if message.startswith('0'):
+                    self._send(writer, '40')
+                elif message.startswith('40'):
+                    self.connected = True
+                elif message == '2':
+                    self._send(writer, '3')
+                await writer.drain()
+        finally:
+            self.connected = False
+            writer.close()
+
+    @staticmethod
+    def _send(writer, text):
+        data = text.encode()
+        mask = os.urandom(4)
+        header = bytes([0x81, 0x80 | len(data)]) if len(data) < 126 else \
+            bytes([0x81, 0x80 | 126]) + struct.pack('!H', len(data))
+        writer.write(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(data)))
+
+    @staticmethod
+    async def _recv(reader):
+        try:
+            head = await reader.readexactly(2)
+        except asyncio.IncompleteReadError:
+            return None
+        length = head[1] & 0x7f
+        if length == 126:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await reader.readexactly(8))[0]
+        payload = await reader.readexactly(length)
+        if head[0] & 0x0f == 0x8:
+            return None
+        return payload.decode(errors='replace')
+
+async def hold_sockets(host, port, count, hold, ramp, server_pid=None):
+    stop = asyncio.Event()
+    clients = [IdleSocket(host, port) for _ in range(count)]
+    tasks = []
+    failures = 0
+    started = time.time()
+    for index, client in enumerate(clients):
+        tasks.append(asyncio.create_task(client.run(stop)))
+        if ramp and index % ramp == ramp - 1:
+            await asyncio.sleep(0.05)
+    # Wait until every socket either joined or failed
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        done = sum(1 for task in tasks if task.done())
+        if sum(c.connected for c in clients) + done >= count:
+            break
+        await asyncio.sleep(0.2)
+    connect_time = time.time() - started
+    peak = sum(c.connected for c in clients)
+    await asyncio.sleep(hold)
+    held = sum(c.connected for c in clients)
+    rss = rss_mb(server_pid) if server_pid else None
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = sum(1 for r in results if isinstance(r, Exception) and not isinstance(r, asyncio.CancelledError))
+    result = {'connected': peak, 'held': held, 'connect_seconds': round(connect_time, 2), 'errors': failures}
+    if rss is not None:
+        result['server_rss_mb'] = round(rss, 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sockets', type=int, default=10000)
+    parser.add_argument('--hold', type=float, default=30, help="seconds to keep the sockets open")
+    parser.add_argument('--ramp', type=int, default=500, help="connections opened per 50ms step")
+    parser.add_argument('--url', default=None, help="attach to a running server instead of starting serve.py")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.sockets + 100:
+        print(f"warning: open file limit {hard} is below {args.sockets} sockets", file=sys.stderr)
+
+    server = None
+    if args.url:
+        host, port = args.url.split('://', 1)[-1].rstrip('/').rsplit(':', 1)
+        port = int(port)
+    else:
+        host, port = '127.0.0.1', free_port()
+        workdir = tempfile.mkdtemp()
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{workdir}/idle.db",
+                   ROOM_REGISTRY_PATH=os.path.join(workdir, 'rooms.db'))
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'bootstrap'], cwd=ROOT, env=env,
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        server = subprocess.Popen([sys.executable, 'serve.py', '--host', host, '--port', str(port)],
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 20
+        while True:
+            try:
+                socket.create_connection((host, port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise SystemExit(f"server on {host}:{port} did not start")
+                time.sleep(0.1)
+
+        result = asyncio.run(hold_sockets(host, port, args.sockets, args.hold, args.ramp,
+                                          server.pid if server else None))
+        result['sockets'] = args.sockets
+        print(json.dumps(result, indent=2))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""Load-test the Socket.IO server with simulated players and report broadcast latency.
+
+Starts the app locally (serve.py on gevent, or main.py's threaded server),
+connects --clients python-socketio clients, groups them into rooms of
+--room-size, and has every client send game_action at --rate per second and
+a chat message every --chat-interval seconds. Latency is measured from the
+sender's timestamp to each receiver getting the broadcast (game_action, or
+game_frame for ticked game types, and chat_message). Writes a JSON report
+with p50/p95/p99 latency, messages per second, and server CPU and RSS.
+
+All clients run in this one process, so beyond a few hundred of them
+client-side CPU shows up in the latency; compare runs of the same size
+across releases.
+
+Needs the python-socketio client extras: pip install requests websocket-client
+
+Usage: python benchmarks/load_test.py [--clients 200] [--room-size 4] [--rate 10] [--duration 30]
+                                      [--server gevent|threading] [--packer json|msgpack] [--output report.json]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from packing import BinaryPacket
+
+THREADED_SERVER = """
+import logging, sys
+import main
+logging.getLogger().setLevel(logging.WARNING)
+main.socketio.run(main.app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)
+"""
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+class ProcessSampler:
+    """Samples CPU time and RSS of a process from /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        self.peak_rss = 0
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_mb(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) / 1024
+                    self.peak_rss = max(self.peak_rss, rss)
+                    return rss
+        return None
+
+class Recorder:
+    def __init__(self):
+        self.recording = False
+        self.latencies = {'game_action': [], 'chat_message': []}
+        self.received = 0
+        self.sent = 0
+        self.errors = []
+
+    def record(self, kind, sent_at):
+        if self.recording:
+            self.latencies[kind].append(time.time() - sent_at)
+            self.received += 1
+
+class SimClient:
+    def __init__(self, url, recorder, packer):
+        self.recorder = recorder
+        self.client = socketio.Client(serializer=BinaryPacket if packer == 'msgpack' else 'default',
+                                      reconnection=False)
+        self.room_id = None
+        self.player_id = None
+        self.ready = threading.Event()
+        self.client.on('connected', self._on_connected)
+        self.client.on('room_created', self._on_room)
+        self.client.on('room_joined', self._on_room)
+        self.client.on('game_action', self._on_action)
+        self.client.on('game_frame', self._on_frame)
+        self.client.on('chat_message', self._on_chat)
+        self.client.on('error', lambda data: recorder.errors.append(data))
+        self.client.connect(url, transports=['websocket'], auth={'packer': packer})
+
+    def _on_connected(self, data):
+        self.player_id = data['player_id']
+
+    def _on_room(self, data):
+        self.room_id = data['room_id']
+        self.ready.set()
+
+    def _on_action(self, payload):
+        sent_at = (payload.get('data') or {}).get('sent_at')
+        if sent_at:
+            self.recorder.record('game_action', sent_at)
+
+    def _on_frame(self, frame):
+        # Frames go to the whole room, including the sender's own actions
+        for payload in frame['actions']:
+            if payload['player_id'] != self.player_id:
+                self._on_action(payload)
+
+    def _on_chat(self, message):
+        text = message.get('message', '')
+        if text.startswith('t='):
+            self.recorder.record('chat_message', float(text[2:]))
+
+    def send_action(self, sequence):
+        self.client.emit('game_action', {'room_id': self.room_id, 'action': 'move',
+                                         'data': {'x': sequence % 800, 'y': sequence % 600, 'sent_at': time.time()}})
+        self.recorder.sent += 1
+
+    def send_chat(self):
+        self.client.emit('chat_message', {'room_id': self.room_id, 'message': f"t={time.time()}"})
+        self.recorder.sent += 1
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    def at(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+    return {'count': len(values), 'p50_ms': at(0.5), 'p95_ms': at(0.95), 'p99_ms': at(0.99),
+            'max_ms': round(values[-1] * 1000, 2)}
+
+def start_server(kind, port, env):
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'bootstrap'], cwd=ROOT, env=env,
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if kind == 'gevent':
+        command = [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port)]
+    else:
+        command = [sys.executable, '-c', THREADED_SERVER, str(port)]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--room-size', type=int, default=4)
+    parser.add_argument('--game-type', default='fpsgame')
+    parser.add_argument('--rate', type=float, default=10, help="game actions per client per second")
+    parser.add_argument('--chat-interval', type=float, default=5, help="seconds between chat messages per client")
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--server', default='gevent', choices=['gevent', 'threading'])
+    parser.add_argument('--packer', default='json', choices=['json', 'msgpack'])
+    parser.add_argument('--tick-rate', type=float, default=None, help="set GAME_TICK_RATES for --game-type")
+    parser.add_argument('--output', default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    port = free_port()
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{workdir}/load.db")
+    if args.tick_rate:
+        env['GAME_TICK_RATES'] = json.dumps({args.game_type: args.tick_rate})
+    server = start_server(args.server, port, env)
+    sampler = ProcessSampler(server.pid)
+    recorder = Recorder()
+    clients = []
+    try:
+        wait_for_port(port)
+        url = f"http://127.0.0.1:{port}"
+        for _ in range(args.clients):
+            clients.append(SimClient(url, recorder, args.packer))
+
+        for start in range(0, len(clients), args.room_size):
+            host, *guests = clients[start:start + args.room_size]
+            host.client.emit('create_room', {'game_type': args.game_type, 'max_players': args.room_size})
+            if not host.ready.wait(10):
+                raise SystemExit("FAIL: room was not created")
+            for guest in guests:
+                guest.client.emit('join_room', {'room_id': host.room_id})
+            for guest in guests:
+                if not guest.ready.wait(10):
+                    raise SystemExit(f"FAIL: client could not join room ({recorder.errors[-1:]})")
+
+        # One driver thread spreads every client's sends evenly over each period
+        interval = 1.0 / args.rate
+        started = time.time()
+        measure_from = started + args.warmup
+        ends = measure_from + args.duration
+        cpu_start = None
+        sequence = 0
+        next_chat = {id(client): started + (i % 10) / 10 * args.chat_interval for i, client in enumerate(clients)}
+        while time.time() < ends:
+            period_start = time.time()
+            if cpu_start is None and period_start >= measure_from:
+                recorder.recording = True
+                recorder.sent = 0
+                cpu_start = sampler.cpu_seconds()
+            for client in clients:
+                sequence += 1
+                client.send_action(sequence)
+                if period_start >= next_chat[id(client)]:
+                    client.send_chat()
+                    next_chat[id(client)] = period_start + args.chat_interval
+            sampler.rss_mb()
+            time.sleep(max(0.0, interval - (time.time() - period_start)))
+        time.sleep(0.5)  # let in-flight broadcasts arrive
+        recorder.recording = False
+        elapsed = time.time() - measure_from
+        cpu_seconds = sampler.cpu_seconds() - (cpu_start or 0)
+
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'python': platform.python_version(),
+            'latency': {kind: percentiles(values) for kind, values in recorder.latencies.items()},
+            'messages_sent_per_second': round(recorder.sent / elapsed, 1),
+            'messages_received_per_second': round(recorder.received / elapsed, 1),
+            'server_cpu_percent': round(cpu_seconds / elapsed * 100, 1),
+            'server_rss_mb': round(sampler.rss_mb(), 1),
+            'server_peak_rss_mb': round(sampler.peak_rss, 1),
+            'errors': len(recorder.errors),
+        }
+    finally:
+        # Each disconnect waits for its websocket to close, so do them all at once
+        closers = [threading.Thread(target=client.client.disconnect) for client in clients]
+        for closer in closers:
+            closer.start()
+        for closer in closers:
+            closer.join()
+        server.terminate()
+        server.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.output}")
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
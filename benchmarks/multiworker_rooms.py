@@ -0,0 +1,125 @@
+"""Boot several Socket.IO workers locally and check rooms work whichever worker a client lands on.
+
+One client creates a room on the first worker and a client on every other
+worker joins it. With --message-queue (e.g. redis://localhost:6379/0) it also
+checks that a chat message sent on one worker reaches clients on all others.
+
+Needs the python-socketio client extras: pip install requests websocket-client
+
+Usage: python benchmarks/multiworker_rooms.py [--workers 3] [--registry sqlite] [--message-queue URL]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = """
+import logging, sys
+import main
+logging.getLogger().setLevel(logging.WARNING)
+main.socketio.run(main.app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)
+"""
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Worker on port {port} did not start")
+
+class Player:
+    def __init__(self, port):
+        self.client = socketio.Client()
+        self.events = {}
+        self.received = threading.Event()
+        for name in ('room_created', 'room_joined', 'chat_message', 'error'):
+            self.client.on(name, self._handler(name))
+        self.client.connect(f"http://127.0.0.1:{port}", transports=['websocket'])
+
+    def _handler(self, name):
+        def handler(data):
+            self.events.setdefault(name, []).append(data)
+            self.received.set()
+        return handler
+
+    def wait_for(self, name, timeout=5):
+        deadline = time.time() + timeout
+        while name not in self.events and time.time() < deadline:
+            self.received.wait(0.1)
+            self.received.clear()
+        return self.events.get(name)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--registry', default='sqlite', choices=['memory', 'sqlite'])
+    parser.add_argument('--message-queue', default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{workdir}/multiworker.db",
+               ROOM_REGISTRY=args.registry,
+               ROOM_REGISTRY_PATH=os.path.join(workdir, 'rooms.db'))
+    if args.message_queue:
+        env['SOCKETIO_MESSAGE_QUEUE'] = args.message_queue
+
+    ports = [free_port() for _ in range(args.workers)]
+    workers = [subprocess.Popen([sys.executable, '-c', WORKER, str(port)], cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+               for port in ports]
+    failures = []
+    try:
+        for port in ports:
+            wait_for_port(port)
+
+        players = [Player(port) for port in ports]
+        host = players[0]
+        host.client.emit('create_room', {'game_type': 'fpsgame', 'max_players': args.workers})
+        created = host.wait_for('room_created')
+        if not created:
+            raise SystemExit("FAIL: room was not created")
+        room_id = created[0]['room_id']
+
+        for index, player in enumerate(players[1:], start=1):
+            player.client.emit('join_room', {'room_id': room_id})
+            if not player.wait_for('room_joined'):
+                failures.append(f"client on worker {index} could not join ({player.events.get('error')})")
+
+        if args.message_queue and not failures:
+            host.client.emit('chat_message', {'room_id': room_id, 'message': 'hello'})
+            for index, player in enumerate(players[1:], start=1):
+                if not player.wait_for('chat_message'):
+                    failures.append(f"client on worker {index} missed the room broadcast")
+
+        for player in players:
+            player.client.disconnect()
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    checked = "membership and broadcasts" if args.message_queue else "membership"
+    print(f"OK: {args.workers} workers, registry={args.registry}, {checked} consistent")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import logging
+from app import db
+from models import Game, GameCategory, GameStats, UserGame, UserGameStats, UserGamePlayRollup, UserGameTrend
+from schema import upgrade_schema
+from cache import response_cache
+from gamecode import migrate_inline_code
+from plays import backfill_play_rollups
+from trending import rebuild_trending
+from stats import reconcile_stats
+
+# Built-in games, keyed by game_type
+GAME_DEFINITIONS = {
+    "snake": {
+        "title": "Snake",
+        "description": "Classic Snake game. Eat food to grow longer, but don't hit the walls or yourself!",
+        "instructions": "Use arrow keys to control the snake. Eat the red food to grow. Avoid hitting walls and yourself.",
+    },
+    "pong": {
+        "title": "Pong",
+        "description": "The original arcade game. Play against the computer in this classic table tennis game.",
+        "instructions": "Use up and down arrow keys to move your paddle. Hit the ball past the computer's paddle to score.",
+    },
+    "platformer": {
+        "title": "Platformer",
+        "description": "Jump and run through a 2D platformer world, collecting coins and avoiding obstacles.",
+        "instructions": "Use arrow keys to move, spacebar to jump. Collect coins and reach the flag to win the level.",
+    },
+    "tetris": {
+        "title": "Tetris",
+        "description": "The famous puzzle game. Arrange falling tetrominoes to create complete lines and score points.",
+        "instructions": "Use arrow keys to move and rotate pieces. Left/right to move, up to rotate, down to soft drop, spacebar for hard drop.",
+    },
+    "flappybird": {
+        "title": "Flappy Bird",
+        "description": "Navigate a bird through a series of pipes without hitting them. Simple but challenging!",
+        "instructions": "Press spacebar or click/tap the screen to make the bird flap its wings and fly upward. Avoid hitting pipes and the ground.",
+    },
+    "fpsgame": {
+        "title": "2D Shooter Arena",
+        "description": "Multiplayer online FPS shooting game. Compete against other players in a 2D arena.",
+        "instructions": "Use WASD to move, mouse to aim and shoot. Collect power-ups and defeat other players to score points.",
+    }
+}
+
+CATEGORY_DEFINITIONS = [
+    {'name': 'Arcade', 'description': 'Classic arcade-style games'},
+    {'name': 'Puzzle', 'description': 'Brain teasers and puzzle games'},
+    {'name': 'Action', 'description': 'Fast-paced action games'},
+    {'name': 'Adventure', 'description': 'Exploration and adventure games'},
+    {'name': 'Strategy', 'description': 'Strategic thinking games'}
+]
+
+def initialize_games():
+    # One query for the existing types instead of one per game
+    existing_types = {game_type for (game_type,) in db.session.query(Game.game_type)}
+    added = 0
+    
+    for game_type, game_info in GAME_DEFINITIONS.items():
+        if game_type not in existing_types:
+            new_game = Game(
+                title=game_info["title"],
+                description=game_info["description"],
+                instructions=game_info["instructions"],
+                game_type=game_type,
+                stats=GameStats()
+            )
+            db.session.add(new_game)
+            added += 1
+            logging.debug(f"Added new game: {game_info['title']} ({game_type})")
+    
+    if added:
+        db.session.commit()
+        response_cache.invalidate('games')
+    return added
+
+def initialize_categories():
+    existing_names = {name for (name,) in db.session.query(GameCategory.name)}
+    added = 0
+    
+    for category_info in CATEGORY_DEFINITIONS:
+        if category_info['name'] not in existing_names:
+            new_category = GameCategory(
+                name=category_info['name'],
+                description=category_info['description']
+            )
+            db.session.add(new_category)
+            added += 1
+            logging.debug(f"Added new category: {category_info['name']}")
+    
+    if added:
+        db.session.commit()
+    return added
+
+def bootstrap():
+    """Bring a database up to date: schema, indexes and seed data.
+
+    Idempotent, so it can run before every deploy. Run it once per release
+    rather than from each worker, which keeps worker imports free of DB work.
+    """
+    indexes = upgrade_schema()
+    games = initialize_games()
+    categories = initialize_categories()
+    code = migrate_inline_code()
+    # Databases from before the stats tables have games without a counters row;
+    # later games get theirs when they are created
+    missing = (db.session.query(Game.id).outerjoin(GameStats, GameStats.game_id == Game.id)
+               .filter(GameStats.game_id.is_(None)).first() or
+               db.session.query(UserGame.id).outerjoin(UserGameStats, UserGameStats.game_id == UserGame.id)
+               .filter(UserGameStats.game_id.is_(None)).first())
+    stats = reconcile_stats() if missing else 0
+    # Plays from before rollups existed; afterwards PlayTracker maintains them
+    rollups = backfill_play_rollups() if UserGamePlayRollup.query.first() is None else 0
+    # Games with activity from before trending scores were kept
+    trends = rebuild_trending() if UserGameTrend.query.first() is None else 0
+    return {'indexes': indexes, 'games': games, 'categories': categories, 'code': code, 'stats': stats,
+            'rollups': rollups, 'trends': trends}
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+
+class MemoryBackend:
+    """Bounded LRU cache local to one process."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return [self._tags.get(tag, 0) for tag in tags]
+
+    def bump_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+class SqliteBackend:
+    """Cache in a local SQLite file so every gunicorn worker on the host shares it."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_entry "
+                               "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_expires ON cache_entry (expires)")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_tag (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads (or forked workers)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM cache_entry WHERE key = ? AND expires >= ?", (key, time.time())).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)",
+                           (key, pickle.dumps(value), time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            connection.execute("DELETE FROM cache_entry WHERE expires < ?", (time.time(),))
+            connection.execute("DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry "
+                               "ORDER BY expires DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def tag_versions(self, tags):
+        placeholders = ', '.join('?' for _ in tags)
+        rows = dict(self._connection().execute(
+            f"SELECT tag, version FROM cache_tag WHERE tag IN ({placeholders})", list(tags)).fetchall())
+        return [rows.get(tag, 0) for tag in tags]
+
+    def bump_tags(self, tags):
+        connection = self._connection()
+        for tag in tags:
+            connection.execute("INSERT INTO cache_tag (tag, version) VALUES (?, 1) "
+                               "ON CONFLICT(tag) DO UPDATE SET version = version + 1", (tag,))
+
+class ResponseCache:
+    """Page and fragment cache with tag-based invalidation.
+
+    Every entry is stored under a key that includes the current version of
+    each of its tags, so ``invalidate('scores')`` makes all entries tagged
+    ``scores`` unreachable at once without having to find and delete them.
+    """
+
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.enabled = True
+        self.default_ttl = 300
+        self._hits = 0
+        self._misses = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CACHE_ENABLED', self.enabled)
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', self.default_ttl)
+        max_entries = app.config.get('CACHE_MAX_ENTRIES')
+        if app.config.get('CACHE_BACKEND', 'memory') == 'sqlite':
+            path = app.config.get('CACHE_PATH') or os.path.join(app.instance_path, 'response_cache.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SqliteBackend(path, max_entries or 10000)
+        else:
+            self.backend = MemoryBackend(max_entries or 1000)
+
+    def _key(self, name, tags):
+        versions = self.backend.tag_versions(tags)
+        return name + '#' + ','.join(f"{tag}:{version}" for tag, version in zip(tags, versions))
+
+    def invalidate(self, *tags):
+        try:
+            self.backend.bump_tags(tags)
+        except Exception as e:
+            logging.error(f"Error invalidating cache tags {tags}: {str(e)}")
+
+    def fragment(self, name, tags, build, ttl=None):
+        """Return the cached value for ``name``, building and storing it on a miss."""
+        if not self.enabled:
+            return build()
+        key = self._key('fragment:' + name, tags)
+        value = self.backend.get(key)
+        if value is None:
+            value = build()
+            self.backend.set(key, value, ttl or self.default_ttl)
+        return value
+
+    def page(self, *tags, ttl=None):
+        """Cache a view's response for anonymous GET requests and answer conditional GETs."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Logged-in users and pending flash messages get personalised HTML
+                if (not self.enabled or request.method != 'GET'
+                        or current_user.is_authenticated or session.get('_flashes')):
+                    return view(*args, **kwargs)
+
+                key = self._key('page:' + request.full_path, tags)
+                entry = self.backend.get(key)
+                if entry is None:
+                    self._misses += 1
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.sha1(body).hexdigest(),
+                        'last_modified': int(time.time()),
+                    }
+                    self.backend.set(key, entry, ttl or self.default_ttl)
+                else:
+                    self._hits += 1
+
+                response = make_response(entry['body'])
+                response.mimetype = entry['mimetype']
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['last_modified']
+                response.cache_control.public = True
+                response.cache_control.no_cache = True
+                response.vary.add('Cookie')
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self._hits,
+            'misses': self._misses,
+        }
+
+response_cache = ResponseCache()
@@ -0,0 +1,144 @@
+import glob
+import json
+import logging
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+@dataclass(slots=True)
+class RoomLog:
+    entries: deque = field(default_factory=deque)  # (seq, message, encoded line), oldest first
+    bytes: int = 0
+    last_seq: int = 0
+
+class ChatHistory:
+    """Recent chat messages per room, bounded by count and bytes.
+
+    Every message gets a per-room ``seq`` so clients can page back with
+    ``page(room_id, before)``. When ``spill_dir`` is set, messages pushed
+    out of the ring are appended to a JSON-lines file per room and pages
+    older than the ring are read back from its tail; without it they're
+    dropped. History and seqs are per process, so each worker sharing a
+    room registry spills to its own file, named by room and pid. Memory per room stays within ``max_bytes`` however long the
+    room lives, and everything is dropped by ``forget`` once it empties.
+    """
+
+    READ_CHUNK = 8192
+
+    def __init__(self, size=50, max_bytes=16384, spill_dir=None):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._rooms = {}  # room_id -> RoomLog
+        self._lock = threading.Lock()
+        self._spilled = 0
+        self._dropped = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, room_id, pid=None):
+        # Room ids come from clients, so keep them out of the path
+        return os.path.join(self.spill_dir, f"{room_id.encode().hex()}.{pid or os.getpid()}.jsonl")
+
+    def _spill_paths(self, room_id):
+        # Every worker's spill file for the room
+        return glob.glob(os.path.join(glob.escape(self.spill_dir), f"{room_id.encode().hex()}.*.jsonl"))
+
+    def append(self, room_id, message):
+        """Store a message dict and return it with its ``seq`` set."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                room = self._rooms[room_id] = RoomLog()
+            room.last_seq += 1
+            message = dict(message, seq=room.last_seq)
+            line = json.dumps(message, separators=(',', ':')) + '\n'
+            room.entries.append((room.last_seq, message, line))
+            room.bytes += len(line)
+            evicted = []
+            while len(room.entries) > self.size or (room.bytes > self.max_bytes and len(room.entries) > 1):
+                _, _, old_line = room.entries.popleft()
+                room.bytes -= len(old_line)
+                evicted.append(old_line)
+            if evicted:
+                if self.spill_dir:
+                    with open(self._spill_path(room_id), 'a') as f:
+                        f.write(''.join(evicted))
+                    self._spilled += len(evicted)
+                else:
+                    self._dropped += len(evicted)
+        return message
+
+    def recent(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            return []
+        with self._lock:
+            return [message for _, message, _ in room.entries]
+
+    def page(self, room_id, before=None, limit=20):
+        """Up to ``limit`` messages with seq below ``before``, oldest first, and whether older ones exist."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return [], False
+            if before is None:
+                before = room.last_seq + 1
+            messages = [message for seq, message, _ in room.entries if seq < before][-limit:]
+            oldest_in_ring = room.entries[0][0] if room.entries else room.last_seq + 1
+        if len(messages) < limit and before > 1 and self.spill_dir:
+            start = min(before, oldest_in_ring)
+            messages = self._read_spilled(room_id, start, limit - len(messages)) + messages
+        has_more = bool(messages) and messages[0]['seq'] > 1 and (
+            self.spill_dir is not None or messages[0]['seq'] > oldest_in_ring)
+        return messages, has_more
+
+    def _read_spilled(self, room_id, before, limit):
+        # Spilled seqs are contiguous and ascending, so read lines back from the end
+        try:
+            f = open(self._spill_path(room_id), 'rb')
+        except FileNotFoundError:
+            return []
+        found = []
+        with f:
+            position = f.seek(0, os.SEEK_END)
+            tail = b''
+            while position > 0 and len(found) < limit:
+                step = min(self.READ_CHUNK, position)
+                position -= step
+                f.seek(position)
+                lines = (f.read(step) + tail).split(b'\n')
+                tail = lines.pop(0) if position > 0 else b''
+                for line in reversed(lines):
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if message['seq'] < before:
+                        found.append(message)
+                        if len(found) == limit:
+                            break
+        found.reverse()
+        return found
+
+    def forget(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+        if self.spill_dir:
+            # The room is gone for every worker, so their spill files go too
+            for path in self._spill_paths(room_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.error(f"Error removing chat spill file for room {room_id}: {str(e)}")
+
+    def stats(self):
+        return {
+            'rooms': len(self._rooms),
+            'messages_held': sum(len(room.entries) for room in list(self._rooms.values())),
+            'bytes_held': sum(room.bytes for room in list(self._rooms.values())),
+            'spilled': self._spilled,
+            'dropped': self._dropped,
+        }
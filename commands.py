@@ -0,0 +1,84 @@
+import sys
+import click
+from schema import upgrade_schema, check_query_plans
+from stats import reconcile_stats
+from bootstrap import bootstrap
+from synthetic import DEFAULT_COUNTS, load_synthetic
+from thumbnails import thumbnails
+from plays import play_tracker
+from trending import rebuild_trending
+
+def register_commands(app):
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Create or upgrade the schema and seed built-in games and categories."""
+        result = bootstrap()
+        click.echo(f"Bootstrap complete: {result['indexes']} indexes, {result['games']} games, "
+                   f"{result['categories']} categories added, code of {result['code']} user games moved, "
+                   f"{result['stats']} stats rows reconciled, "
+                   f"{result['rollups']} play rollups backfilled, trending scores of {result['trends']} games rebuilt")
+
+    @app.cli.command('reconcile-stats')
+    def reconcile_stats_command():
+        """Backfill or repair the denormalized game stats counters."""
+        fixed = reconcile_stats()
+        click.echo(f"Reconciled game stats ({fixed} rows written)")
+
+    @app.cli.command('upgrade-schema')
+    def upgrade_schema_command():
+        """Create missing tables and indexes on an existing database."""
+        created = upgrade_schema()
+        click.echo(f"Schema up to date ({created} indexes created)")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Fail if any route query falls back to a full table scan."""
+        failures = check_query_plans()
+        for name, scans in failures.items():
+            click.echo(f"FULL SCAN in {name}: {'; '.join(scans)}")
+        if failures:
+            sys.exit(1)
+        click.echo("All route queries use an index")
+
+    @app.cli.command('load-synthetic')
+    @click.option('--users', type=int, default=DEFAULT_COUNTS['users'])
+    @click.option('--scores', type=int, default=DEFAULT_COUNTS['scores'])
+    @click.option('--ratings', type=int, default=DEFAULT_COUNTS['ratings'])
+    @click.option('--comments', type=int, default=DEFAULT_COUNTS['comments'])
+    @click.option('--user-games', type=int, default=DEFAULT_COUNTS['user_games'])
+    @click.option('--plays', type=int, default=DEFAULT_COUNTS['plays'])
+    @click.option('--seed', type=int, default=1, help="Same seed and counts give the same rows.")
+    @click.option('--batch-size', type=int, default=10000)
+    @click.option('--password', default='password', help="Password for every generated user.")
+    def load_synthetic_command(users, scores, ratings, comments, user_games, plays, seed, batch_size, password):
+        """Bulk load deterministic synthetic users, scores, ratings, comments, user games and plays."""
+        counts = {'users': users, 'scores': scores, 'ratings': ratings, 'comments': comments,
+                  'user_games': user_games, 'plays': plays}
+        def progress(name, rows, elapsed):
+            click.echo(f"Loaded {rows:,} {name} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        try:
+            load_synthetic(counts, seed=seed, batch_size=batch_size, password=password, progress=progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo("Synthetic load complete, game stats reconciled")
+
+    @app.cli.command('gc-thumbnails')
+    @click.option('--grace', type=float, default=None,
+                  help="Keep images touched within this many seconds (default THUMBNAIL_GC_GRACE).")
+    def gc_thumbnails_command(grace):
+        """Delete uploaded thumbnails that no game refers to anymore."""
+        removed = thumbnails.collect_garbage(grace)
+        click.echo(f"Removed {removed} unreferenced thumbnails")
+
+    @app.cli.command('prune-plays')
+    def prune_plays_command():
+        """Delete raw plays and hourly play rollups past their retention."""
+        deleted = play_tracker.prune()
+        click.echo(f"Pruned {deleted} rows (raw plays kept {play_tracker.retention_days} days, "
+                   f"hourly rollups {play_tracker.hourly_retention_days} days)")
+
+    @app.cli.command('rebuild-trending')
+    def rebuild_trending_command():
+        """Recompute trending scores of every user game from plays, ratings and comments."""
+        rebuilt = rebuild_trending()
+        click.echo(f"Rebuilt trending scores of {rebuilt} user games")
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+from flask import request, send_file, url_for
+from sqlalchemy import select, update
+from app import db
+from models import GameCode, UserGame
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Precompressed variants by Content-Encoding, preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+class CodeArtifacts:
+    """User game code published as immutable JavaScript files named by content hash.
+
+    Each distinct code is written once as ``<hash>.js`` with ``.gz`` and
+    (with brotli installed) ``.br`` siblings compressed at the highest level,
+    so serving never compresses on the fly. Because a URL's content can never
+    change, responses carry a one-year immutable Cache-Control and the hash
+    as ETag. Files missing on this host are rebuilt from GameCode on first
+    request.
+    """
+
+    def __init__(self):
+        self.root = None
+        self._published = 0
+        self._rebuilt = 0
+        self._served = {}
+
+    def init_app(self, app):
+        self.root = app.config.get('GAME_CODE_DIR') or os.path.join(app.static_folder, 'uploads', 'code')
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, digest, suffix=''):
+        return os.path.join(self.root, digest[:2], f"{digest}.js{suffix}")
+
+    def _write(self, path, data):
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.partial')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+
+    def publish(self, digest, code):
+        """Write the artifact and its compressed variants unless they already exist."""
+        if os.path.exists(self._path(digest)):
+            return False
+        os.makedirs(os.path.dirname(self._path(digest)), exist_ok=True)
+        data = code.encode('utf-8')
+        self._write(self._path(digest, '.gz'), gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            self._write(self._path(digest, '.br'), brotli.compress(data, mode=brotli.MODE_TEXT))
+        # The plain file goes last, so its presence means every variant is in place
+        self._write(self._path(digest), data)
+        self._published += 1
+        return True
+
+    def send(self, digest):
+        """Response for ``/user-game-code/<digest>.js``, or None if there's no such code."""
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            return None
+        if not os.path.exists(self._path(digest)):
+            blob = db.session.get(GameCode, digest)
+            if blob is None:
+                return None
+            self.publish(digest, blob.code)
+            self._rebuilt += 1
+        encoding, suffix = next(((encoding, suffix) for encoding, suffix in ENCODINGS
+                                 if encoding in request.accept_encodings and os.path.exists(self._path(digest, suffix))),
+                                (None, ''))
+        response = send_file(self._path(digest, suffix), mimetype='text/javascript', max_age=31536000,
+                             etag=f"{digest}-{encoding}" if encoding else digest, conditional=True)
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        self._served[encoding or 'identity'] = self._served.get(encoding or 'identity', 0) + 1
+        return response
+
+    def stats(self):
+        return {
+            'brotli': brotli is not None,
+            'published': self._published,
+            'rebuilt': self._rebuilt,
+            'served': dict(self._served),
+        }
+
+def game_code_url(game):
+    """Fingerprinted URL of a user game's code, or None if it has none yet."""
+    if not game.code_hash:
+        return None
+    return url_for('user_game_code', digest=game.code_hash)
+
+def migrate_inline_code(batch_size=200):
+    """Move code still stored inline on user_game rows into GameCode. Returns the number of games moved."""
+    moved = 0
+    while True:
+        rows = db.session.execute(select(UserGame.id, UserGame.inline_code)
+                                  .where(UserGame.code_hash.is_(None)).limit(batch_size)).all()
+        if not rows:
+            break
+        added = set()
+        for game_id, code in rows:
+            code = code or ''
+            digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+            if digest not in added and db.session.get(GameCode, digest) is None:
+                db.session.add(GameCode(hash=digest, code=code, size=len(code.encode('utf-8'))))
+                added.add(digest)
+            db.session.execute(update(UserGame).where(UserGame.id == game_id)
+                               .values({UserGame.code_hash: digest, UserGame.inline_code: ''}))
+        db.session.commit()
+        moved += len(rows)
+    if moved:
+        logging.debug(f"Moved inline code of {moved} user games to game_code")
+    return moved
+
+code_artifacts = CodeArtifacts()
@@ -0,0 +1,7 @@
+# Gunicorn picks this file up automatically from the working directory
+
+def worker_exit(server, worker):
+    # Write out any scores still buffered before the worker goes away
+    from ingest import score_buffer
+    flushed = score_buffer.flush()
+    server.log.info(f"Worker {worker.pid} flushed {flushed} buffered scores on exit")
@@ -0,0 +1,185 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from app import db
+from models import Score
+from stats import bump_game_stats
+from leaderboard import leaderboards
+from cache import response_cache
+
+class ScoreBuffer:
+    """Write-behind buffer that turns many score submissions into bulk inserts.
+
+    Scores are queued in process and written by a background thread once
+    ``batch_size`` are waiting or ``flush_interval`` seconds have passed,
+    whichever comes first. The queue is bounded; when it is full ``submit``
+    returns False and the caller should write the score itself.
+
+    A batch that fails to write is retried one score at a time, so a bad row
+    is dropped and logged on its own. If the database itself is failing, the
+    unwritten scores are kept, up to ``max_size``, for the next flush.
+    """
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = True
+        self.app = None
+        self._queue = queue.Queue(max_size)
+        self._retry = deque()  # scores from a failed flush, written before the queue
+        self._retry_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._flushed = 0
+        self._flushes = 0
+        self._rejected = 0
+        self._dropped = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SCORE_BUFFER_ENABLED', self.enabled)
+        self.batch_size = app.config.get('SCORE_BUFFER_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('SCORE_BUFFER_FLUSH_INTERVAL', self.flush_interval)
+        max_size = app.config.get('SCORE_BUFFER_MAX_SIZE', self.max_size)
+        if max_size != self.max_size:
+            self.max_size = max_size
+            self._queue = queue.Queue(max_size)
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        # Start lazily, and again after a fork, so each gunicorn worker has its own flusher
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='score-flusher', daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id, username, game_id, score, date=None):
+        if not self.enabled:
+            return False
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((user_id, username, game_id, score, date or datetime.utcnow()))
+        except queue.Full:
+            self._rejected += 1
+            return False
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing score buffer: {str(e)}")
+
+    def _drain(self):
+        with self._retry_lock:
+            batch = [self._retry.popleft() for _ in range(min(self.batch_size, len(self._retry)))]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Write everything currently queued. Safe to call from any thread."""
+        if self.app is None:
+            return 0
+        with self._flush_lock, self.app.app_context():
+            written = 0
+            while True:
+                batch = self._drain()
+                if not batch:
+                    return written
+                try:
+                    self._write(batch)
+                    written += len(batch)
+                except Exception as e:
+                    logging.error(f"Error writing {len(batch)} scores, retrying one at a time: {str(e)}")
+                    written += self._write_each(batch)
+
+    def _write_each(self, batch):
+        written = 0
+        for index, item in enumerate(batch):
+            try:
+                self._write([item])
+                written += 1
+            except (IntegrityError, DataError) as e:
+                # This row can never be written, e.g. its game or user is gone
+                self._dropped += 1
+                logging.error(f"Dropped score {item[3]} of user {item[0]} for game {item[2]}: {str(e)}")
+            except Exception:
+                # Not the row's fault; keep the rest for the next flush
+                self._requeue(batch[index:])
+                raise
+        return written
+
+    def _requeue(self, items):
+        with self._retry_lock:
+            room = max(self.max_size - len(self._retry), 0)
+            self._retry.extend(items[:room])
+        if len(items) > room:
+            self._dropped += len(items) - room
+            logging.error(f"Dropped {len(items) - room} scores, retry backlog is full")
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        rows = [{'user_id': user_id, 'game_id': game_id, 'score': score, 'date': date}
+                for user_id, _, game_id, score, date in batch]
+        try:
+            inserted = db.session.execute(
+                insert(Score).returning(Score.id, Score.user_id, Score.game_id, Score.score, Score.date), rows).all()
+            for game_id, count in Counter(row['game_id'] for row in rows).items():
+                bump_game_stats(game_id, score_count=count)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        usernames = {user_id: username for user_id, username, _, _, _ in batch}
+        for score_id, user_id, game_id, score, date in inserted:
+            leaderboards.record_row(score_id, user_id, usernames[user_id], game_id, score, date)
+        response_cache.invalidate('scores')
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._flushes += 1
+        self._flushed += len(batch)
+        self._last_flush_ms = elapsed_ms
+        self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+        logging.debug(f"Flushed {len(batch)} scores in {elapsed_ms:.1f}ms, {self._queue.qsize()} still queued")
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'queue_depth': self._queue.qsize(),
+            'retry_depth': len(self._retry),
+            'max_size': self.max_size,
+            'flushes': self._flushes,
+            'flushed': self._flushed,
+            'rejected': self._rejected,
+            'dropped': self._dropped,
+            'last_flush_ms': round(self._last_flush_ms, 2),
+            'max_flush_ms': round(self._max_flush_ms, 2),
+        }
+
+score_buffer = ScoreBuffer()
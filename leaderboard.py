@@ -0,0 +1,345 @@
+import logging
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+from sqlalchemy import and_, distinct, exists, func, or_, select
+from sqlalchemy.orm import aliased
+from app import db
+from models import Game, User, Score
+
+LeaderboardEntry = namedtuple('LeaderboardEntry', ['rank', 'user_id', 'username', 'score', 'date'])
+
+class GameLeaderboard:
+    """Sorted index of the best ``capacity`` scores of a single game.
+
+    Keys are ``(-score, score_id)`` so the list is ordered best first and ties
+    go to the earlier score. In best-per-user mode only each user's personal
+    best is kept, so the board holds the best ``capacity`` players. New keys
+    only ever push the worst one out, so the board stays exactly the top of
+    the game without refilling; ``complete`` is False once anything has been
+    left out, and lookups past the end go to the database.
+    """
+
+    def __init__(self, capacity, best_per_user=False):
+        self.capacity = capacity
+        self.best_per_user = best_per_user
+        self.complete = True
+        self._keys = []
+        self._rows = {}  # score_id -> (user_id, date), for kept keys only
+        self._best = {}  # user_id -> best kept key for that user
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, score_id, user_id, score, date):
+        key = (-score, score_id)
+        with self._lock:
+            if score_id in self._rows:
+                return
+            best = self._best.get(user_id)
+            if self.best_per_user and best is not None:
+                if best <= key:
+                    return
+                self._remove(best)
+            elif len(self._keys) >= self.capacity and key > self._keys[-1]:
+                self.complete = False
+                return
+            self._rows[score_id] = (user_id, date)
+            insort(self._keys, key)
+            if best is None or key < best:
+                self._best[user_id] = key
+            if len(self._keys) > self.capacity:
+                self._evict()
+
+    def _remove(self, key):
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+        self._rows.pop(key[1], None)
+
+    def _evict(self):
+        # Anything else the user had is worse still, so it's already gone too
+        key = self._keys.pop()
+        user_id, _ = self._rows.pop(key[1])
+        if self._best.get(user_id) == key:
+            del self._best[user_id]
+        self.complete = False
+
+    def _entry(self, index, usernames):
+        key = self._keys[index]
+        user_id, date = self._rows[key[1]]
+        return LeaderboardEntry(index + 1, user_id, usernames.get(user_id), -key[0], date)
+
+    def top(self, n, usernames):
+        """The best ``n`` entries, or None if the board can't tell."""
+        with self._lock:
+            if n > len(self._keys) and not self.complete:
+                return None
+            return [self._entry(i, usernames) for i in range(min(n, len(self._keys)))]
+
+    def rank(self, user_id):
+        """1-based rank of the user's best score, 0 if they have no score, or None if the board can't tell."""
+        with self._lock:
+            best = self._best.get(user_id)
+            if best is None:
+                return None if not self.complete else 0
+            return bisect_left(self._keys, best) + 1
+
+    def around(self, user_id, radius, usernames):
+        """Entries within ``radius`` places of the user's best score, or None if the board can't tell."""
+        with self._lock:
+            best = self._best.get(user_id)
+            if best is None:
+                return None if not self.complete else []
+            index = bisect_left(self._keys, best)
+            end = index + radius + 1
+            if end > len(self._keys) and not self.complete:
+                return None
+            start = max(0, index - radius)
+            return [self._entry(i, usernames) for i in range(start, min(end, len(self._keys)))]
+
+class LeaderboardIndex:
+    """Per-game leaderboards kept in process memory.
+
+    Each worker warms every game's board from the database in a background
+    thread, so requests never wait for it; until a game is warm, and for
+    anything below the kept entries, reads are answered by indexed queries
+    instead. Scores written by this process are added directly; scores
+    written by other workers are picked up by pulling rows with a higher id
+    than the last one seen, at most once every ``sync_interval`` seconds.
+    """
+
+    def __init__(self, best_per_user=False, size=1000, sync_interval=5):
+        self.best_per_user = best_per_user
+        self.size = size
+        self.sync_interval = sync_interval
+        self.app = None
+        self._boards = {}
+        self._usernames = {}
+        self._last_score_id = 0
+        self._last_sync = 0
+        self._lock = threading.RLock()
+        self._start_lock = threading.Lock()
+        self._warm_queue = None
+        self._queued = set()
+        self._pid = None
+        self._db_reads = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.best_per_user = app.config.get('LEADERBOARD_BEST_PER_USER', self.best_per_user)
+        self.size = app.config.get('LEADERBOARD_SIZE', self.size)
+        self.sync_interval = app.config.get('LEADERBOARD_SYNC_INTERVAL', self.sync_interval)
+
+    def _ensure_warmer(self):
+        # Start lazily, and again after a fork, so each gunicorn worker warms its own boards
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._warm_queue = queue.Queue()
+            self._queued = set()
+            threading.Thread(target=self._run_warmer, name='leaderboard-warmer', daemon=True).start()
+            self._warm_queue.put(None)  # every game
+
+    def _run_warmer(self):
+        while True:
+            game_id = self._warm_queue.get()
+            try:
+                with self.app.app_context():
+                    if game_id is None:
+                        for (warm_id,) in db.session.query(Game.id).order_by(Game.id).all():
+                            self._warm(warm_id)
+                    else:
+                        self._warm(game_id)
+            except Exception as e:
+                logging.error(f"Error warming leaderboards: {str(e)}")
+            finally:
+                self._queued.discard(game_id)
+
+    def _warm(self, game_id):
+        if game_id in self._boards:
+            return
+        # Load and register under the lock, so no pulled score falls between the two
+        with self._lock:
+            self._pull()
+            self._boards[game_id] = self._load(game_id)
+
+    def _board(self, game_id):
+        self._ensure_warmer()
+        board = self._boards.get(game_id)
+        if board is None and game_id not in self._queued:
+            self._queued.add(game_id)
+            self._warm_queue.put(game_id)
+        return board
+
+    def _ranked_rows(self, game_id, max_score_id=None):
+        # Best first; in best-per-user mode only each user's first (best) row
+        statement = (select(Score.id, Score.user_id, Score.score, Score.date, User.username)
+                     .join(User, User.id == Score.user_id)
+                     .where(Score.game_id == game_id))
+        if max_score_id is not None:
+            statement = statement.where(Score.id <= max_score_id)
+        result = db.session.execute(statement.order_by(Score.score.desc(), Score.id).execution_options(yield_per=1000))
+        seen = set()
+        try:
+            for row in result:
+                if self.best_per_user:
+                    if row.user_id in seen:
+                        continue
+                    seen.add(row.user_id)
+                self._usernames[row.user_id] = row.username
+                yield row
+        finally:
+            # Callers stop reading early; don't leave the cursor open
+            result.close()
+
+    def _load(self, game_id):
+        # Load the top up to the current watermark; later rows arrive via _pull
+        started = time.perf_counter()
+        board = GameLeaderboard(self.size, self.best_per_user)
+        loaded = 0
+        rows = self._ranked_rows(game_id, self._last_score_id)
+        for row in rows:
+            if loaded == self.size:
+                board.complete = False
+                break
+            board.add(row.id, row.user_id, row.score, row.date)
+            loaded += 1
+        rows.close()
+        logging.debug(f"Leaderboard for game {game_id} warmed with {len(board)} entries "
+                      f"in {time.perf_counter() - started:.3f}s")
+        return board
+
+    def _pull(self):
+        self._last_sync = time.monotonic()
+        if not self._boards:
+            self._last_score_id = db.session.query(func.max(Score.id)).scalar() or 0
+            return
+        rows = (db.session.query(Score.id, Score.game_id, Score.user_id, Score.score, Score.date, User.username)
+                .join(User, User.id == Score.user_id)
+                .filter(Score.id > self._last_score_id)
+                .order_by(Score.id)
+                .all())
+        for score_id, game_id, user_id, score, date, username in rows:
+            self._usernames[user_id] = username
+            board = self._boards.get(game_id)
+            if board is not None:
+                board.add(score_id, user_id, score, date)
+            self._last_score_id = score_id
+
+    def _sync(self):
+        if time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        # Skip rather than wait while the warmer is loading a board
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._pull()
+        finally:
+            self._lock.release()
+
+    def record(self, score, username):
+        """Add a freshly committed Score row to the index."""
+        self.record_row(score.id, score.user_id, username, score.game_id, score.score, score.date)
+
+    def record_row(self, score_id, user_id, username, game_id, score, date):
+        self._usernames[user_id] = username
+        board = self._boards.get(game_id)
+        if board is not None:
+            board.add(score_id, user_id, score, date)
+
+    def _best_row(self, game_id, user_id):
+        return (db.session.query(Score.id, Score.score, Score.date)
+                .filter(Score.game_id == game_id, Score.user_id == user_id)
+                .order_by(Score.score.desc(), Score.id).first())
+
+    def _db_top(self, game_id, n):
+        entries = []
+        rows = self._ranked_rows(game_id)
+        for row in rows:
+            if len(entries) == n:
+                break
+            entries.append(LeaderboardEntry(len(entries) + 1, row.user_id, row.username, row.score, row.date))
+        rows.close()
+        return entries
+
+    def _db_rank(self, game_id, best):
+        better = or_(Score.score > best.score, and_(Score.score == best.score, Score.id < best.id))
+        counted = func.count(distinct(Score.user_id)) if self.best_per_user else func.count(Score.id)
+        return db.session.query(counted).filter(Score.game_id == game_id, better).scalar() + 1
+
+    def _db_around(self, game_id, user_id, best, radius):
+        rank = self._db_rank(game_id, best)
+        better = or_(Score.score > best.score, and_(Score.score == best.score, Score.id < best.id))
+        worse = or_(Score.score < best.score, and_(Score.score == best.score, Score.id > best.id))
+        rows = (db.session.query(Score.id, Score.user_id, Score.score, Score.date, User.username)
+                .join(User, User.id == Score.user_id)
+                .filter(Score.game_id == game_id))
+        if self.best_per_user:
+            # Only rows that are their user's best, ordered like the board's keys
+            other = aliased(Score)
+            rows = rows.filter(~exists().where(
+                other.game_id == game_id, other.user_id == Score.user_id,
+                or_(other.score > Score.score, and_(other.score == Score.score, other.id < Score.id))))
+        above = [tuple(row) for row in rows.filter(better).order_by(Score.score, Score.id.desc()).limit(radius)]
+        above.reverse()
+        below = [tuple(row) for row in rows.filter(worse).order_by(Score.score.desc(), Score.id).limit(radius)]
+        username = db.session.get(User, user_id).username
+        ordered = above + [(best.id, user_id, best.score, best.date, username)] + below
+        first = rank - len(above)
+        return [LeaderboardEntry(first + i, row[1], row[4], row[2], row[3]) for i, row in enumerate(ordered)]
+
+    def top(self, game_id, n=10):
+        self._sync()
+        board = self._board(game_id)
+        entries = board.top(n, self._usernames) if board is not None else None
+        if entries is None:
+            self._db_reads += 1
+            entries = self._db_top(game_id, n)
+        return entries
+
+    def rank(self, game_id, user_id):
+        """1-based rank of the user's best score, or None if they have no score."""
+        self._sync()
+        board = self._board(game_id)
+        rank = board.rank(user_id) if board is not None else None
+        if rank is not None:
+            return rank or None
+        self._db_reads += 1
+        best = self._best_row(game_id, user_id)
+        return self._db_rank(game_id, best) if best is not None else None
+
+    def around(self, game_id, user_id, radius=2):
+        self._sync()
+        board = self._board(game_id)
+        entries = board.around(user_id, radius, self._usernames) if board is not None else None
+        if entries is not None:
+            return entries
+        self._db_reads += 1
+        best = self._best_row(game_id, user_id)
+        return self._db_around(game_id, user_id, best, radius) if best is not None else []
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+            self._usernames.clear()
+            self._last_score_id = 0
+            self._last_sync = 0
+
+    def stats(self):
+        return {
+            'boards': len(self._boards),
+            'entries': sum(len(board) for board in list(self._boards.values())),
+            'size': self.size,
+            'best_per_user': self.best_per_user,
+            'db_reads': self._db_reads,
+        }
+
+leaderboards = LeaderboardIndex()
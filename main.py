@@ -1,56 +1,158 @@
+from datetime import datetime
+from flask import request
 from app import app
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from packing import NegotiatedPacket, create_client_manager
+from rooms import create_registry, JOINED, ROOM_FULL
+from matchmaking import Matchmaker
+from chat import ChatHistory
+from reaper import Reaper
+from throttle import SocketThrottle
+from ticks import TickScheduler
+import metrics
 import logging
 import json
 import uuid
 
-# Initialize Flask-SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Initialize Flask-SocketIO; the message queue fans broadcasts out across workers.
+# Clients may opt in to MessagePack per connection; everyone else gets JSON
+client_manager = create_client_manager(app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    async_mode=app.config.get('SOCKETIO_ASYNC_MODE'),
+                    serializer=NegotiatedPacket,
+                    client_manager=client_manager)
 
-# Dictionary to store active game rooms
-game_rooms = {}
-# Dictionary to store player information
-players = {}
+# Active game rooms and connected players
+registry = create_registry(app)
+
+# Per-connection event rate limits; slow consumers are left out of game broadcasts
+throttle = SocketThrottle(socketio, app.config.get('SOCKET_RATE_LIMITS'),
+                          slow_queue=app.config.get('SLOW_CONSUMER_QUEUE', 256))
+metrics.register('socket_throttle', throttle.stats)
+
+# Batches game actions into one frame per tick for game types with a tick rate
+ticks = TickScheduler(socketio, app.config.get('GAME_TICK_RATES'), skip=throttle.skip)
+metrics.register('game_ticks', ticks.stats)
+
+# Recent chat per room, sent to players as they join
+chat_history = ChatHistory(app.config.get('CHAT_HISTORY_SIZE', 50), app.config.get('CHAT_HISTORY_BYTES', 16384),
+                           app.config.get('CHAT_SPILL_DIR'))
+metrics.register('chat_history', chat_history.stats)
+
+def _room_info(room_id, room):
+    return {
+        'room_id': room_id,
+        'game_type': room['game_type'],
+        'players': room['players'],
+        'tick_rate': ticks.rate_for(room['game_type']),
+        'chat': chat_history.recent(room_id)
+    }
+
+def _client_version(value):
+    # A state version reported by a client; anything but a non-negative int means "send a snapshot"
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    return None
+
+def _place_matched(sid, room_id, backfill):
+    # Called by the matchmaker outside any request, after it has seated the player
+    player = registry.get_player(sid)
+    room = registry.get_room(room_id)
+    if not player or not room:
+        return
+    socketio.server.enter_room(sid, room_id)
+    reaper.touch(sid, room_id)
+    if backfill:
+        # Players matched into a new room all get the full list in match_found
+        socketio.emit('player_joined', {'id': player.id, 'username': player.username}, to=room_id, skip_sid=sid)
+    room_info = _room_info(room_id, room)
+    room_info.update(registry.state_since(room_id, None) or {})
+    room_info['backfill'] = backfill
+    socketio.emit('match_found', room_info, to=sid)
+
+# Matchmaking fills listed rooms from per-game_type queues
+matchmaker = Matchmaker(socketio, registry, _place_matched,
+                        room_sizes=app.config.get('MATCH_ROOM_SIZES'),
+                        max_wait=app.config.get('MATCH_MAX_WAIT', 10),
+                        min_players=app.config.get('MATCH_MIN_PLAYERS', 2))
+metrics.register('matchmaking', matchmaker.stats)
+
+def _remove_from_room(player, room_id):
+    # Drop the player from the room; the registry deletes it once empty
+    remaining = registry.leave_room(room_id, player.id)
+    if remaining:
+        socketio.emit('player_left', {'player_id': player.id}, to=room_id)
+    else:
+        _room_closed(room_id)
+
+def _room_closed(room_id):
+    ticks.forget(room_id)
+    chat_history.forget(room_id)
+    reaper.forget_room(room_id)
+
+def _drop_player(sid):
+    player = registry.remove_player(sid)
+    throttle.forget(sid)
+    matchmaker.cancel(sid)
+    reaper.forget_player(sid)
+    if player and player.room:
+        _remove_from_room(player, player.room)
+
+def _reap_player(sid):
+    if socketio.server.manager.is_connected(sid, '/'):
+        # Connected but silent; the disconnect handler does the cleanup
+        socketio.server.disconnect(sid)
+    else:
+        # Ghost left behind by a connection whose disconnect never ran
+        _drop_player(sid)
+    logging.debug(f"Reaped idle player {sid}")
+
+def _reap_room(room_id):
+    room = registry.get_room(room_id)
+    if room:
+        socketio.emit('room_closed', {'room_id': room_id, 'reason': 'idle'}, to=room_id)
+        for member in room['players']:
+            sid = registry.player_sid(member['id'])
+            if sid:
+                registry.set_player_room(sid, None)
+                socketio.server.leave_room(sid, room_id)
+            registry.leave_room(room_id, member['id'])
+        if not room['players']:
+            # Nobody to remove, so drop the room itself
+            registry.leave_room(room_id, None)
+    _room_closed(room_id)
+    logging.debug(f"Reaped idle room {room_id}")
+
+# Expires players and rooms with no activity, including ones never cleaned up on disconnect
+reaper = Reaper(socketio, registry, _reap_player, _reap_room,
+                player_timeout=app.config.get('PLAYER_IDLE_TIMEOUT', 900),
+                room_timeout=app.config.get('ROOM_IDLE_TIMEOUT', 1800))
+metrics.register('room_lifecycle', reaper.stats)
 
 # Socket.IO event handlers
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
+    # The client asks for a wire format in the connect auth, e.g. {'packer': 'msgpack'}
+    packer = client_manager.set_packer(request.sid, auth.get('packer') if isinstance(auth, dict) else None)
     player_id = str(uuid.uuid4())
-    players[request.sid] = {
-        'id': player_id,
-        'username': 'Anonymous',
-        'room': None
-    }
+    registry.add_player(request.sid, player_id)
+    reaper.touch(request.sid)
+    reaper.start()
+    throttle.start()
     logging.debug(f"Client connected: {request.sid}")
-    emit('connected', {'player_id': player_id})
+    emit('connected', {'player_id': player_id, 'packer': packer})
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    player = players.get(request.sid)
-    if player:
-        room = player.get('room')
-        if room and room in game_rooms:
-            # Remove player from room
-            player_list = game_rooms[room].get('players', [])
-            game_rooms[room]['players'] = [p for p in player_list if p['id'] != player['id']]
-            
-            # If room is empty, delete it
-            if not game_rooms[room]['players']:
-                del game_rooms[room]
-            else:
-                # Notify other players about disconnection
-                emit('player_left', {'player_id': player['id']}, room=room)
-        
-        # Remove player from players list
-        del players[request.sid]
-    
+    _drop_player(request.sid)
     logging.debug(f"Client disconnected: {request.sid}")
 
 @socketio.on('set_username')
 def handle_set_username(data):
     username = data.get('username', 'Anonymous')
-    if request.sid in players:
-        players[request.sid]['username'] = username
+    reaper.touch(request.sid)
+    if registry.get_player(request.sid):
+        registry.set_username(request.sid, username)
         logging.debug(f"Username set: {username} for {request.sid}")
         emit('username_set', {'success': True})
 
@@ -58,136 +160,237 @@ def handle_set_username(data):
 def handle_create_room(data):
     game_type = data.get('game_type')
     max_players = data.get('max_players', 4)
+    # Public rooms are listed for matchmaking to fill
+    listed = bool(data.get('public', False))
     
     if not game_type:
         emit('error', {'message': 'Game type is required'})
         return
     
+    if not throttle.admit(request.sid, 'create_room'):
+        emit('error', {'message': 'Too many requests'})
+        return
+    
+    player = registry.get_player(request.sid)
+    if not player:
+        return
+    
     # Create a unique room ID
     room_id = str(uuid.uuid4())[:8]
-    game_rooms[room_id] = {
-        'id': room_id,
-        'game_type': game_type,
-        'max_players': max_players,
-        'players': [],
-        'game_state': {}
-    }
+    registry.create_room(room_id, game_type, max_players, listed)
+    matchmaker.cancel(request.sid)
     
     # Add player to room
-    if request.sid in players:
-        join_room(room_id)
-        players[request.sid]['room'] = room_id
-        game_rooms[room_id]['players'].append({
-            'id': players[request.sid]['id'],
-            'username': players[request.sid]['username']
-        })
-        
-        logging.debug(f"Room created: {room_id} for game: {game_type}")
-        emit('room_created', {'room_id': room_id, 'game_type': game_type})
+    registry.join_room(room_id, {'id': player.id, 'username': player.username})
+    registry.set_player_room(request.sid, room_id)
+    join_room(room_id)
+    reaper.touch(request.sid, room_id)
+    
+    logging.debug(f"Room created: {room_id} for game: {game_type}")
+    emit('room_created', {'room_id': room_id, 'game_type': game_type, 'tick_rate': ticks.rate_for(game_type)})
 
 @socketio.on('join_room')
 def handle_join_room(data):
     room_id = data.get('room_id')
+    last_version = _client_version(data.get('last_version'))
+    player = registry.get_player(request.sid)
     
-    if not room_id or room_id not in game_rooms:
+    if not room_id or not player:
         emit('error', {'message': 'Invalid room ID'})
         return
     
-    # Check if room is full
-    if len(game_rooms[room_id]['players']) >= game_rooms[room_id]['max_players']:
+    if not throttle.admit(request.sid, 'join_room'):
+        emit('error', {'message': 'Too many requests'})
+        return
+    
+    player_info = {
+        'id': player.id,
+        'username': player.username
+    }
+    result = registry.join_room(room_id, player_info)
+    if result == ROOM_FULL:
         emit('error', {'message': 'Room is full'})
         return
+    if result != JOINED:
+        emit('error', {'message': 'Invalid room ID'})
+        return
     
-    # Add player to room
-    if request.sid in players:
-        join_room(room_id)
-        players[request.sid]['room'] = room_id
-        player_info = {
-            'id': players[request.sid]['id'],
-            'username': players[request.sid]['username']
-        }
-        game_rooms[room_id]['players'].append(player_info)
-        
-        # Notify all players in the room about new player
-        emit('player_joined', player_info, room=room_id)
-        
-        # Send current room info to the new player
-        emit('room_joined', {
-            'room_id': room_id,
-            'game_type': game_rooms[room_id]['game_type'],
-            'players': game_rooms[room_id]['players'],
-            'game_state': game_rooms[room_id]['game_state']
-        })
-        
-        logging.debug(f"Player {player_info['username']} joined room: {room_id}")
+    join_room(room_id)
+    registry.set_player_room(request.sid, room_id)
+    matchmaker.cancel(request.sid)
+    reaper.touch(request.sid, room_id)
+    room = registry.get_room(room_id)
+    
+    # Notify all players in the room about new player
+    emit('player_joined', player_info, room=room_id)
+    
+    # Send current room info to the new player; a reconnecting client that
+    # sends the last state version it saw gets only the deltas since then
+    room_info = _room_info(room_id, room)
+    room_info.update(registry.state_since(room_id, last_version) or {})
+    emit('room_joined', room_info)
+    
+    logging.debug(f"Player {player_info['username']} joined room: {room_id}")
+
+@socketio.on('find_match')
+def handle_find_match(data):
+    game_type = data.get('game_type')
+    player = registry.get_player(request.sid)
+    
+    if not game_type or not player:
+        emit('error', {'message': 'Game type is required'})
+        return
+    
+    if player.room:
+        emit('error', {'message': 'Leave your current room first'})
+        return
+    
+    if not throttle.admit(request.sid, 'find_match'):
+        emit('error', {'message': 'Too many requests'})
+        return
+    
+    reaper.touch(request.sid)
+    position = matchmaker.enqueue(request.sid, game_type)
+    emit('match_queued', {'game_type': game_type, 'position': position})
+    logging.debug(f"Player {player.id} queued for {game_type} at position {position}")
+
+@socketio.on('cancel_match')
+def handle_cancel_match(data=None):
+    reaper.touch(request.sid)
+    emit('match_cancelled', {'success': matchmaker.cancel(request.sid)})
 
 @socketio.on('leave_room')
 def handle_leave_room(data):
     room_id = data.get('room_id')
+    player = registry.get_player(request.sid)
     
-    if not room_id or room_id not in game_rooms:
+    if not room_id or not player or player.room != room_id:
         emit('error', {'message': 'Invalid room ID'})
         return
     
-    if request.sid in players and players[request.sid]['room'] == room_id:
-        player_id = players[request.sid]['id']
-        leave_room(room_id)
-        players[request.sid]['room'] = None
-        
-        # Remove player from room
-        game_rooms[room_id]['players'] = [p for p in game_rooms[room_id]['players'] if p['id'] != player_id]
-        
-        # If room is empty, delete it
-        if not game_rooms[room_id]['players']:
-            del game_rooms[room_id]
-        else:
-            # Notify other players about player leaving
-            emit('player_left', {'player_id': player_id}, room=room_id)
-        
-        emit('room_left', {'success': True})
-        logging.debug(f"Player {player_id} left room: {room_id}")
+    leave_room(room_id)
+    registry.set_player_room(request.sid, None)
+    reaper.touch(request.sid)
+    _remove_from_room(player, room_id)
+    
+    emit('room_left', {'success': True})
+    logging.debug(f"Player {player.id} left room: {room_id}")
+
+def _dispatch_action(sid, room_id, action, action_data):
+    # Runs in the event handler or later for a merged action, so it only uses
+    # the sid and not the request context
+    player = registry.get_player(sid)
+    if not player or player.room != room_id:
+        return
+    
+    reaper.touch(sid, room_id)
+    payload = {
+        'player_id': player.id,
+        'action': action,
+        'data': action_data
+    }
+    
+    # State changes are applied before broadcasting so peers learn the new version
+    if action == 'update_state':
+        payload['version'] = registry.set_game_state(room_id, action_data)
+    elif action == 'patch_state':
+        ops = action_data.get('ops') if isinstance(action_data, dict) else None
+        base_version = action_data.get('base_version') if isinstance(action_data, dict) else None
+        version, error = registry.patch_game_state(room_id, base_version, ops)
+        if error:
+            socketio.emit('state_conflict', {'room_id': room_id, 'state_version': version, 'message': error}, to=sid)
+            return
+        payload['data'] = {'ops': ops}
+        payload['version'] = version
+    
+    # Ticked rooms get the action in the next batched frame; others get it right away
+    game_type = registry.room_game_type(room_id)
+    if not ticks.submit(room_id, game_type, payload):
+        # Broadcast action to all players in the room except sender and slow consumers
+        socketio.emit('game_action', payload, to=room_id, skip_sid=throttle.skip(sid))
+    
+    logging.debug(f"Game action: {action} from player {player.id} in room {room_id}")
 
 @socketio.on('game_action')
 def handle_game_action(data):
+    sid = request.sid
     room_id = data.get('room_id')
     action = data.get('action')
     action_data = data.get('data', {})
     
-    if request.sid in players and players[request.sid]['room'] == room_id:
-        player_id = players[request.sid]['id']
-        
-        # Broadcast action to all players in the room except sender
-        emit('game_action', {
-            'player_id': player_id,
-            'action': action,
-            'data': action_data
-        }, room=room_id, include_self=False)
-        
-        # Update game state based on action (if needed)
-        if room_id in game_rooms:
-            if action == 'update_state':
-                game_rooms[room_id]['game_state'] = action_data
-            
-            logging.debug(f"Game action: {action} from player {player_id} in room {room_id}")
+    # Over the limit, the action is dropped or merged with the client's next one
+    deferred = lambda: _dispatch_action(sid, room_id, action, action_data)
+    if throttle.admit(sid, 'game_action', action, deferred):
+        _dispatch_action(sid, room_id, action, action_data)
+
+@socketio.on('sync_state')
+def handle_sync_state(data):
+    room_id = data.get('room_id')
+    player = registry.get_player(request.sid)
+    
+    if not player or player.room != room_id:
+        emit('error', {'message': 'Invalid room ID'})
+        return
+    
+    reaper.touch(request.sid)
+    state = registry.state_since(room_id, _client_version(data.get('since_version')))
+    if state is not None:
+        emit('state_sync', dict(state, room_id=room_id))
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    # Keeps an otherwise quiet client (e.g. in a lobby) from being reaped as idle;
+    # it doesn't count as room activity
+    reaper.touch(request.sid)
+
+@socketio.on('chat_history')
+def handle_chat_history(data):
+    room_id = data.get('room_id')
+    before = data.get('before')
+    player = registry.get_player(request.sid)
+    
+    if not player or player.room != room_id:
+        emit('error', {'message': 'Invalid room ID'})
+        return
+    
+    try:
+        limit = min(max(int(data.get('limit', 20)), 1), 100)
+        before = int(before) if before is not None else None
+    except (TypeError, ValueError):
+        emit('error', {'message': 'Invalid chat history request'})
+        return
+    
+    reaper.touch(request.sid)
+    messages, has_more = chat_history.page(room_id, before, limit)
+    emit('chat_history', {'room_id': room_id, 'messages': messages, 'has_more': has_more})
 
 @socketio.on('chat_message')
 def handle_chat_message(data):
     room_id = data.get('room_id')
-    message = data.get('message')
+    message = str(data.get('message', ''))[:app.config.get('CHAT_MAX_MESSAGE_LENGTH', 500)]
+    player = registry.get_player(request.sid)
     
-    if request.sid in players and players[request.sid]['room'] == room_id:
-        player_id = players[request.sid]['id']
-        player_username = players[request.sid]['username']
+    if player and player.room == room_id:
+        if not throttle.admit(request.sid, 'chat_message'):
+            emit('error', {'message': 'Too many messages'})
+            return
         
-        # Broadcast message to all players in the room
-        emit('chat_message', {
-            'player_id': player_id,
-            'username': player_username,
+        reaper.touch(request.sid, room_id)
+        
+        # Keep it for players who join later, then broadcast to all players in the room
+        entry = chat_history.append(room_id, {
+            'player_id': player.id,
+            'username': player.username,
             'message': message,
             'timestamp': datetime.now().strftime('%H:%M:%S')
-        }, room=room_id)
+        })
+        emit('chat_message', entry, room=room_id)
         
-        logging.debug(f"Chat message from {player_username} in room {room_id}")
+        logging.debug(f"Chat message from {player.username} in room {room_id}")
 
 if __name__ == "__main__":
+    # Production runs `flask --app main bootstrap` once per deploy; do it here for local runs
+    from bootstrap import bootstrap
+    with app.app_context():
+        bootstrap()
     socketio.run(app, host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from rooms import JOINED
+
+@dataclass(slots=True)
+class Ticket:
+    sid: str
+    game_type: str
+    queued_at: float
+
+class Matchmaker:
+    """Per-game_type queues of players waiting for a room.
+
+    Each pass first fills free seats in listed rooms of the game type
+    (fullest first, so rooms that lost players are backfilled before new
+    ones open), then forms new listed rooms of ``room_size`` players, and
+    finally a smaller room once the longest-waiting player has been queued
+    for ``max_wait`` seconds and at least ``min_players`` are waiting.
+    ``place(sid, room_id, backfill)`` is called for every seated player to
+    do the Socket.IO side of the join.
+    """
+
+    WAIT_SAMPLES = 1000
+
+    def __init__(self, socketio, registry, place, room_sizes=None, default_room_size=4,
+                 max_wait=10.0, min_players=2, interval=0.25):
+        self.socketio = socketio
+        self.registry = registry
+        self.place = place
+        self.room_sizes = dict(room_sizes or {})
+        self.default_room_size = default_room_size
+        self.max_wait = max_wait
+        self.min_players = min_players
+        self.interval = interval
+        self._queues = {}  # game_type -> deque of Tickets, oldest first
+        self._tickets = {}  # sid -> Ticket
+        self._lock = threading.Lock()
+        self._task = None
+        self._waits = deque(maxlen=self.WAIT_SAMPLES)
+        self._matched = 0
+        self._backfilled = 0
+        self._rooms_formed = 0
+        self._requeued = 0
+
+    def room_size(self, game_type):
+        return self.room_sizes.get(game_type, self.default_room_size)
+
+    def enqueue(self, sid, game_type, now=None):
+        """Queue a player, replacing any earlier ticket. Returns their position in the queue."""
+        ticket = Ticket(sid, game_type, time.monotonic() if now is None else now)
+        with self._lock:
+            self._remove(sid)
+            queue = self._queues.setdefault(game_type, deque())
+            queue.append(ticket)
+            self._tickets[sid] = ticket
+            position = len(queue)
+        self._ensure_task()
+        return position
+
+    def cancel(self, sid):
+        """Drop a player's ticket. Returns True if they were queued."""
+        with self._lock:
+            return self._remove(sid)
+
+    def _remove(self, sid):
+        ticket = self._tickets.pop(sid, None)
+        if ticket is None:
+            return False
+        self._queues[ticket.game_type].remove(ticket)
+        return True
+
+    def _take(self, game_type, count):
+        # Oldest tickets first, skipping players who disconnected in the meantime
+        taken = []
+        with self._lock:
+            queue = self._queues.get(game_type)
+            while queue and len(taken) < count:
+                ticket = queue.popleft()
+                del self._tickets[ticket.sid]
+                taken.append(ticket)
+        return [ticket for ticket in taken if self.registry.get_player(ticket.sid)]
+
+    def _requeue(self, tickets):
+        with self._lock:
+            for ticket in reversed(tickets):
+                if ticket.sid not in self._tickets:
+                    self._queues[ticket.game_type].appendleft(ticket)
+                    self._tickets[ticket.sid] = ticket
+                    self._requeued += 1
+
+    def waiting(self, game_type):
+        return len(self._queues.get(game_type, ()))
+
+    def _seat(self, tickets, room_id, now, backfill):
+        # Players joining a new room are told once everyone is seated, so each
+        # gets the full player list; backfilled players are placed one by one
+        seated = []
+        for index, ticket in enumerate(tickets):
+            player = self.registry.get_player(ticket.sid)
+            if player is None:
+                continue
+            if self.registry.join_room(room_id, {'id': player.id, 'username': player.username}) != JOINED:
+                # Another worker took the seat, or the room emptied and was deleted
+                self._requeue(tickets[index:])
+                break
+            self.registry.set_player_room(ticket.sid, room_id)
+            self._waits.append(max(0.0, now - ticket.queued_at))
+            self._matched += 1
+            self._backfilled += backfill
+            if backfill:
+                self._place(ticket.sid, room_id, backfill)
+            else:
+                seated.append(ticket.sid)
+        for sid in seated:
+            self._place(sid, room_id, backfill)
+
+    def _place(self, sid, room_id, backfill):
+        try:
+            self.place(sid, room_id, backfill)
+        except Exception as e:
+            logging.error(f"Error placing {sid} in room {room_id}: {str(e)}")
+
+    def _form_room(self, game_type, tickets, now):
+        if not tickets:
+            return
+        room_id = str(uuid.uuid4())[:8]
+        self.registry.create_room(room_id, game_type, self.room_size(game_type), listed=True)
+        self._rooms_formed += 1
+        logging.debug(f"Matchmaking formed room {room_id} for {len(tickets)} {game_type} players")
+        self._seat(tickets, room_id, now, backfill=False)
+
+    def match(self, now=None):
+        """Run one matchmaking pass over every non-empty queue."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            game_types = [game_type for game_type, queue in self._queues.items() if queue]
+        for game_type in game_types:
+            self._match_game_type(game_type, now)
+
+    def _match_game_type(self, game_type, now):
+        for room_id, free in self.registry.open_rooms(game_type):
+            tickets = self._take(game_type, free)
+            if tickets:
+                self._seat(tickets, room_id, now, backfill=True)
+            if not self.waiting(game_type):
+                return
+
+        size = self.room_size(game_type)
+        while self.waiting(game_type) >= size:
+            self._form_room(game_type, self._take(game_type, size), now)
+
+        with self._lock:
+            queue = self._queues.get(game_type)
+            overdue = bool(queue) and now - queue[0].queued_at >= self.max_wait
+        if overdue and self.waiting(game_type) >= self.min_players:
+            self._form_room(game_type, self._take(game_type, size), now)
+
+    def _ensure_task(self):
+        if self._task is None:
+            with self._lock:
+                if self._task is None:
+                    self._task = self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            try:
+                self.match()
+            except Exception as e:
+                logging.error(f"Error in matchmaking pass: {str(e)}")
+            self.socketio.sleep(self.interval)
+
+    def stats(self):
+        waits = sorted(self._waits)
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 3) if waits else None
+        return {
+            'queued': {game_type: len(queue) for game_type, queue in self._queues.items() if queue},
+            'matched': self._matched,
+            'backfilled': self._backfilled,
+            'rooms_formed': self._rooms_formed,
+            'requeued': self._requeued,
+            'wait_seconds': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': round(waits[-1], 3) if waits else None},
+        }
@@ -0,0 +1,8 @@
+# Components register a callable returning a dict of counters; /admin/metrics reports them all
+_providers = {}
+
+def register(name, provider):
+    _providers[name] = provider
+
+def snapshot():
+    return {name: provider() for name, provider in _providers.items()}
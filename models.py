@@ -1,4 +1,6 @@
+import hashlib
 from datetime import datetime
+from sqlalchemy.orm import deferred
 from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -35,21 +37,48 @@ class Game(db.Model):
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
     instructions = db.Column(db.Text, nullable=False)
-    game_type = db.Column(db.String(50), nullable=False)
+    game_type = db.Column(db.String(50), nullable=False, index=True)
     
     # Relationships
     scores = db.relationship('Score', backref='game', lazy='dynamic')
     ratings = db.relationship('Rating', backref='game', lazy='dynamic')
     comments = db.relationship('Comment', backref='game', lazy='dynamic')
+    stats = db.relationship('GameStats', uselist=False, lazy='joined', cascade='all, delete-orphan')
     
     def average_rating(self):
-        ratings = [r.rating for r in self.ratings]
-        return sum(ratings) / len(ratings) if ratings else 0
+        if not self.stats or not self.stats.rating_count:
+            return 0
+        return self.stats.rating_sum / self.stats.rating_count
+    
+    def rating_count(self):
+        return self.stats.rating_count if self.stats else 0
+    
+    def comment_count(self):
+        return self.stats.comment_count if self.stats else 0
+    
+    def score_count(self):
+        return self.stats.score_count if self.stats else 0
     
     def __repr__(self):
         return f'<Game {self.title}>'
 
+class GameStats(db.Model):
+    # Denormalized counters, updated by the write routes in the same transaction
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), primary_key=True)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    score_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<GameStats for game {self.game_id}>'
+
 class Score(db.Model):
+    __table_args__ = (
+        db.Index('ix_score_game_id_score', 'game_id', 'score'),
+        db.Index('ix_score_user_id_date', 'user_id', 'date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     score = db.Column(db.Integer, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -62,6 +91,10 @@ class Score(db.Model):
         return f'<Score {self.score} by {self.user.username} in {self.game.title}>'
 
 class Rating(db.Model):
+    __table_args__ = (
+        db.Index('ux_rating_user_id_game_id', 'user_id', 'game_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 rating
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -74,6 +107,11 @@ class Rating(db.Model):
         return f'<Rating {self.rating} by {self.user.username} for {self.game.title}>'
 
 class Comment(db.Model):
+    __table_args__ = (
+        db.Index('ix_comment_game_id_date', 'game_id', 'date'),
+        db.Index('ix_comment_user_id_date', 'user_id', 'date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -86,11 +124,20 @@ class Comment(db.Model):
         return f'<Comment by {self.user.username} for {self.game.title}>'
 
 class UserGame(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_game_is_published_date_created', 'is_published', 'date_created'),
+        db.Index('ix_user_game_category_id_is_published_date_created', 'category_id', 'is_published', 'date_created'),
+        db.Index('ix_user_game_date_created', 'date_created'),
+        db.Index('ix_user_game_is_featured_date_created', 'is_featured', 'date_created'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
     instructions = db.Column(db.Text, nullable=False)
-    code = db.Column(db.Text, nullable=False)  # JavaScript code for the game
+    # Code lives in GameCode; this legacy inline column is emptied by `flask bootstrap`
+    inline_code = deferred(db.Column('code', db.Text, nullable=False, default=''))
+    code_hash = db.Column(db.String(64), db.ForeignKey('game_code.hash'), nullable=True, index=True)
     thumbnail = db.Column(db.String(255), nullable=True)  # Path to thumbnail image
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
     date_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -105,14 +152,60 @@ class UserGame(db.Model):
     ratings = db.relationship('UserGameRating', backref='game', lazy='dynamic')
     comments = db.relationship('UserGameComment', backref='game', lazy='dynamic')
     plays = db.relationship('UserGamePlay', backref='game', lazy='dynamic')
+    stats = db.relationship('UserGameStats', uselist=False, lazy='joined', cascade='all, delete-orphan')
+    code_blob = db.relationship('GameCode', lazy='select')
+    
+    @property
+    def code(self):
+        # JavaScript code for the game; only loaded when asked for
+        if self.code_blob is not None:
+            return self.code_blob.code
+        return self.inline_code
+    
+    @code.setter
+    def code(self, code):
+        digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        self.code_blob = db.session.get(GameCode, digest) or GameCode(hash=digest, code=code,
+                                                                       size=len(code.encode('utf-8')))
     
     def average_rating(self):
-        ratings = [r.rating for r in self.ratings]
-        return sum(ratings) / len(ratings) if ratings else 0
+        if not self.stats or not self.stats.rating_count:
+            return 0
+        return self.stats.rating_sum / self.stats.rating_count
+    
+    def rating_count(self):
+        return self.stats.rating_count if self.stats else 0
+    
+    def comment_count(self):
+        return self.stats.comment_count if self.stats else 0
+    
+    def play_count(self):
+        return self.stats.play_count if self.stats else 0
     
     def __repr__(self):
         return f'<UserGame {self.title} by {self.creator.username}>'
 
+class GameCode(db.Model):
+    # User game code, stored once per distinct content under its SHA-256
+    hash = db.Column(db.String(64), primary_key=True)
+    code = db.Column(db.Text, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<GameCode {self.hash[:12]} ({self.size} bytes)>'
+
+class UserGameStats(db.Model):
+    # Denormalized counters, updated by the write routes in the same transaction
+    game_id = db.Column(db.Integer, db.ForeignKey('user_game.id'), primary_key=True)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    play_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<UserGameStats for user game {self.game_id}>'
+
 class GameCategory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
@@ -125,6 +218,10 @@ class GameCategory(db.Model):
         return f'<GameCategory {self.name}>'
 
 class UserGameRating(db.Model):
+    __table_args__ = (
+        db.Index('ux_user_game_rating_user_id_game_id', 'user_id', 'game_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 rating
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -137,6 +234,10 @@ class UserGameRating(db.Model):
         return f'<UserGameRating {self.rating} by {self.user.username} for {self.game.title}>'
 
 class UserGameComment(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_game_comment_game_id_date', 'game_id', 'date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -149,9 +250,17 @@ class UserGameComment(db.Model):
         return f'<UserGameComment by {self.user.username} for {self.game.title}>'
 
 class UserGamePlay(db.Model):
+    # Raw play events, written in batches by plays.PlayTracker and pruned after PLAY_RETENTION_DAYS
+    __table_args__ = (
+        db.Index('ix_user_game_play_game_id_played_at', 'game_id', 'played_at'),
+        db.Index('ix_user_game_play_played_at', 'played_at'),
+        db.Index('ux_user_game_play_token', 'token', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     played_at = db.Column(db.DateTime, default=datetime.utcnow)
     duration = db.Column(db.Integer, nullable=True)  # play duration in seconds
+    token = db.Column(db.String(32), nullable=True)  # lets the duration beacon find the play
     
     # Foreign Keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -159,3 +268,49 @@ class UserGamePlay(db.Model):
     
     def __repr__(self):
         return f'<UserGamePlay by {self.user.username} for {self.game.title}>'
+
+class UserGamePlayRollup(db.Model):
+    # Play counters per user game and UTC hour or day; kept after the raw plays are pruned
+    __table_args__ = (
+        db.Index('ix_user_game_play_rollup_period_bucket', 'period', 'bucket'),
+    )
+    
+    game_id = db.Column(db.Integer, db.ForeignKey('user_game.id'), primary_key=True)
+    period = db.Column(db.String(4), primary_key=True)  # 'hour' or 'day'
+    bucket = db.Column(db.DateTime, primary_key=True)  # start of the hour or day
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    duration_sum = db.Column(db.Integer, nullable=False, default=0)
+    duration_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<UserGamePlayRollup {self.period} {self.bucket} for user game {self.game_id}>'
+
+class UserGameTrend(db.Model):
+    # Snapshot of the in-memory trending rankings (see trending.py); each score
+    # is stored as log2(|decayed value|) + hours / half-life, negated for a
+    # negative value, or NULL for zero
+    __table_args__ = (
+        db.Index('ix_user_game_trend_updated_at', 'updated_at'),
+    )
+    
+    game_id = db.Column(db.Integer, db.ForeignKey('user_game.id'), primary_key=True)
+    trending = db.Column(db.Float, nullable=True)
+    top_rated = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserGameTrend for user game {self.game_id}>'
+
+class UserGameDeletion(db.Model):
+    # Recently deleted user games; each worker's trending index reads the ones
+    # newer than its last sync and drops them (see trending.py)
+    __table_args__ = (
+        db.Index('ix_user_game_deletion_deleted_at', 'deleted_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, nullable=False)  # no foreign key: the game is gone
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserGameDeletion of user game {self.game_id}>'
@@ -0,0 +1,113 @@
+"""Per-connection choice between the default JSON wire format and MessagePack.
+
+A client opts in by connecting with ``auth={'packer': 'msgpack'}`` (see
+static/js/multiplayer.js) and learns the format it was given from the
+``connected`` event; everyone else gets JSON. Incoming packets are
+decoded by type: text is JSON, binary is MessagePack. Outgoing events are
+encoded at most once per format in use among the recipients, so a broadcast
+to a mixed room costs one JSON and one MessagePack encode. Connection,
+disconnect and ack packets stay JSON text, which the client parser also
+accepts. Without msgpack installed every client gets JSON.
+"""
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class NegotiatedPacket(packet.Packet):
+    """JSON packet that also decodes MessagePack packets sent as binary messages."""
+
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, bytes) and msgpack is not None:
+            decoded = msgpack.loads(encoded_packet)
+            self.packet_type = decoded['type']
+            self.data = decoded.get('data')
+            self.id = decoded.get('id')
+            self.namespace = decoded.get('nsp', '/')
+            return 0
+        return super().decode(encoded_packet)
+
+class BinaryPacket(NegotiatedPacket):
+    """Sends every packet as MessagePack and still decodes JSON text packets."""
+
+    # Bytes go inside the MessagePack payload rather than as separate attachments
+    uses_binary_events = False
+
+    def encode(self):
+        return msgpack.dumps(self._to_dict())
+
+class PackingManager(socketio.Manager):
+    """Client manager that encodes each emit in the format every recipient asked for."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._binary = set()  # sids of this worker's clients that asked for MessagePack
+
+    def set_packer(self, sid, packer):
+        """Record the format a client asked for when connecting and return the one it gets.
+
+        Anything but 'msgpack', or 'msgpack' without the library installed, means 'json'.
+        """
+        if packer == 'msgpack' and msgpack is not None:
+            self._binary.add(sid)
+            return 'msgpack'
+        self._binary.discard(sid)
+        return 'json'
+
+    def disconnect(self, sid, namespace, **kwargs):
+        self._binary.discard(sid)
+        return super().disconnect(sid, namespace, **kwargs)
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        if callback or not self._binary:
+            # Acks are sent per recipient as JSON, and so is everything while nobody wants MessagePack
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                callback=callback, to=to, **kwargs)
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+        encoded = {}  # packet class -> Engine.IO packets
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            packet_class = BinaryPacket if sid in self._binary else self.server.packet_class
+            eio_packets = encoded.get(packet_class)
+            if eio_packets is None:
+                payload = packet_class(packet.EVENT, namespace=namespace, data=[event] + data).encode()
+                if not isinstance(payload, list):
+                    payload = [payload]
+                eio_packets = encoded[packet_class] = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in payload]
+            for p in eio_packets:
+                self.server.eio.send_packet(eio_sid, p)
+
+def create_client_manager(message_queue=None, channel='flask-socketio'):
+    """PackingManager for this process, or combined with the pub/sub manager for ``message_queue``.
+
+    Picks the queue class from the URL the same way Flask-SocketIO does.
+    """
+    if not message_queue:
+        return PackingManager()
+    if message_queue.startswith(('redis://', 'rediss://')):
+        queue_class = socketio.RedisManager
+    elif message_queue.startswith('kafka://'):
+        queue_class = socketio.KafkaManager
+    elif message_queue.startswith('zmq'):
+        queue_class = socketio.ZmqManager
+    else:
+        queue_class = socketio.KombuManager
+    # The pub/sub manager hands emits that reach this worker to super().emit(),
+    # which then resolves to PackingManager
+    manager_class = type(f"Packing{queue_class.__name__}", (queue_class, PackingManager), {})
+    return manager_class(message_queue, channel=channel)
@@ -0,0 +1,40 @@
+from datetime import datetime
+from sqlalchemy import or_
+
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    return f"{sort_value}|{row_id}"
+
+def decode_cursor(cursor):
+    """Split a cursor back into (datetime, id). Returns None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        sort_value, row_id = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except ValueError:
+        return None
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=20):
+    """Return (rows, next_cursor) for the page after ``cursor``, newest first.
+
+    Rows are ordered by (sort_column, id_column) descending, and the cursor
+    points at the last row already seen, so each page is a bounded index range
+    scan no matter how deep the caller has paged. ``limit`` must be at least 1.
+    """
+    if limit < 1:
+        raise ValueError(f"Page limit must be at least 1, got {limit}")
+    position = decode_cursor(cursor)
+    if position:
+        sort_value, row_id = position
+        # The redundant upper bound gives the planner an index range to start from
+        query = query.filter(sort_column <= sort_value,
+                             or_(sort_column < sort_value, id_column < row_id))
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
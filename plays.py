@@ -0,0 +1,326 @@
+import atexit
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select, update
+from app import db
+from models import UserGame, UserGamePlay, UserGamePlayRollup
+from stats import bump_user_game_stats, increment
+
+PERIODS = ('hour', 'day')
+
+# Longest play duration the beacon accepts, in seconds
+MAX_DURATION = 24 * 3600
+
+def bucket_start(moment, period):
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class PlayTracker:
+    """Write-behind buffer for user game plays, rolled up into hourly and daily counters.
+
+    ``record`` queues a play in process and returns a token the page hands to
+    the duration beacon. A background thread writes queued plays in batches,
+    bumps the per-game counters and the hourly/daily rollups in the same
+    transaction, and applies durations reported for plays already written.
+    A duration that arrives while its play is still queued is merged in
+    memory. A batch that fails to write is put back at the front of the
+    queue and retried on the next flush. Raw plays older than
+    ``retention_days`` and hourly rollups older than ``hourly_retention_days``
+    are pruned every ``prune_interval`` seconds; daily rollups are kept. When
+    the buffer is full the play is written directly, as before.
+    """
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, retention_days=30,
+                 hourly_retention_days=90, prune_interval=3600, prune_batch_size=5000):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.prune_interval = prune_interval
+        self.prune_batch_size = prune_batch_size
+        self.enabled = True
+        self.app = None
+        self._plays = OrderedDict()  # token -> [user_id, game_id, played_at, duration]
+        self._durations = {}  # token -> (user_id, duration) for plays already written
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._last_prune = time.monotonic()
+        self._recorded = 0
+        self._written = 0
+        self._direct = 0
+        self._durations_applied = 0
+        self._durations_merged = 0
+        self._durations_dropped = 0
+        self._pruned = 0
+        self._requeued = 0
+        self._flushes = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('PLAY_BUFFER_ENABLED', self.enabled)
+        self.max_size = app.config.get('PLAY_BUFFER_MAX_SIZE', self.max_size)
+        self.batch_size = app.config.get('PLAY_BUFFER_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('PLAY_BUFFER_FLUSH_INTERVAL', self.flush_interval)
+        self.retention_days = app.config.get('PLAY_RETENTION_DAYS', self.retention_days)
+        self.hourly_retention_days = app.config.get('PLAY_HOURLY_RETENTION_DAYS', self.hourly_retention_days)
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        # Start lazily, and again after a fork, so each gunicorn worker has its own flusher
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='play-flusher', daemon=True)
+            self._thread.start()
+
+    def record(self, user_id, game_id, played_at=None):
+        """Queue a play and return its token for the duration beacon."""
+        token = secrets.token_hex(16)
+        event = [user_id, game_id, played_at or datetime.utcnow(), None]
+        if not self.enabled:
+            self._write({token: event}, {})
+            self._direct += 1
+            return token
+        self._ensure_thread()
+        with self._lock:
+            full = len(self._plays) >= self.max_size
+            if not full:
+                self._plays[token] = event
+                self._recorded += 1
+                queued = len(self._plays)
+        if full:
+            self._write({token: event}, {})
+            self._direct += 1
+        elif queued >= self.batch_size:
+            self._wakeup.set()
+        return token
+
+    def set_duration(self, token, user_id, duration):
+        """Attach a beacon-reported duration to the play with this token."""
+        with self._lock:
+            event = self._plays.get(token)
+            if event is not None:
+                if event[0] == user_id and event[3] is None:
+                    event[3] = duration
+                    self._durations_merged += 1
+                return
+            if len(self._durations) >= self.max_size:
+                self._durations_dropped += 1
+                return
+            # First report wins, as it does once the play is written
+            self._durations.setdefault(token, (user_id, duration))
+        self._ensure_thread()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_prune >= self.prune_interval:
+                    self._last_prune = time.monotonic()
+                    with self.app.app_context():
+                        self.prune()
+            except Exception as e:
+                logging.error(f"Error flushing play events: {str(e)}")
+
+    def _drain(self):
+        with self._lock:
+            plays = {}
+            while self._plays and len(plays) < self.batch_size:
+                token, event = self._plays.popitem(last=False)
+                plays[token] = event
+            durations, self._durations = self._durations, {}
+        return plays, durations
+
+    def _requeue(self, plays, durations):
+        # Back in front, in their original order; the queue refuses new plays
+        # once full, so this overshoots max_size by at most one batch
+        with self._lock:
+            for token, event in reversed(plays.items()):
+                self._plays[token] = event
+                self._plays.move_to_end(token, last=False)
+            # These were reported first, so they win over any that arrived since
+            self._durations.update(durations)
+            self._requeued += len(plays)
+
+    def flush(self):
+        """Write everything currently queued. Safe to call from any thread."""
+        if self.app is None:
+            return 0
+        with self._flush_lock, self.app.app_context():
+            written = 0
+            while True:
+                plays, durations = self._drain()
+                if not plays and not durations:
+                    return written
+                try:
+                    self._write(plays, durations)
+                except Exception:
+                    self._requeue(plays, durations)
+                    raise
+                written += len(plays)
+
+    def _write(self, plays, durations):
+        started = time.perf_counter()
+        rollups = {}
+        play_counts = {}
+
+        def add(game_id, played_at, **deltas):
+            for period in PERIODS:
+                totals = rollups.setdefault((game_id, period, bucket_start(played_at, period)), {})
+                for name, delta in deltas.items():
+                    totals[name] = totals.get(name, 0) + delta
+
+        # Plays of games deleted since they were recorded are dropped, or the batch would never write
+        game_ids = {event[1] for event in plays.values()}
+        existing = set(db.session.scalars(select(UserGame.id).where(UserGame.id.in_(game_ids)))) if game_ids else set()
+        rows = []
+        for token, (user_id, game_id, played_at, duration) in plays.items():
+            if game_id not in existing:
+                continue
+            rows.append({'token': token, 'user_id': user_id, 'game_id': game_id, 'played_at': played_at,
+                         'duration': duration})
+            play_counts[game_id] = play_counts.get(game_id, 0) + 1
+            if duration is None:
+                add(game_id, played_at, plays=1)
+            else:
+                add(game_id, played_at, plays=1, duration_sum=duration, duration_count=1)
+        try:
+            if rows:
+                db.session.execute(insert(UserGamePlay), rows)
+            for token, (user_id, duration) in durations.items():
+                # Only the first report counts, and only from the player the token was issued to
+                played = db.session.execute(
+                    update(UserGamePlay)
+                    .where(UserGamePlay.token == token, UserGamePlay.user_id == user_id, UserGamePlay.duration.is_(None))
+                    .values(duration=duration)
+                    .returning(UserGamePlay.game_id, UserGamePlay.played_at)).first()
+                if played:
+                    add(played.game_id, played.played_at, duration_sum=duration, duration_count=1)
+                    self._durations_applied += 1
+            for game_id, count in play_counts.items():
+                bump_user_game_stats(game_id, play_count=count)
+            for (game_id, period, bucket), deltas in rollups.items():
+                increment(UserGamePlayRollup, {'game_id': game_id, 'period': period, 'bucket': bucket}, deltas)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._flushes += 1
+        self._written += len(rows)
+        self._last_flush_ms = elapsed_ms
+        self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+        logging.debug(f"Flushed {len(rows)} plays and {len(durations)} durations in {elapsed_ms:.1f}ms")
+
+    def prune(self, now=None):
+        """Delete raw plays and hourly rollups past their retention, in batches. Returns rows deleted."""
+        now = now or datetime.utcnow()
+        deleted = 0
+        cutoff = now - timedelta(days=self.retention_days)
+        while True:
+            ids = select(UserGamePlay.id).where(UserGamePlay.played_at < cutoff).limit(self.prune_batch_size)
+            result = db.session.execute(delete(UserGamePlay).where(UserGamePlay.id.in_(ids)))
+            db.session.commit()
+            deleted += result.rowcount
+            if result.rowcount < self.prune_batch_size:
+                break
+        result = db.session.execute(delete(UserGamePlayRollup).where(
+            UserGamePlayRollup.period == 'hour',
+            UserGamePlayRollup.bucket < now - timedelta(days=self.hourly_retention_days)))
+        db.session.commit()
+        deleted += result.rowcount
+        self._pruned += deleted
+        if deleted:
+            logging.debug(f"Pruned {deleted} play rows past retention")
+        return deleted
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'queue_depth': len(self._plays),
+            'pending_durations': len(self._durations),
+            'max_size': self.max_size,
+            'recorded': self._recorded,
+            'written': self._written,
+            'written_directly': self._direct,
+            'durations_merged': self._durations_merged,
+            'durations_applied': self._durations_applied,
+            'durations_dropped': self._durations_dropped,
+            'pruned': self._pruned,
+            'requeued': self._requeued,
+            'flushes': self._flushes,
+            'last_flush_ms': round(self._last_flush_ms, 2),
+            'max_flush_ms': round(self._max_flush_ms, 2),
+        }
+
+def _bucket_expression(period):
+    column = UserGamePlay.played_at
+    if db.engine.dialect.name == 'postgresql':
+        return func.date_trunc(period, column)
+    return func.strftime('%Y-%m-%d %H:00:00' if period == 'hour' else '%Y-%m-%d 00:00:00', column)
+
+def backfill_play_rollups():
+    """Roll up raw plays for every (game, period, bucket) that has no rollup yet. Returns rollups added.
+
+    For plays written before rollups existed, or loaded in bulk; plays
+    recorded through PlayTracker already have theirs.
+    """
+    added = 0
+    for period in PERIODS:
+        existing = set(db.session.execute(select(UserGamePlayRollup.game_id, UserGamePlayRollup.bucket)
+                                          .where(UserGamePlayRollup.period == period)).tuples())
+        bucket = _bucket_expression(period)
+        grouped = db.session.execute(
+            select(UserGamePlay.game_id, bucket, func.count(UserGamePlay.id), func.sum(UserGamePlay.duration),
+                   func.count(UserGamePlay.duration))
+            .group_by(UserGamePlay.game_id, bucket))
+        rows = []
+        for game_id, start, plays, duration_sum, duration_count in grouped:
+            if isinstance(start, str):
+                start = datetime.fromisoformat(start)
+            if (game_id, start) in existing:
+                continue
+            rows.append({'game_id': game_id, 'period': period, 'bucket': start, 'plays': plays,
+                         'duration_sum': duration_sum or 0, 'duration_count': duration_count})
+        for offset in range(0, len(rows), 1000):
+            db.session.execute(insert(UserGamePlayRollup), rows[offset:offset + 1000])
+        added += len(rows)
+    db.session.commit()
+    if added:
+        logging.debug(f"Backfilled {added} play rollups")
+    return added
+
+def popular_games(days=7, limit=10, now=None):
+    """[(game_id, plays)] for the most played published user games over the last ``days`` days, from the daily rollups."""
+    if days < 1 or limit < 1:
+        raise ValueError(f"days and limit must be at least 1, got {days} and {limit}")
+    since = bucket_start((now or datetime.utcnow()) - timedelta(days=days - 1), 'day')
+    plays = func.sum(UserGamePlayRollup.plays).label('plays')
+    return db.session.execute(
+        select(UserGamePlayRollup.game_id, plays)
+        .join(UserGame, UserGame.id == UserGamePlayRollup.game_id)
+        .where(UserGamePlayRollup.period == 'day', UserGamePlayRollup.bucket >= since, UserGame.is_published == True)
+        .group_by(UserGamePlayRollup.game_id)
+        .order_by(plays.desc())
+        .limit(limit)).all()
+
+play_tracker = PlayTracker()
@@ -0,0 +1,115 @@
+import heapq
+import logging
+import threading
+import time
+
+class Reaper:
+    """Tracks last activity of players (by sid) and rooms, and expires idle ones.
+
+    Players belong to the worker holding their socket, so they are tracked
+    here: ``touch`` only records a timestamp, each sid has one entry in a
+    deadline heap, and when it comes due the reaper either pushes it back to
+    the sid's current deadline or, if it really went idle, calls
+    ``on_idle_player(sid)``. A pass therefore costs O(expired log n)
+    regardless of how many sids are tracked.
+
+    Rooms can have players on several workers, so their last activity is kept
+    in the registry. Room touches are collected locally and written in one
+    batch per pass; the pass then claims every room idle past the timeout on
+    all workers and calls ``on_idle_room(room_id)``. Claiming moves the room's
+    timestamp forward, so no two workers close the same room, and rooms left
+    behind by a crashed worker are still closed by the others. Times are wall
+    clock because they are compared between processes.
+    """
+
+    def __init__(self, socketio, registry, on_idle_player, on_idle_room, player_timeout=900, room_timeout=1800,
+                 interval=5):
+        self.socketio = socketio
+        self.registry = registry
+        self.on_idle_player = on_idle_player
+        self.on_idle_room = on_idle_room
+        self.player_timeout = player_timeout
+        self.room_timeout = room_timeout
+        self.interval = interval
+        self._last = {}  # sid -> last activity
+        self._heap = []  # (deadline, sid)
+        self._rooms = {}  # room_id -> last activity not yet written to the registry
+        self._lock = threading.Lock()
+        self._task = None
+        self._counts = {'rooms_closed': 0, 'rooms_reaped': 0, 'players_reaped': 0}
+
+    def touch(self, sid, room_id=None, now=None):
+        """Record activity from a player, and from their room if given."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if sid not in self._last:
+                heapq.heappush(self._heap, (now + self.player_timeout, sid))
+            self._last[sid] = now
+            if room_id:
+                self._rooms[room_id] = now
+
+    def forget_player(self, sid):
+        with self._lock:
+            self._last.pop(sid, None)
+
+    def forget_room(self, room_id):
+        """Stop tracking a room that closed normally."""
+        with self._lock:
+            self._rooms.pop(room_id, None)
+        self._counts['rooms_closed'] += 1
+
+    def reap(self, now=None):
+        """Expire everything idle past its timeout. Returns the number of players and rooms reaped."""
+        now = time.time() if now is None else now
+        players = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, sid = heapq.heappop(self._heap)
+                last = self._last.get(sid)
+                if last is None:
+                    continue  # forgotten since it was scheduled
+                deadline = last + self.player_timeout
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, sid))
+                else:
+                    del self._last[sid]
+                    players.append(sid)
+            touched, self._rooms = self._rooms, {}
+        for sid in players:
+            self._counts['players_reaped'] += 1
+            self._expire(self.on_idle_player, 'player', sid)
+        try:
+            if touched:
+                self.registry.touch_rooms(touched)
+            rooms = self.registry.claim_idle_rooms(now - self.room_timeout, now)
+        except Exception as e:
+            logging.error(f"Error checking idle rooms: {str(e)}")
+            rooms = []
+        for room_id in rooms:
+            self._counts['rooms_reaped'] += 1
+            self._expire(self.on_idle_room, 'room', room_id)
+        return len(players) + len(rooms)
+
+    def _expire(self, callback, kind, key):
+        try:
+            callback(key)
+        except Exception as e:
+            logging.error(f"Error reaping idle {kind} {key}: {str(e)}")
+
+    def start(self):
+        if self._task is None:
+            with self._lock:
+                if self._task is None:
+                    self._task = self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            self.reap()
+
+    def stats(self):
+        return dict(self._counts,
+                    players_tracked=len(self._last),
+                    rooms_pending=len(self._rooms),
+                    heap_size=len(self._heap),
+                    timeouts={'player': self.player_timeout, 'room': self.room_timeout})
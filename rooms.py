@@ -0,0 +1,482 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+from statepatch import apply_patch, apply_patch_atomic, PatchError
+
+# Results of RoomRegistry.join_room
+JOINED = 'joined'
+ROOM_MISSING = 'missing'
+ROOM_FULL = 'full'
+
+def _deltas_since(log, since, version):
+    # log holds (version, ops) in order; usable only if it still reaches back to since + 1
+    if since == version:
+        return []
+    if since > version or not log or log[0][0] > since + 1:
+        return None
+    return [{'version': v, 'ops': ops} for v, ops in log if v > since]
+
+@dataclass(slots=True)
+class Player:
+    sid: str
+    id: str
+    username: str = 'Anonymous'
+    room: Optional[str] = None
+
+@dataclass(slots=True)
+class Room:
+    id: str
+    game_type: str
+    max_players: int
+    listed: bool = False  # open to matchmaking
+    members: dict = field(default_factory=dict)  # player_id -> username, in join order
+    game_state: dict = field(default_factory=dict)
+    state_version: int = 0
+    deltas: Optional[deque] = None
+    last_active: float = 0.0  # wall clock, see touch_rooms
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'game_type': self.game_type,
+            'max_players': self.max_players,
+            'listed': self.listed,
+            'players': [{'id': player_id, 'username': username} for player_id, username in self.members.items()],
+            'game_state': copy.deepcopy(self.game_state),
+            'state_version': self.state_version
+        }
+
+class MemoryRoomRegistry:
+    """Rooms and players held in this process. Only correct with a single worker.
+
+    Membership is keyed by player id and there are reverse indexes from
+    player id to sid and from game type to rooms, so joins, leaves and
+    lookups are O(1) however many sockets the process holds.
+    """
+
+    def __init__(self, delta_log_size=256):
+        self.delta_log_size = delta_log_size
+        self._rooms = {}
+        self._players = {}  # sid -> Player
+        self._sids = {}  # player_id -> sid
+        self._rooms_by_type = {}  # game_type -> {room_id}
+        self._lock = threading.RLock()
+
+    # Players
+
+    def add_player(self, sid, player_id, username='Anonymous'):
+        with self._lock:
+            self._players[sid] = Player(sid, player_id, username)
+            self._sids[player_id] = sid
+
+    def get_player(self, sid):
+        return self._players.get(sid)
+
+    def player_sid(self, player_id):
+        return self._sids.get(player_id)
+
+    def set_username(self, sid, username):
+        player = self._players.get(sid)
+        if player:
+            player.username = username
+
+    def set_player_room(self, sid, room_id):
+        player = self._players.get(sid)
+        if player:
+            player.room = room_id
+
+    def remove_player(self, sid):
+        with self._lock:
+            player = self._players.pop(sid, None)
+            if player:
+                self._sids.pop(player.id, None)
+            return player
+
+    # Rooms
+
+    def create_room(self, room_id, game_type, max_players, listed=False):
+        with self._lock:
+            self._rooms[room_id] = Room(room_id, game_type, max_players, listed,
+                                        deltas=deque(maxlen=self.delta_log_size), last_active=time.time())
+            self._rooms_by_type.setdefault(game_type, set()).add(room_id)
+
+    def get_room(self, room_id):
+        # Copied under the lock; the live state keeps changing once it's released
+        with self._lock:
+            room = self._rooms.get(room_id)
+            return room.snapshot() if room else None
+
+    def room_game_type(self, room_id):
+        room = self._rooms.get(room_id)
+        return room.game_type if room else None
+
+    def rooms_for_game_type(self, game_type):
+        return list(self._rooms_by_type.get(game_type, ()))
+
+    def open_rooms(self, game_type):
+        """Listed rooms of a game type with free seats, as (room_id, free seats), fullest first."""
+        with self._lock:
+            rooms = [self._rooms[room_id] for room_id in self._rooms_by_type.get(game_type, ())]
+            free = [(room.id, room.max_players - len(room.members)) for room in rooms
+                    if room.listed and len(room.members) < room.max_players]
+        return sorted(free, key=lambda item: item[1])
+
+    def join_room(self, room_id, player_info):
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return ROOM_MISSING
+            if len(room.members) >= room.max_players:
+                return ROOM_FULL
+            room.members[player_info['id']] = player_info['username']
+            return JOINED
+
+    def leave_room(self, room_id, player_id):
+        """Remove a player and delete the room once empty. Returns the number of players left."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return 0
+            room.members.pop(player_id, None)
+            if not room.members:
+                del self._rooms[room_id]
+                same_type = self._rooms_by_type.get(room.game_type)
+                if same_type is not None:
+                    same_type.discard(room_id)
+                    if not same_type:
+                        del self._rooms_by_type[room.game_type]
+            return len(room.members)
+
+    # Room activity, shared by every worker's reaper
+
+    def touch_rooms(self, activity):
+        """Record activity as {room_id: timestamp}; rooms keep their latest timestamp."""
+        with self._lock:
+            for room_id, timestamp in activity.items():
+                room = self._rooms.get(room_id)
+                if room is not None and timestamp > room.last_active:
+                    room.last_active = timestamp
+
+    def claim_idle_rooms(self, cutoff, now):
+        """Rooms with no activity since ``cutoff``, marked active at ``now`` so only one caller gets each."""
+        with self._lock:
+            idle = [room.id for room in self._rooms.values() if room.last_active < cutoff]
+            for room_id in idle:
+                self._rooms[room_id].last_active = now
+            return idle
+
+    # Versioned game state
+
+    def set_game_state(self, room_id, game_state):
+        """Replace the whole state. Returns the new version, or None if the room is gone."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return None
+            # The caller's dict is also queued for broadcast, so keep a copy of our own
+            room.game_state = copy.deepcopy(game_state)
+            room.state_version += 1
+            # Older deltas can't be replayed across a full replacement
+            room.deltas.clear()
+            return room.state_version
+
+    def patch_game_state(self, room_id, base_version, ops):
+        """Apply JSON-patch ops. Returns (version, error); error is None on success."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return None, 'Invalid room ID'
+            if base_version is not None and base_version != room.state_version:
+                return room.state_version, 'Version conflict'
+            try:
+                room.game_state = apply_patch_atomic(room.game_state, ops)
+            except PatchError as e:
+                return room.state_version, str(e)
+            room.state_version += 1
+            room.deltas.append((room.state_version, copy.deepcopy(ops)))
+            return room.state_version, None
+
+    def state_since(self, room_id, since):
+        """Deltas after version ``since`` if still logged, otherwise a full snapshot."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return None
+            deltas = None if since is None else _deltas_since(room.deltas, since, room.state_version)
+            if deltas is None:
+                return {'state_version': room.state_version, 'game_state': copy.deepcopy(room.game_state)}
+            return {'state_version': room.state_version, 'deltas': deltas}
+
+class SqliteRoomRegistry:
+    """Rooms and players in a local SQLite file shared by every worker on the host.
+
+    Membership changes run inside ``BEGIN IMMEDIATE`` transactions so two
+    workers can't both take the last seat in a room.
+    """
+
+    GAME_TYPE_CACHE_SIZE = 10000
+
+    def __init__(self, path, delta_log_size=256):
+        self.path = path
+        self.delta_log_size = delta_log_size
+        self._local = threading.local()
+        self._game_types = {}
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS room (
+                id TEXT PRIMARY KEY,
+                game_type TEXT NOT NULL,
+                max_players INTEGER NOT NULL,
+                listed INTEGER NOT NULL DEFAULT 0,
+                game_state TEXT NOT NULL DEFAULT '{}',
+                state_version INTEGER NOT NULL DEFAULT 0,
+                last_active REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS room_player (
+                room_id TEXT NOT NULL,
+                player_id TEXT NOT NULL,
+                username TEXT NOT NULL,
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                UNIQUE (room_id, player_id)
+            );
+            CREATE TABLE IF NOT EXISTS player (
+                sid TEXT PRIMARY KEY,
+                player_id TEXT NOT NULL,
+                username TEXT NOT NULL,
+                room_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_player_player_id ON player (player_id);
+            CREATE INDEX IF NOT EXISTS ix_room_game_type ON room (game_type);
+            CREATE TABLE IF NOT EXISTS room_delta (
+                room_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                ops TEXT NOT NULL,
+                PRIMARY KEY (room_id, version)
+            );
+        """)
+        # Registry files created by older versions lack these columns
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(room)")}
+        if 'state_version' not in columns:
+            connection.execute("ALTER TABLE room ADD COLUMN state_version INTEGER NOT NULL DEFAULT 0")
+        if 'listed' not in columns:
+            connection.execute("ALTER TABLE room ADD COLUMN listed INTEGER NOT NULL DEFAULT 0")
+        if 'last_active' not in columns:
+            # Existing rooms get a full timeout from now rather than being reaped on the spot
+            connection.execute("ALTER TABLE room ADD COLUMN last_active REAL NOT NULL DEFAULT 0")
+            connection.execute("UPDATE room SET last_active = ?", (time.time(),))
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_room_last_active ON room (last_active)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads (or forked workers)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        # Commit only if the block completes; anything raised rolls back its partial writes
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    # Players
+
+    def add_player(self, sid, player_id, username='Anonymous'):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO player (sid, player_id, username, room_id) VALUES (?, ?, ?, NULL)",
+            (sid, player_id, username))
+
+    def get_player(self, sid):
+        row = self._connection().execute(
+            "SELECT player_id, username, room_id FROM player WHERE sid = ?", (sid,)).fetchone()
+        if row is None:
+            return None
+        return Player(sid, row[0], row[1], row[2])
+
+    def player_sid(self, player_id):
+        row = self._connection().execute("SELECT sid FROM player WHERE player_id = ?", (player_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_username(self, sid, username):
+        self._connection().execute("UPDATE player SET username = ? WHERE sid = ?", (username, sid))
+
+    def set_player_room(self, sid, room_id):
+        self._connection().execute("UPDATE player SET room_id = ? WHERE sid = ?", (room_id, sid))
+
+    def remove_player(self, sid):
+        player = self.get_player(sid)
+        self._connection().execute("DELETE FROM player WHERE sid = ?", (sid,))
+        return player
+
+    # Rooms
+
+    def create_room(self, room_id, game_type, max_players, listed=False):
+        self._connection().execute(
+            "INSERT INTO room (id, game_type, max_players, listed, last_active) VALUES (?, ?, ?, ?, ?)",
+            (room_id, game_type, max_players, int(listed), time.time()))
+
+    def get_room(self, room_id):
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT id, game_type, max_players, listed, game_state, state_version FROM room WHERE id = ?",
+            (room_id,)).fetchone()
+        if row is None:
+            return None
+        players = connection.execute(
+            "SELECT player_id, username FROM room_player WHERE room_id = ? ORDER BY seq", (room_id,)).fetchall()
+        return {
+            'id': row[0],
+            'game_type': row[1],
+            'max_players': row[2],
+            'listed': bool(row[3]),
+            'players': [{'id': player_id, 'username': username} for player_id, username in players],
+            'game_state': json.loads(row[4]),
+            'state_version': row[5]
+        }
+
+    def room_game_type(self, room_id):
+        # A room's game type never changes, so it can be cached without invalidation
+        game_type = self._game_types.get(room_id)
+        if game_type is None:
+            row = self._connection().execute("SELECT game_type FROM room WHERE id = ?", (room_id,)).fetchone()
+            if row is None:
+                return None
+            if len(self._game_types) >= self.GAME_TYPE_CACHE_SIZE:
+                self._game_types.clear()
+            game_type = self._game_types[room_id] = row[0]
+        return game_type
+
+    def rooms_for_game_type(self, game_type):
+        return [row[0] for row in self._connection().execute(
+            "SELECT id FROM room WHERE game_type = ?", (game_type,))]
+
+    def open_rooms(self, game_type):
+        return [tuple(row) for row in self._connection().execute(
+            "SELECT room.id, room.max_players - COUNT(room_player.player_id) AS free "
+            "FROM room LEFT JOIN room_player ON room_player.room_id = room.id "
+            "WHERE room.game_type = ? AND room.listed = 1 "
+            "GROUP BY room.id HAVING free > 0 ORDER BY free", (game_type,))]
+
+    def join_room(self, room_id, player_info):
+        with self._transaction() as connection:
+            row = connection.execute("SELECT max_players FROM room WHERE id = ?", (room_id,)).fetchone()
+            if row is None:
+                return ROOM_MISSING
+            count = connection.execute(
+                "SELECT COUNT(*) FROM room_player WHERE room_id = ?", (room_id,)).fetchone()[0]
+            if count >= row[0]:
+                return ROOM_FULL
+            connection.execute("INSERT OR IGNORE INTO room_player (room_id, player_id, username) VALUES (?, ?, ?)",
+                               (room_id, player_info['id'], player_info['username']))
+            return JOINED
+
+    def leave_room(self, room_id, player_id):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM room_player WHERE room_id = ? AND player_id = ?", (room_id, player_id))
+            remaining = connection.execute(
+                "SELECT COUNT(*) FROM room_player WHERE room_id = ?", (room_id,)).fetchone()[0]
+            if not remaining:
+                connection.execute("DELETE FROM room WHERE id = ?", (room_id,))
+                connection.execute("DELETE FROM room_delta WHERE room_id = ?", (room_id,))
+            return remaining
+
+    # Room activity, shared by every worker's reaper
+
+    def touch_rooms(self, activity):
+        with self._transaction() as connection:
+            connection.executemany("UPDATE room SET last_active = MAX(last_active, ?) WHERE id = ?",
+                                   [(timestamp, room_id) for room_id, timestamp in activity.items()])
+
+    def claim_idle_rooms(self, cutoff, now):
+        # Claimed inside one transaction, so a room idle on every worker is reaped by exactly one
+        with self._transaction() as connection:
+            idle = [row[0] for row in connection.execute("SELECT id FROM room WHERE last_active < ?", (cutoff,))]
+            connection.executemany("UPDATE room SET last_active = ? WHERE id = ?", [(now, room_id) for room_id in idle])
+            return idle
+
+    # Versioned game state
+
+    def set_game_state(self, room_id, game_state):
+        with self._transaction() as connection:
+            row = connection.execute("SELECT state_version FROM room WHERE id = ?", (room_id,)).fetchone()
+            if row is None:
+                return None
+            version = row[0] + 1
+            connection.execute("UPDATE room SET game_state = ?, state_version = ? WHERE id = ?",
+                               (json.dumps(game_state), version, room_id))
+            connection.execute("DELETE FROM room_delta WHERE room_id = ?", (room_id,))
+            return version
+
+    def patch_game_state(self, room_id, base_version, ops):
+        with self._transaction() as connection:
+            row = connection.execute("SELECT game_state, state_version FROM room WHERE id = ?", (room_id,)).fetchone()
+            if row is None:
+                return None, 'Invalid room ID'
+            game_state, version = row
+            if base_version is not None and base_version != version:
+                return version, 'Version conflict'
+            try:
+                # Freshly decoded, so a failed patch leaves nothing half-applied
+                game_state = apply_patch(json.loads(game_state), ops)
+            except PatchError as e:
+                return version, str(e)
+            version += 1
+            connection.execute("UPDATE room SET game_state = ?, state_version = ? WHERE id = ?",
+                               (json.dumps(game_state), version, room_id))
+            connection.execute("INSERT INTO room_delta (room_id, version, ops) VALUES (?, ?, ?)",
+                               (room_id, version, json.dumps(ops)))
+            connection.execute("DELETE FROM room_delta WHERE room_id = ? AND version <= ?",
+                               (room_id, version - self.delta_log_size))
+            return version, None
+
+    def state_since(self, room_id, since):
+        connection = self._connection()
+        row = connection.execute("SELECT game_state, state_version FROM room WHERE id = ?", (room_id,)).fetchone()
+        if row is None:
+            return None
+        game_state, version = row
+        deltas = None
+        if since == version:
+            deltas = []
+        elif since is not None and since < version:
+            log = [(v, json.loads(ops)) for v, ops in connection.execute(
+                "SELECT version, ops FROM room_delta WHERE room_id = ? AND version > ? ORDER BY version",
+                (room_id, since))]
+            if log and log[0][0] == since + 1:
+                deltas = [{'version': v, 'ops': ops} for v, ops in log]
+        if deltas is None:
+            return {'state_version': version, 'game_state': json.loads(game_state)}
+        return {'state_version': version, 'deltas': deltas}
+
+def create_registry(app):
+    """Build the registry selected by the ROOM_REGISTRY setting ('memory' or 'sqlite')."""
+    backend = app.config.get('ROOM_REGISTRY', 'memory')
+    if backend == 'sqlite':
+        path = app.config.get('ROOM_REGISTRY_PATH') or os.path.join(app.instance_path, 'rooms.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        logging.debug(f"Using shared room registry at {path}")
+        return SqliteRoomRegistry(path, app.config.get('ROOM_DELTA_LOG_SIZE', 256))
+    if backend != 'memory':
+        raise ValueError(f"Unknown ROOM_REGISTRY backend: {backend}")
+    if app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+        logging.warning("SOCKETIO_MESSAGE_QUEUE is set but rooms are kept per process; "
+                        "set ROOM_REGISTRY=sqlite when running more than one worker")
+    return MemoryRoomRegistry(app.config.get('ROOM_DELTA_LOG_SIZE', 256))
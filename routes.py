@@ -1,76 +1,47 @@
 import logging
-import os
 import json
 from datetime import datetime
-from flask import render_template, request, redirect, url_for, flash, jsonify, session, abort
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, abort, make_response
 from flask_login import login_user, logout_user, current_user, login_required
 from flask_socketio import SocketIO
-from werkzeug.utils import secure_filename
+from sqlalchemy import delete, func
+from sqlalchemy.orm import load_only
 from app import db
-from models import User, Game, Score, Rating, Comment, UserGame, GameCategory, UserGameRating, UserGameComment, UserGamePlay
+from models import (User, Game, Score, Rating, Comment, UserGame, GameCategory, UserGameRating, UserGameComment,
+                    UserGameStats, UserGamePlay, UserGamePlayRollup, UserGameTrend)
+from stats import bump_game_stats, bump_user_game_stats
+from leaderboard import leaderboards
+from ingest import score_buffer
+from pagination import keyset_page
+from cache import response_cache
+from thumbnails import thumbnails, thumbnail_url, ThumbnailError
+from gamecode import code_artifacts, game_code_url
+from plays import play_tracker, popular_games, MAX_DURATION
+from trending import trending
+import metrics
+
+MAX_BULK_SCORES = 500
 
 def register_routes(app):
-    # Initialize or update the game database
-    def initialize_games():
-        # Create a dictionary of all game entries we want in our database
-        game_definitions = {
-            "snake": {
-                "title": "Snake",
-                "description": "Classic Snake game. Eat food to grow longer, but don't hit the walls or yourself!",
-                "instructions": "Use arrow keys to control the snake. Eat the red food to grow. Avoid hitting walls and yourself.",
-            },
-            "pong": {
-                "title": "Pong",
-                "description": "The original arcade game. Play against the computer in this classic table tennis game.",
-                "instructions": "Use up and down arrow keys to move your paddle. Hit the ball past the computer's paddle to score.",
-            },
-            "platformer": {
-                "title": "Platformer",
-                "description": "Jump and run through a 2D platformer world, collecting coins and avoiding obstacles.",
-                "instructions": "Use arrow keys to move, spacebar to jump. Collect coins and reach the flag to win the level.",
-            },
-            "tetris": {
-                "title": "Tetris",
-                "description": "The famous puzzle game. Arrange falling tetrominoes to create complete lines and score points.",
-                "instructions": "Use arrow keys to move and rotate pieces. Left/right to move, up to rotate, down to soft drop, spacebar for hard drop.",
-            },
-            "flappybird": {
-                "title": "Flappy Bird",
-                "description": "Navigate a bird through a series of pipes without hitting them. Simple but challenging!",
-                "instructions": "Press spacebar or click/tap the screen to make the bird flap its wings and fly upward. Avoid hitting pipes and the ground.",
-            },
-            "fpsgame": {
-                "title": "2D Shooter Arena",
-                "description": "Multiplayer online FPS shooting game. Compete against other players in a 2D arena.",
-                "instructions": "Use WASD to move, mouse to aim and shoot. Collect power-ups and defeat other players to score points.",
-            }
-        }
-        
-        # Check each game type and add it if it doesn't exist
-        for game_type, game_info in game_definitions.items():
-            # Check if this game type already exists
-            existing_game = Game.query.filter_by(game_type=game_type).first()
-            
-            if not existing_game:
-                # If game doesn't exist, create it
-                new_game = Game(
-                    title=game_info["title"],
-                    description=game_info["description"],
-                    instructions=game_info["instructions"],
-                    game_type=game_type
-                )
-                db.session.add(new_game)
-                logging.debug(f"Added new game: {game_info['title']} ({game_type})")
-        
-        # Commit all changes at once
-        db.session.commit()
-        logging.debug("Games database updated")
+    leaderboards.init_app(app)
+    metrics.register('leaderboards', leaderboards.stats)
+    score_buffer.init_app(app)
+    response_cache.init_app(app)
+    metrics.register('score_ingest', score_buffer.stats)
+    metrics.register('response_cache', response_cache.stats)
+    thumbnails.init_app(app)
+    metrics.register('thumbnails', thumbnails.stats)
+    app.jinja_env.globals['thumbnail_url'] = thumbnail_url
+    code_artifacts.init_app(app)
+    metrics.register('game_code', code_artifacts.stats)
+    app.jinja_env.globals['game_code_url'] = game_code_url
+    play_tracker.init_app(app)
+    metrics.register('plays', play_tracker.stats)
+    trending.init_app(app)
+    metrics.register('trending', trending.stats)
     
-    # Call initialize_games function immediately
-    with app.app_context():
-        initialize_games()
-
     @app.route('/')
+    @response_cache.page('games', 'ratings')
     def index():
         featured_games = Game.query.limit(3).all()
         return render_template('index.html', games=featured_games)
@@ -106,6 +77,7 @@ def register_routes(app):
             user.set_password(password)
             db.session.add(user)
             db.session.commit()
+            response_cache.invalidate('users')
             
             flash('Registration successful! You can now log in.', 'success')
             return redirect(url_for('login'))
@@ -146,37 +118,70 @@ def register_routes(app):
     @app.route('/profile')
     @login_required
     def profile():
-        user_scores = Score.query.filter_by(user_id=current_user.id).order_by(Score.date.desc()).all()
-        user_ratings = Rating.query.filter_by(user_id=current_user.id).all()
-        user_comments = Comment.query.filter_by(user_id=current_user.id).order_by(Comment.date.desc()).all()
-        
-        # Group scores by game for better display
-        games_played = {}
-        for score in user_scores:
-            if score.game_id not in games_played:
-                games_played[score.game_id] = {
-                    'game': score.game,
-                    'high_score': score.score,
-                    'scores': [score]
-                }
-            else:
-                games_played[score.game_id]['scores'].append(score)
-                if score.score > games_played[score.game_id]['high_score']:
-                    games_played[score.game_id]['high_score'] = score.score
+        # Per-game summary in one grouped query instead of loading every score
+        games_played = (db.session.query(Game.id.label('game_id'),
+                                         Game.title.label('title'),
+                                         func.max(Score.score).label('high_score'),
+                                         func.count(Score.id).label('play_count'),
+                                         func.max(Score.date).label('last_played'))
+                        .join(Score, Score.game_id == Game.id)
+                        .filter(Score.user_id == current_user.id)
+                        .group_by(Game.id, Game.title)
+                        .order_by(func.max(Score.date).desc())
+                        .all())
+        
+        recent_scores, scores_cursor = keyset_page(_score_history(current_user.id), Score.date, Score.id, limit=5)
+        recent_comments, comments_cursor = keyset_page(_comment_history(current_user.id), Comment.date, Comment.id, limit=5)
         
         return render_template('profile.html', 
                                user=current_user, 
                                games_played=games_played,
-                               ratings=user_ratings,
-                               comments=user_comments,
-                               Score=Score)
+                               total_scores=sum(game.play_count for game in games_played),
+                               total_ratings=Rating.query.filter_by(user_id=current_user.id).count(),
+                               recent_scores=recent_scores,
+                               recent_comments=recent_comments,
+                               has_more_scores=scores_cursor is not None,
+                               has_more_comments=comments_cursor is not None)
+
+    def _score_history(user_id):
+        return (db.session.query(Score.id, Score.score, Score.date, Game.title.label('game_title'))
+                .join(Game, Game.id == Score.game_id)
+                .filter(Score.user_id == user_id))
+
+    def _comment_history(user_id):
+        return (db.session.query(Comment.id, Comment.content, Comment.date, Game.title.label('game_title'))
+                .join(Game, Game.id == Comment.game_id)
+                .filter(Comment.user_id == user_id))
+
+    @app.route('/api/profile/scores')
+    @login_required
+    def profile_scores_api():
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        rows, next_cursor = keyset_page(_score_history(current_user.id), Score.date, Score.id,
+                                        request.args.get('cursor'), limit)
+        return jsonify({
+            'items': [{'game': row.game_title, 'score': row.score, 'date': row.date.strftime('%Y-%m-%d %H:%M')}
+                      for row in rows],
+            'next_cursor': next_cursor
+        })
+
+    @app.route('/api/profile/comments')
+    @login_required
+    def profile_comments_api():
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        rows, next_cursor = keyset_page(_comment_history(current_user.id), Comment.date, Comment.id,
+                                        request.args.get('cursor'), limit)
+        return jsonify({
+            'items': [{'game': row.game_title, 'content': row.content, 'date': row.date.strftime('%Y-%m-%d %H:%M')}
+                      for row in rows],
+            'next_cursor': next_cursor
+        })
 
     @app.route('/games')
+    @response_cache.page('games', 'ratings', 'comments', 'scores')
     def games_list():
-        games = Game.query.all()
-        logging.debug(f"Games list query returned {len(games)} games:")
-        for game in games:
-            logging.debug(f"  - Game ID: {game.id}, Title: {game.title}, Type: {game.game_type}")
+        # The built-in catalog is small; just skip the columns the cards don't show
+        games = Game.query.options(load_only(Game.id, Game.title, Game.description, Game.game_type)).order_by(Game.id).all()
         return render_template('games_list.html', games=games)
 
     @app.route('/game/<int:game_id>')
@@ -189,7 +194,7 @@ def register_routes(app):
             user_rating = Rating.query.filter_by(user_id=current_user.id, game_id=game_id).first()
         
         # Get top scores for leaderboard
-        top_scores = Score.query.filter_by(game_id=game_id).order_by(Score.score.desc()).limit(10).all()
+        top_scores = leaderboards.top(game_id, 10)
         
         return render_template('game.html', 
                                game=game, 
@@ -211,20 +216,81 @@ def register_routes(app):
         if not game_id or not score_value:
             return jsonify({'success': False, 'message': 'Missing required data'})
         
+        try:
+            game_id = int(game_id)
+            score_value = int(score_value)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid score data'})
+        
+        if not db.session.get(Game, game_id):
+            return jsonify({'success': False, 'message': 'Unknown game'})
+        
+        # Queue for a batched insert; write directly if the buffer is off or full
+        if score_buffer.submit(current_user.id, current_user.username, game_id, score_value):
+            return jsonify({'success': True, 'message': 'Score submitted successfully'})
+        
         try:
             score = Score(
-                score=int(score_value),
+                score=score_value,
                 user_id=current_user.id,
-                game_id=int(game_id)
+                game_id=game_id
             )
             db.session.add(score)
+            bump_game_stats(score.game_id, score_count=1)
             db.session.commit()
+            leaderboards.record(score, current_user.username)
+            response_cache.invalidate('scores')
             return jsonify({'success': True, 'message': 'Score submitted successfully'})
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error submitting score: {str(e)}")
             return jsonify({'success': False, 'message': 'Error submitting score'})
 
+    @app.route('/api/scores', methods=['POST'])
+    @login_required
+    def submit_scores_bulk():
+        data = request.get_json(silent=True) or {}
+        entries = data.get('scores')
+        
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'success': False, 'message': 'A non-empty scores list is required'}), 400
+        
+        if len(entries) > MAX_BULK_SCORES:
+            return jsonify({'success': False, 'message': f'At most {MAX_BULK_SCORES} scores per request'}), 400
+        
+        valid_game_ids = {game_id for (game_id,) in db.session.query(Game.id)}
+        scores = []
+        for entry in entries:
+            try:
+                game_id = int(entry['game_id'])
+                score_value = int(entry['score'])
+                played_at = datetime.fromisoformat(entry['date']) if entry.get('date') else None
+            except (KeyError, TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Invalid score entry'}), 400
+            if game_id not in valid_game_ids:
+                return jsonify({'success': False, 'message': f'Unknown game {game_id}'}), 400
+            scores.append((game_id, score_value, played_at))
+        
+        queued = 0
+        for game_id, score_value, played_at in scores:
+            if score_buffer.submit(current_user.id, current_user.username, game_id, score_value, played_at):
+                queued += 1
+            else:
+                db.session.add(Score(score=score_value, user_id=current_user.id,
+                                     game_id=game_id, date=played_at or datetime.utcnow()))
+                bump_game_stats(game_id, score_count=1)
+        
+        if queued < len(scores):
+            try:
+                db.session.commit()
+                response_cache.invalidate('scores')
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error submitting scores: {str(e)}")
+                return jsonify({'success': False, 'message': 'Error submitting scores', 'queued': queued}), 500
+        
+        return jsonify({'success': True, 'accepted': len(scores), 'queued': queued})
+
     @app.route('/rate_game', methods=['POST'])
     @login_required
     def rate_game():
@@ -243,6 +309,7 @@ def register_routes(app):
             ).first()
             
             if existing_rating:
+                bump_game_stats(int(game_id), rating_sum=int(rating_value) - existing_rating.rating)
                 existing_rating.rating = int(rating_value)
                 flash('Rating updated successfully', 'success')
             else:
@@ -252,9 +319,11 @@ def register_routes(app):
                     game_id=int(game_id)
                 )
                 db.session.add(rating)
+                bump_game_stats(int(game_id), rating_sum=int(rating_value), rating_count=1)
                 flash('Rating submitted successfully', 'success')
                 
             db.session.commit()
+            response_cache.invalidate('ratings')
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error submitting rating: {str(e)}")
@@ -279,7 +348,9 @@ def register_routes(app):
                 game_id=int(game_id)
             )
             db.session.add(comment)
+            bump_game_stats(int(game_id), comment_count=1)
             db.session.commit()
+            response_cache.invalidate('comments')
             flash('Comment added successfully', 'success')
         except Exception as e:
             db.session.rollback()
@@ -289,20 +360,20 @@ def register_routes(app):
         return redirect(url_for('game', game_id=game_id))
 
     @app.route('/leaderboard')
+    @response_cache.page('games', 'scores', 'users')
     def leaderboard():
         games = Game.query.all()
         selected_game_id = request.args.get('game_id', type=int)
         
         if selected_game_id:
             selected_game = Game.query.get_or_404(selected_game_id)
-            top_scores = Score.query.filter_by(game_id=selected_game_id).order_by(Score.score.desc()).limit(20).all()
         else:
             selected_game = games[0] if games else None
-            top_scores = Score.query.filter_by(game_id=selected_game.id).order_by(Score.score.desc()).limit(20).all() if selected_game else []
+        top_scores = leaderboards.top(selected_game.id, 20) if selected_game else []
         
         # Get count statistics for the template
-        total_users = User.query.count()
-        total_scores = Score.query.count()
+        total_users = response_cache.fragment('total_users', ('users',), lambda: User.query.count())
+        total_scores = sum(game.score_count() for game in games)
         
         return render_template('leaderboard.html', 
                                games=games, 
@@ -311,6 +382,27 @@ def register_routes(app):
                                total_users=total_users,
                                total_scores=total_scores)
 
+    @app.route('/api/leaderboard/<int:game_id>')
+    def leaderboard_api(game_id):
+        Game.query.get_or_404(game_id)
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+        result = {
+            'game_id': game_id,
+            'top': [entry._asdict() for entry in leaderboards.top(game_id, limit)]
+        }
+        if current_user.is_authenticated:
+            radius = max(0, min(request.args.get('radius', 2, type=int), 25))
+            result['rank'] = leaderboards.rank(game_id, current_user.id)
+            result['around'] = [entry._asdict() for entry in leaderboards.around(game_id, current_user.id, radius)]
+        return jsonify(result)
+
+    @app.route('/admin/metrics')
+    @login_required
+    def admin_metrics():
+        if not current_user.is_admin:
+            abort(403)
+        return jsonify(metrics.snapshot())
+
     @app.errorhandler(404)
     def page_not_found(e):
         return render_template('404.html'), 404
@@ -321,43 +413,32 @@ def register_routes(app):
         
     # User-Generated Games Routes
     
-    # Setup upload folder for game thumbnails
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
-    
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
     def allowed_file(filename):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-        
-    # Initialize game categories if they don't exist
-    def initialize_categories():
-        categories = [
-            {'name': 'Arcade', 'description': 'Classic arcade-style games'},
-            {'name': 'Puzzle', 'description': 'Brain teasers and puzzle games'},
-            {'name': 'Action', 'description': 'Fast-paced action games'},
-            {'name': 'Adventure', 'description': 'Exploration and adventure games'},
-            {'name': 'Strategy', 'description': 'Strategic thinking games'}
-        ]
-        
-        for category_info in categories:
-            existing_category = GameCategory.query.filter_by(name=category_info['name']).first()
-            if not existing_category:
-                new_category = GameCategory(
-                    name=category_info['name'],
-                    description=category_info['description']
-                )
-                db.session.add(new_category)
-                logging.debug(f"Added new category: {category_info['name']}")
-        
-        db.session.commit()
-        logging.debug("Game categories initialized")
     
-    # Call initialize_categories function
-    with app.app_context():
-        initialize_categories()
+    def publish_code(game):
+        # Precompress now so the first play doesn't pay for it; a failure here is retried on first request
+        try:
+            code_artifacts.publish(game.code_hash, game.code)
+        except Exception as e:
+            logging.error(f"Error publishing code for game {game.id}: {str(e)}")
     
+    @app.route('/user-game-code/<digest>.js')
+    def user_game_code(digest):
+        response = code_artifacts.send(digest)
+        if response is None:
+            abort(404)
+        return response
+    
+    @app.route('/thumbnails/<digest>/<variant>')
+    def thumbnail(digest, variant):
+        response = thumbnails.send(digest, variant)
+        if response is None:
+            abort(404)
+        return response
+        
     @app.route('/create-game', methods=['GET', 'POST'])
     @login_required
     def create_game():
@@ -375,15 +456,16 @@ def register_routes(app):
                 flash('All fields except thumbnail are required', 'danger')
                 return render_template('create_game.html', categories=categories)
             
-            # Handle thumbnail upload
+            # Handle thumbnail upload; variants are rendered in the background
             thumbnail_path = None
             if 'thumbnail' in request.files:
                 thumbnail = request.files['thumbnail']
                 if thumbnail.filename and allowed_file(thumbnail.filename):
-                    filename = secure_filename(f"{current_user.username}_{int(datetime.now().timestamp())}_{thumbnail.filename}")
-                    filepath = os.path.join(UPLOAD_FOLDER, filename)
-                    thumbnail.save(filepath)
-                    thumbnail_path = f"uploads/{filename}"
+                    try:
+                        thumbnail_path = thumbnails.save(thumbnail)
+                    except ThumbnailError as e:
+                        flash(str(e), 'danger')
+                        return render_template('create_game.html', categories=categories)
             
             # Create new user game
             try:
@@ -394,11 +476,14 @@ def register_routes(app):
                     code=game_code,
                     thumbnail=thumbnail_path,
                     user_id=current_user.id,
-                    category_id=category_id if category_id else None
+                    category_id=category_id if category_id else None,
+                    stats=UserGameStats()
                 )
                 
                 db.session.add(new_game)
                 db.session.commit()
+                response_cache.invalidate('user_games')
+                publish_code(new_game)
                 
                 flash('Your game has been submitted for review!', 'success')
                 return redirect(url_for('user_games'))
@@ -434,21 +519,16 @@ def register_routes(app):
                 flash('All fields except thumbnail are required', 'danger')
                 return render_template('edit_game.html', game=game, categories=categories)
             
-            # Handle thumbnail upload
+            # Handle thumbnail upload; the old image may be shared, so the
+            # thumbnail garbage collector removes it once nothing refers to it
             if 'thumbnail' in request.files:
                 thumbnail = request.files['thumbnail']
                 if thumbnail.filename and allowed_file(thumbnail.filename):
-                    # Remove old thumbnail if it exists
-                    if game.thumbnail:
-                        old_filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
-                                                 'static', game.thumbnail)
-                        if os.path.exists(old_filepath):
-                            os.remove(old_filepath)
-                    
-                    filename = secure_filename(f"{current_user.username}_{int(datetime.now().timestamp())}_{thumbnail.filename}")
-                    filepath = os.path.join(UPLOAD_FOLDER, filename)
-                    thumbnail.save(filepath)
-                    game.thumbnail = f"uploads/{filename}"
+                    try:
+                        game.thumbnail = thumbnails.save(thumbnail)
+                    except ThumbnailError as e:
+                        flash(str(e), 'danger')
+                        return render_template('edit_game.html', game=game, categories=categories)
             
             # Update game details
             try:
@@ -465,6 +545,9 @@ def register_routes(app):
                     game.is_featured = 'is_featured' in request.form
                 
                 db.session.commit()
+                response_cache.invalidate('user_games')
+                publish_code(game)
+                trending.update_listing(game)
                 
                 flash('Game updated successfully!', 'success')
                 return redirect(url_for('user_game', game_id=game.id))
@@ -476,25 +559,116 @@ def register_routes(app):
                 
         return render_template('edit_game.html', game=game, categories=categories)
     
+    USER_GAMES_PER_PAGE = 24
+
+    def _user_game_cards(include_unpublished=False, category_id=None):
+        # Only what a listing card shows; code and instructions stay in the database
+        query = (db.session.query(UserGame.id, UserGame.title, func.substr(UserGame.description, 1, 200).label('description'),
+                                  UserGame.thumbnail, UserGame.date_created, UserGame.is_published, UserGame.is_featured,
+                                  User.username.label('creator'), GameCategory.name.label('category'),
+                                  UserGameStats.rating_sum, UserGameStats.rating_count, UserGameStats.play_count)
+                 .join(User, User.id == UserGame.user_id)
+                 .outerjoin(GameCategory, GameCategory.id == UserGame.category_id)
+                 .outerjoin(UserGameStats, UserGameStats.game_id == UserGame.id))
+        if not include_unpublished:
+            query = query.filter(UserGame.is_published == True)
+        if category_id:
+            query = query.filter(UserGame.category_id == category_id)
+        return query
+
+    def _user_game_page(include_unpublished=False, category_id=None, limit=USER_GAMES_PER_PAGE):
+        return keyset_page(_user_game_cards(include_unpublished, category_id), UserGame.date_created, UserGame.id,
+                           request.args.get('cursor'), limit)
+
     @app.route('/user-games')
+    @response_cache.page('user_games')
     def user_games():
-        # Get published games or all games if user is admin
-        if current_user.is_authenticated and current_user.is_admin:
-            games = UserGame.query.order_by(UserGame.date_created.desc()).all()
-        else:
-            games = UserGame.query.filter_by(is_published=True).order_by(UserGame.date_created.desc()).all()
-        
-        # Get featured games for the carousel
-        featured_games = UserGame.query.filter_by(is_published=True, is_featured=True).limit(5).all()
+        # Published games, or all games if user is admin, one page at a time
+        category_id = request.args.get('category', type=int)
+        is_admin = current_user.is_authenticated and current_user.is_admin
+        games, next_cursor = _user_game_page(is_admin, category_id)
+        
+        # Trending games for the carousel, topped up with hand-featured ones while
+        # there's too little activity to rank
+        featured_games = _ranked_cards(trending.top('trending', 5, category_id))
+        if len(featured_games) < 5:
+            shown = [game.id for game in featured_games]
+            featured_games += (_user_game_cards(category_id=category_id)
+                               .filter(UserGame.is_featured == True, UserGame.id.notin_(shown))
+                               .order_by(UserGame.date_created.desc()).limit(5 - len(shown)).all())
+        top_rated_games = _ranked_cards(trending.top('top_rated', 5, category_id))
         
         # Get categories for filtering
         categories = GameCategory.query.all()
         
         return render_template('user_games.html', 
                               games=games, 
+                              next_cursor=next_cursor,
+                              category_id=category_id,
                               featured_games=featured_games, 
+                              top_rated_games=top_rated_games,
                               categories=categories)
     
+    def _ranked_cards(ranked):
+        # Order from an in-memory ranking's [(game_id, score)], the cards from one query by id
+        ranked = dict(ranked)
+        cards = _user_game_cards().filter(UserGame.id.in_(list(ranked))).all() if ranked else []
+        cards.sort(key=lambda game: ranked[game.id], reverse=True)
+        return cards
+    
+    def _card_json(game):
+        return {
+            'id': game.id,
+            'title': game.title,
+            'description': game.description,
+            'thumbnail': thumbnail_url(game.thumbnail),
+            'creator': game.creator,
+            'category': game.category,
+            'rating': round(game.rating_sum / game.rating_count, 2) if game.rating_count else 0,
+            'plays': game.play_count or 0,
+            'featured': game.is_featured,
+            'published': game.is_published,
+            'date': game.date_created.strftime('%Y-%m-%d'),
+            'url': url_for('user_game', game_id=game.id),
+        }
+    
+    @app.route('/api/user-games')
+    @response_cache.page('user_games')
+    def user_games_api():
+        limit = max(1, min(request.args.get('limit', USER_GAMES_PER_PAGE, type=int), 100))
+        is_admin = current_user.is_authenticated and current_user.is_admin
+        games, next_cursor = _user_game_page(is_admin, request.args.get('category', type=int), limit)
+        return jsonify({
+            'items': [_card_json(game) for game in games],
+            'next_cursor': next_cursor
+        })
+    
+    @app.route('/api/user-games/popular')
+    @response_cache.page('user_games')
+    def popular_user_games_api():
+        # Most played over the last ?days=7, read from the daily play rollups
+        days = max(1, min(request.args.get('days', 7, type=int), 90))
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+        plays = dict(popular_games(days, limit))
+        cards = _user_game_cards().filter(UserGame.id.in_(list(plays))).all()
+        cards.sort(key=lambda game: plays[game.id], reverse=True)
+        return jsonify({'days': days,
+                        'items': [dict(_card_json(game), recent_plays=plays[game.id]) for game in cards]})
+    
+    @app.route('/api/user-games/trending')
+    @response_cache.page('user_games')
+    def trending_user_games_api():
+        # ?ranking=trending (default) or top_rated, optionally within one ?category
+        ranking = request.args.get('ranking', 'trending')
+        if ranking not in trending.half_lives:
+            return jsonify({'error': 'Unknown ranking'}), 400
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+        category_id = request.args.get('category', type=int)
+        ranked = dict(trending.top(ranking, limit, category_id))
+        cards = _ranked_cards(ranked.items())
+        return jsonify({'ranking': ranking,
+                        'items': [dict(_card_json(game), score=ranked[game.id]) for game in cards]})
+    
     @app.route('/user-game/<int:game_id>')
     def user_game(game_id):
         game = UserGame.query.get_or_404(game_id)
@@ -510,22 +684,24 @@ def register_routes(app):
         
         # Get user rating if logged in
         user_rating = None
+        play_token = None
         if current_user.is_authenticated:
             user_rating = UserGameRating.query.filter_by(user_id=current_user.id, game_id=game_id).first()
             
-            # Record play if user is not the creator
+            # Record play if user is not the creator; it's written in the background.
+            # Pass the token on as ?play=<token> to the play page so its beacon can report the duration.
             if current_user.id != game.user_id:
                 try:
-                    play = UserGamePlay(user_id=current_user.id, game_id=game_id)
-                    db.session.add(play)
-                    db.session.commit()
-                except:
-                    db.session.rollback()
+                    play_token = play_tracker.record(current_user.id, game_id)
+                    trending.record_play(game_id)
+                except Exception as e:
+                    logging.error(f"Error recording play: {str(e)}")
         
         return render_template('user_game.html', 
                               game=game, 
                               comments=comments, 
-                              user_rating=user_rating)
+                              user_rating=user_rating,
+                              play_token=play_token)
     
     @app.route('/play-user-game/<int:game_id>')
     def play_user_game(game_id):
@@ -537,7 +713,29 @@ def register_routes(app):
             flash('This game is not published yet', 'warning')
             return redirect(url_for('user_games'))
         
-        return render_template('play_user_game.html', game=game)
+        # The page only changes with the game or the viewer, and the code it
+        # loads is immutable, so a repeat play is a single 304
+        viewer = current_user.id if current_user.is_authenticated else 0
+        etag = f"{game.id}-{game.code_hash}-{game.date_updated.timestamp() if game.date_updated else 0}-{viewer}"
+        if request.if_none_match.contains(etag) and not session.get('_flashes'):
+            response = make_response('', 304)
+        else:
+            response = make_response(render_template('play_user_game.html', game=game))
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    
+    @app.route('/api/user-game-plays/duration', methods=['POST'])
+    @login_required
+    def play_duration_beacon():
+        # Sent with navigator.sendBeacon when the play page is left (see main.js)
+        token = request.form.get('token', '')
+        duration = request.form.get('duration', type=int)
+        if len(token) != 32 or duration is None or not 0 <= duration <= MAX_DURATION:
+            return jsonify({'error': 'Invalid play duration'}), 400
+        play_tracker.set_duration(token, current_user.id, duration)
+        return '', 204
     
     @app.route('/rate-user-game', methods=['POST'])
     @login_required
@@ -556,7 +754,9 @@ def register_routes(app):
                 game_id=int(game_id)
             ).first()
             
+            previous = existing_rating.rating if existing_rating else None
             if existing_rating:
+                bump_user_game_stats(int(game_id), rating_sum=int(rating_value) - existing_rating.rating)
                 existing_rating.rating = int(rating_value)
                 flash('Rating updated successfully', 'success')
             else:
@@ -566,9 +766,12 @@ def register_routes(app):
                     game_id=int(game_id)
                 )
                 db.session.add(rating)
+                bump_user_game_stats(int(game_id), rating_sum=int(rating_value), rating_count=1)
                 flash('Rating submitted successfully', 'success')
                 
             db.session.commit()
+            response_cache.invalidate('user_games')
+            trending.record_rating(int(game_id), int(rating_value), previous)
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error submitting rating: {str(e)}")
@@ -593,7 +796,10 @@ def register_routes(app):
                 game_id=int(game_id)
             )
             db.session.add(comment)
+            bump_user_game_stats(int(game_id), comment_count=1)
             db.session.commit()
+            response_cache.invalidate('user_games')
+            trending.record_comment(int(game_id))
             flash('Comment added successfully', 'success')
         except Exception as e:
             db.session.rollback()
@@ -609,8 +815,20 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
             
-        games = UserGame.query.order_by(UserGame.date_created.desc()).all()
-        return render_template('admin_games.html', games=games)
+        # Review queue: ?status=pending (unpublished), published, or everything by default
+        status = request.args.get('status')
+        query = _user_game_cards(include_unpublished=True, category_id=request.args.get('category', type=int))
+        if status in ('pending', 'published'):
+            query = query.filter(UserGame.is_published == (status == 'published'))
+        games, next_cursor = keyset_page(query, UserGame.date_created, UserGame.id, request.args.get('cursor'), 50)
+        return render_template('admin_games.html', games=games, next_cursor=next_cursor, status=status)
+    
+    def _delete_user_game(game):
+        # Rows that reference the game go in the same transaction; the stats row cascades
+        for model in (UserGamePlayRollup, UserGameTrend, UserGamePlay, UserGameRating, UserGameComment):
+            db.session.execute(delete(model).where(model.game_id == game.id))
+        db.session.delete(game)
+        trending.log_deletion(game.id)
     
     @app.route('/admin/review-game/<int:game_id>', methods=['GET', 'POST'])
     @login_required
@@ -641,9 +859,15 @@ def register_routes(app):
                 db.session.commit()
                 flash('Game removed from featured list', 'info')
             elif action == 'delete':
-                db.session.delete(game)
+                _delete_user_game(game)
                 db.session.commit()
+                trending.remove(game.id)
                 flash('Game deleted', 'warning')
+                response_cache.invalidate('user_games')
                 return redirect(url_for('admin_games'))
+            
+            if action in ('approve', 'reject', 'feature', 'unfeature'):
+                response_cache.invalidate('user_games')
+                trending.update_listing(game)
                 
         return render_template('admin_review_game.html', game=game)
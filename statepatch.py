@@ -0,0 +1,78 @@
+"""A small subset of JSON Patch (RFC 6902): add, replace and remove on JSON Pointer paths."""
+import copy
+
+OPERATIONS = ('add', 'replace', 'remove')
+
+class PatchError(ValueError):
+    pass
+
+def _parse_path(path):
+    if not isinstance(path, str) or not path.startswith('/'):
+        raise PatchError(f"Invalid path: {path!r}")
+    return [part.replace('~1', '/').replace('~0', '~') for part in path[1:].split('/')]
+
+def _list_index(container, part, allow_end):
+    if allow_end and part == '-':
+        return len(container)
+    if not part.isdigit():
+        raise PatchError(f"Invalid list index: {part!r}")
+    index = int(part)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"List index out of range: {index}")
+    return index
+
+def apply_patch(state, ops):
+    """Apply ``ops`` to ``state`` in place and return it.
+
+    Raises PatchError if any operation is malformed or its path doesn't
+    exist. Ops are validated one by one, so callers that need all-or-nothing
+    semantics should apply to a copy. Values are copied in, so the state
+    never shares objects with the ops.
+    """
+    if not isinstance(ops, list):
+        raise PatchError("Patch must be a list of operations")
+    for op in ops:
+        if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+            raise PatchError(f"Unsupported operation: {op!r}")
+        parts = _parse_path(op.get('path'))
+        if op['op'] != 'remove' and 'value' not in op:
+            raise PatchError(f"Missing value for {op['op']} at {op['path']}")
+
+        target = state
+        for part in parts[:-1]:
+            if isinstance(target, list):
+                target = target[_list_index(target, part, False)]
+            elif isinstance(target, dict) and part in target:
+                target = target[part]
+            else:
+                raise PatchError(f"Path not found: {op['path']}")
+
+        last = parts[-1]
+        if isinstance(target, list):
+            index = _list_index(target, last, op['op'] == 'add')
+            if op['op'] == 'add':
+                target.insert(index, copy.deepcopy(op['value']))
+            elif op['op'] == 'replace':
+                target[index] = copy.deepcopy(op['value'])
+            else:
+                del target[index]
+        elif isinstance(target, dict):
+            if op['op'] != 'add' and last not in target:
+                raise PatchError(f"Path not found: {op['path']}")
+            if op['op'] == 'remove':
+                del target[last]
+            else:
+                target[last] = copy.deepcopy(op['value'])
+        else:
+            raise PatchError(f"Path not found: {op['path']}")
+    return state
+
+def apply_patch_atomic(state, ops):
+    """Apply ``ops`` all-or-nothing and return the resulting state.
+
+    A single op fails before it mutates anything, so it is applied in place;
+    longer patches are applied to a copy that replaces the state on success.
+    """
+    if isinstance(ops, list) and len(ops) == 1:
+        return apply_patch(state, ops)
+    return apply_patch(copy.deepcopy(state), ops)
@@ -1,4 +1,9 @@
 // 2D FPS Multiplayer Game Implementation with Phaser 3
+//
+// Other players are synced through GameSocket (static/js/multiplayer.js):
+// the game joins a match and exchanges 'move' and 'shoot' game actions,
+// which arrive batched in 'game_frame' events for ticked rooms. Without
+// the multiplayer client loaded it plays against the simulated enemies only.
 
 class FPSGame {
     constructor(containerId, gameId) {
@@ -18,6 +23,12 @@ class FPSGame {
         this.playerSpeed = 200;
         this.lastFired = 0;
         this.fireRate = 200; // milliseconds between shots
+        this.socket = null;
+        this.roomId = null;
+        this.remotePlayers = {};
+        this.sendInterval = 50; // milliseconds between position updates
+        this.lastSent = 0;
+        this.lastSentPosition = null;
     }
 
     init() {
@@ -172,6 +183,88 @@ class FPSGame {
         // Set camera to follow player
         scene.cameras.main.startFollow(this.player);
         scene.cameras.main.setZoom(1);
+
+        // Join other players online
+        this.connect(scene);
+    }
+
+    connect(scene) {
+        if (!window.GameSocket || typeof io === 'undefined') return;
+
+        this.socket = GameSocket.connect();
+
+        // Sent on every (re)connect with the id the server knows us by
+        this.socket.on('connected', (data) => {
+            this.playerId = data.player_id;
+            this.socket.emit('find_match', { game_type: 'fpsgame' });
+        });
+
+        this.socket.on('match_found', (room) => {
+            this.roomId = room.room_id;
+            room.players.forEach((player) => this.addRemotePlayer(scene, player));
+        });
+
+        this.socket.on('player_joined', (player) => this.addRemotePlayer(scene, player));
+        this.socket.on('player_left', (data) => this.removeRemotePlayer(data.player_id));
+
+        // Ticked rooms send a frame of actions; other rooms send each action
+        this.socket.on('game_frame', (frame) => {
+            frame.actions.forEach((action) => this.applyRemoteAction(scene, action));
+        });
+        this.socket.on('game_action', (action) => this.applyRemoteAction(scene, action));
+
+        this.socket.on('room_closed', () => {
+            this.roomId = null;
+            Object.keys(this.remotePlayers).forEach((id) => this.removeRemotePlayer(id));
+        });
+    }
+
+    sendAction(action, data) {
+        if (this.socket && this.roomId) {
+            this.socket.emit('game_action', { room_id: this.roomId, action: action, data: data });
+        }
+    }
+
+    addRemotePlayer(scene, player) {
+        if (player.id === this.playerId || this.remotePlayers[player.id]) return;
+
+        // Placed off screen until their first move arrives
+        const sprite = scene.add.sprite(-100, -100, 'enemy');
+        sprite.setTint(0xffaa00); // Orange tint for other players
+        const name = scene.add.text(-100, -120, player.username || 'Player', {
+            fontSize: '16px',
+            fontFamily: 'Arial',
+            fill: '#ffaa00',
+            stroke: '#000000',
+            strokeThickness: 3
+        });
+        name.setOrigin(0.5);
+
+        this.remotePlayers[player.id] = { sprite: sprite, name: name };
+    }
+
+    removeRemotePlayer(playerId) {
+        const remote = this.remotePlayers[playerId];
+        if (!remote) return;
+
+        remote.sprite.destroy();
+        remote.name.destroy();
+        delete this.remotePlayers[playerId];
+    }
+
+    applyRemoteAction(scene, action) {
+        if (action.player_id === this.playerId) return;
+
+        const remote = this.remotePlayers[action.player_id];
+        if (!remote) return;
+
+        if (action.action === 'move') {
+            remote.sprite.setPosition(action.data.x, action.data.y);
+            remote.name.setPosition(action.data.x, action.data.y - 20);
+        } else if (action.action === 'shoot') {
+            // Each client applies hits to its own player
+            this.fireEnemyBullet(scene, action.data.x, action.data.y, action.data.angle);
+        }
     }
 
     createBoundaries(scene) {
@@ -292,29 +385,33 @@ class FPSGame {
                 const dy = this.player.y - enemy.y;
                 const angle = Math.atan2(dy, dx);
                 
-                // Create bullet
-                const bullet = scene.physics.add.sprite(enemy.x, enemy.y, 'bullet');
-                bullet.setTint(0xff0000); // Red bullets for enemies
-                bullet.isEnemyBullet = true;
-                
-                // Set bullet velocity
-                bullet.setVelocity(
-                    Math.cos(angle) * this.projectileSpeed,
-                    Math.sin(angle) * this.projectileSpeed
-                );
-                
-                // Set bullet rotation to match direction
-                bullet.rotation = angle;
-                
-                // Add collision with player
-                scene.physics.add.overlap(bullet, this.player, this.playerHit, null, this);
-                
-                // Destroy bullet after 2 seconds
-                scene.time.delayedCall(2000, () => {
-                    if (bullet.active) {
-                        bullet.destroy();
-                    }
-                });
+                this.fireEnemyBullet(scene, enemy.x, enemy.y, angle);
+            }
+        });
+    }
+
+    fireEnemyBullet(scene, x, y, angle) {
+        // Create bullet
+        const bullet = scene.physics.add.sprite(x, y, 'bullet');
+        bullet.setTint(0xff0000); // Red bullets for enemies
+        bullet.isEnemyBullet = true;
+        
+        // Set bullet velocity
+        bullet.setVelocity(
+            Math.cos(angle) * this.projectileSpeed,
+            Math.sin(angle) * this.projectileSpeed
+        );
+        
+        // Set bullet rotation to match direction
+        bullet.rotation = angle;
+        
+        // Add collision with player
+        scene.physics.add.overlap(bullet, this.player, this.playerHit, null, this);
+        
+        // Destroy bullet after 2 seconds
+        scene.time.delayedCall(2000, () => {
+            if (bullet.active) {
+                bullet.destroy();
             }
         });
     }
@@ -546,6 +643,8 @@ class FPSGame {
                     bullet.setActive(false).setVisible(false);
                 }
             });
+            
+            this.sendAction('shoot', { x: Math.round(this.player.x), y: Math.round(this.player.y), angle: angle });
         }
     }
 
@@ -578,6 +677,17 @@ class FPSGame {
         // Update position of player container to follow player
         this.playerContainer.setPosition(this.player.x, this.player.y);
         
+        // Send our position to the room while it changes
+        const now = this.game.scene.scenes[0].time.now;
+        const x = Math.round(this.player.x);
+        const y = Math.round(this.player.y);
+        const moved = !this.lastSentPosition || this.lastSentPosition.x !== x || this.lastSentPosition.y !== y;
+        if (moved && now >= this.lastSent + this.sendInterval) {
+            this.lastSent = now;
+            this.lastSentPosition = { x: x, y: y };
+            this.sendAction('move', { x: x, y: y, vx: this.player.body.velocity.x, vy: this.player.body.velocity.y });
+        }
+        
         // Update positions of enemy name containers
         this.enemies.getChildren().forEach((enemy) => {
             if (enemy.nameContainer && enemy.active) {
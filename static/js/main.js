@@ -142,4 +142,20 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
     }
+
+    // Report how long a user game was played when the player leaves the page
+    const playBeacon = document.querySelector('[data-play-beacon]');
+    const playToken = new URLSearchParams(window.location.search).get('play');
+    if (playBeacon && playToken && navigator.sendBeacon) {
+        const startedAt = Date.now();
+        let reported = false;
+        window.addEventListener('pagehide', function() {
+            if (reported) return;
+            reported = true;
+            const data = new FormData();
+            data.append('token', playToken);
+            data.append('duration', Math.round((Date.now() - startedAt) / 1000));
+            navigator.sendBeacon(playBeacon.getAttribute('data-play-beacon'), data);
+        });
+    }
 });
@@ -0,0 +1,125 @@
+// Socket.IO connection helper for multiplayer games
+//
+// GameSocket.connect() returns a Socket.IO client socket. When the MessagePack
+// library is loaded (global MessagePack), it asks the server for MessagePack
+// frames in the connect auth and installs a parser that reads both JSON text
+// and MessagePack binary frames. The server confirms the format it picked in
+// the 'connected' event; until then, and whenever it picked JSON, packets are
+// sent as JSON text. {binary: false} keeps the connection on JSON. Without the
+// library, the default JSON parser is used.
+
+(function () {
+    class Emitter {
+        constructor() {
+            this.listeners = {};
+        }
+
+        on(event, fn) {
+            (this.listeners[event] = this.listeners[event] || []).push(fn);
+            return this;
+        }
+
+        off(event, fn) {
+            if (!event) {
+                this.listeners = {};
+            } else if (!fn) {
+                delete this.listeners[event];
+            } else if (this.listeners[event]) {
+                this.listeners[event] = this.listeners[event].filter((listener) => listener !== fn);
+            }
+            return this;
+        }
+
+        emit(event, ...args) {
+            (this.listeners[event] || []).slice().forEach((fn) => fn.apply(this, args));
+            return this;
+        }
+    }
+
+    // Sends MessagePack once the server has confirmed it for this connection
+    function encoderFor(format) {
+        return class Encoder {
+            encode(packet) {
+                if (!format.binary) {
+                    return [encodeText(packet)];
+                }
+                const message = { type: packet.type, data: packet.data, nsp: packet.nsp || '/' };
+                if (packet.id !== undefined) {
+                    message.id = packet.id;
+                }
+                return [MessagePack.encode(message)];
+            }
+        };
+    }
+
+    class Decoder extends Emitter {
+        add(chunk) {
+            const packet = typeof chunk === 'string' ? decodeText(chunk) : MessagePack.decode(new Uint8Array(chunk));
+            this.emit('decoded', packet);
+        }
+
+        destroy() {
+            this.off();
+        }
+    }
+
+    // Default Socket.IO text format: <type>[<nsp>,][<id>][<json data>]
+    function encodeText(packet) {
+        let text = String(packet.type);
+        if (packet.nsp && packet.nsp !== '/') {
+            text += packet.nsp + ',';
+        }
+        if (packet.id !== undefined) {
+            text += packet.id;
+        }
+        if (packet.data !== undefined) {
+            text += JSON.stringify(packet.data);
+        }
+        return text;
+    }
+
+    function decodeText(text) {
+        const packet = { type: Number(text.charAt(0)), nsp: '/' };
+        let index = 1;
+        if (text.charAt(index) === '/') {
+            const end = text.indexOf(',', index);
+            packet.nsp = text.substring(index, end === -1 ? text.length : end);
+            index = end === -1 ? text.length : end + 1;
+        }
+        const start = index;
+        while (index < text.length && text.charAt(index) >= '0' && text.charAt(index) <= '9') {
+            index++;
+        }
+        if (index > start) {
+            packet.id = Number(text.substring(start, index));
+        }
+        if (index < text.length) {
+            packet.data = JSON.parse(text.substring(index));
+        }
+        return packet;
+    }
+
+    window.GameSocket = {
+        binarySupported() {
+            return typeof MessagePack !== 'undefined';
+        },
+
+        connect(options = {}) {
+            const socketOptions = { transports: ['websocket'], ...(options.socketOptions || {}) };
+            if (!this.binarySupported() || options.binary === false) {
+                return io(options.url, socketOptions);
+            }
+            const format = { binary: false };
+            socketOptions.auth = { ...(socketOptions.auth || {}), packer: 'msgpack' };
+            socketOptions.parser = { Encoder: encoderFor(format), Decoder };
+            const socket = io(options.url, socketOptions);
+            socket.on('connected', (data) => {
+                format.binary = data.packer === 'msgpack';
+            });
+            socket.on('disconnect', () => {
+                format.binary = false;
+            });
+            return socket;
+        }
+    };
+})();
@@ -0,0 +1,87 @@
+import logging
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from cache import response_cache
+from models import (Game, GameStats, Score, Rating, Comment, UserGame, UserGameStats,
+                    UserGameRating, UserGameComment, UserGamePlayRollup)
+
+def increment(model, keys, deltas):
+    """Add deltas to the counters of the row with these key values, creating it if missing. The caller commits."""
+    # Increment counters in place so concurrent writers don't lose updates
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items()}
+    where = [getattr(model, name) == value for name, value in keys.items()]
+    result = db.session.execute(update(model).where(*where).values(**values))
+    if result.rowcount:
+        return
+    # No row yet. Another writer may be creating it right now, so insert with an
+    # ON CONFLICT clause that adds to its row instead of failing on the key
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(model).values(**keys, **deltas)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: getattr(model, name) + getattr(statement.excluded, name) for name in deltas}))
+
+def _bump(model, game_id, deltas):
+    increment(model, {'game_id': game_id}, deltas)
+
+def bump_game_stats(game_id, **deltas):
+    """Apply counter deltas to a game's stats row. The caller commits."""
+    _bump(GameStats, game_id, deltas)
+
+def bump_user_game_stats(game_id, **deltas):
+    """Apply counter deltas to a user game's stats row. The caller commits."""
+    _bump(UserGameStats, game_id, deltas)
+
+def _grouped(column, *aggregates):
+    return {row[0]: row[1:] for row in db.session.query(column, *aggregates).group_by(column)}
+
+def reconcile_stats():
+    """Recompute every stats row from the raw tables and fix any drift."""
+    ratings = _grouped(Rating.game_id, func.sum(Rating.rating), func.count(Rating.id))
+    comments = _grouped(Comment.game_id, func.count(Comment.id))
+    scores = _grouped(Score.game_id, func.count(Score.id))
+    existing = {s.game_id: s for s in GameStats.query.all()}
+    fixed = 0
+    for (game_id,) in db.session.query(Game.id):
+        rating_sum, rating_count = ratings.get(game_id, (0, 0))
+        expected = {
+            'rating_sum': rating_sum or 0,
+            'rating_count': rating_count,
+            'comment_count': comments.get(game_id, (0,))[0],
+            'score_count': scores.get(game_id, (0,))[0],
+        }
+        fixed += _apply(GameStats, existing.get(game_id), game_id, expected)
+
+    ratings = _grouped(UserGameRating.game_id, func.sum(UserGameRating.rating), func.count(UserGameRating.id))
+    comments = _grouped(UserGameComment.game_id, func.count(UserGameComment.id))
+    # Raw plays are pruned after a while, so count them from the daily rollups
+    plays = {game_id: (count,) for game_id, count in db.session.query(
+        UserGamePlayRollup.game_id, func.sum(UserGamePlayRollup.plays))
+        .filter(UserGamePlayRollup.period == 'day').group_by(UserGamePlayRollup.game_id)}
+    existing = {s.game_id: s for s in UserGameStats.query.all()}
+    for (game_id,) in db.session.query(UserGame.id):
+        rating_sum, rating_count = ratings.get(game_id, (0, 0))
+        expected = {
+            'rating_sum': rating_sum or 0,
+            'rating_count': rating_count,
+            'comment_count': comments.get(game_id, (0,))[0],
+            'play_count': plays.get(game_id, (0,))[0],
+        }
+        fixed += _apply(UserGameStats, existing.get(game_id), game_id, expected)
+
+    db.session.commit()
+    response_cache.invalidate('ratings', 'comments', 'scores', 'user_games')
+    logging.debug(f"Stats reconciled, {fixed} rows corrected")
+    return fixed
+
+def _apply(model, stats, game_id, expected):
+    if stats is None:
+        db.session.add(model(game_id=game_id, **expected))
+        return 1
+    changed = False
+    for name, value in expected.items():
+        if getattr(stats, name) != value:
+            setattr(stats, name, value)
+            changed = True
+    return 1 if changed else 0
@@ -0,0 +1,307 @@
+import csv
+import hashlib
+import io
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+from app import db
+from models import User, Game, GameCategory, GameCode, Score, Rating, Comment, UserGame, UserGamePlay
+from stats import reconcile_stats
+from plays import backfill_play_rollups
+from trending import rebuild_trending
+
+# Every generated row falls inside this window
+START = datetime(2024, 1, 1)
+SPAN = 365 * 24 * 3600
+
+# Row counts for a full production-sized load
+DEFAULT_COUNTS = {
+    'users': 100000,
+    'scores': 10000000,
+    'ratings': 1000000,
+    'comments': 1000000,
+    'user_games': 20000,
+    'plays': 2000000,
+}
+
+# Larger exponents concentrate more activity on the first (oldest) ids
+ACTIVITY_SKEW = 3.0
+
+def _skill(user_id):
+    # Cheap stable hash in [0, 1); the same player is equally good at every game
+    return ((user_id * 2654435761) & 0xffffffff) / 2 ** 32
+
+# Score distribution per game_type given a player's skill in [0, 1)
+SCORE_CURVES = {
+    'snake': lambda rng, skill: int(rng.lognormvariate(2.0 + skill, 0.6)) * 10,
+    'pong': lambda rng, skill: min(11, int(rng.betavariate(1 + 4 * skill, 2) * 12)),
+    'platformer': lambda rng, skill: int(rng.gammavariate(2 + 3 * skill, 400)),
+    'tetris': lambda rng, skill: int(rng.lognormvariate(7 + 2 * skill, 1.0)),
+    'flappybird': lambda rng, skill: int(rng.expovariate(1 / (3 + 30 * skill))),
+    'fpsgame': lambda rng, skill: int(rng.gammavariate(1 + 4 * skill, 3)) * 100,
+}
+
+def _default_curve(rng, skill):
+    return int(rng.lognormvariate(5 + skill, 1.0))
+
+WORDS = ("great fun hard easy love addictive boring classic controls music graphics level "
+         "score friends again best worst lag smooth retro challenge speed jump enemy boss").split()
+
+class Population:
+    """A contiguous id range whose low ids are the most active and the oldest."""
+
+    def __init__(self, first_id, count):
+        self.first_id = first_id
+        self.count = count
+
+    def pick(self, rng):
+        return self.first_id + int(self.count * rng.random() ** ACTIVITY_SKEW)
+
+    def created_at(self, row_id):
+        # Sign-ups accelerate over the window, so later ids arrive closer together
+        position = (row_id - self.first_id) / max(self.count, 1)
+        return START + timedelta(seconds=SPAN * min(max(position, 0.0), 1.0) ** 0.5)
+
+def _after(rng, moment):
+    # Activity leans towards the end of the window, as it does for a growing site
+    remaining = (START + timedelta(seconds=SPAN) - moment).total_seconds()
+    return moment + timedelta(seconds=remaining * rng.random() ** 0.5)
+
+def _text(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize() + '.'
+
+def generate_users(rng, users, password_hash):
+    for user_id in range(users.first_id, users.first_id + users.count):
+        yield {
+            'id': user_id,
+            'username': f"player{user_id}",
+            'email': f"player{user_id}@example.com",
+            'password_hash': password_hash,
+            'date_joined': users.created_at(user_id),
+            'is_admin': False,
+        }
+
+def generate_scores(rng, count, users, games):
+    game_ids = [game_id for game_id, _ in games]
+    curves = {game_id: SCORE_CURVES.get(game_type, _default_curve) for game_id, game_type in games}
+    # Earlier games are the more popular ones
+    weights = [1 / rank for rank in range(1, len(game_ids) + 1)]
+    cum_weights = [sum(weights[:i + 1]) for i in range(len(weights))]
+    for _ in range(count):
+        user_id = users.pick(rng)
+        game_id = rng.choices(game_ids, cum_weights=cum_weights)[0]
+        yield {
+            'score': curves[game_id](rng, _skill(user_id)),
+            'date': _after(rng, users.created_at(user_id)),
+            'user_id': user_id,
+            'game_id': game_id,
+        }
+
+def generate_ratings(rng, count, users, games):
+    # At most one rating per (user, game), so keep each pair with the probability that yields ``count``
+    game_ids = [game_id for game_id, _ in games]
+    probability = min(1.0, count / max(users.count * len(game_ids), 1))
+    # Each game has its own reputation; ratings lean positive
+    bias = {game_id: rng.uniform(-1, 1) for game_id in game_ids}
+    for user_id in range(users.first_id, users.first_id + users.count):
+        for game_id in game_ids:
+            if rng.random() >= probability:
+                continue
+            yield {
+                'rating': min(5, max(1, round(rng.gauss(3.8 + bias[game_id], 1.0)))),
+                'date': _after(rng, users.created_at(user_id)),
+                'user_id': user_id,
+                'game_id': game_id,
+            }
+
+def generate_comments(rng, count, users, games):
+    game_ids = [game_id for game_id, _ in games]
+    for _ in range(count):
+        user_id = users.pick(rng)
+        yield {
+            'content': _text(rng, 3, 40),
+            'date': _after(rng, users.created_at(user_id)),
+            'user_id': user_id,
+            'game_id': rng.choice(game_ids),
+        }
+
+def generated_code(length):
+    return "// Generated game\n" + "function update(dt) { state.t += dt; }\n" * length
+
+# Generated games share a few hundred distinct codes, so GameCode stays small
+CODE_LENGTHS = range(5, 201)
+
+def generate_user_games(rng, user_games, users, category_ids, code_hashes):
+    for game_id in range(user_games.first_id, user_games.first_id + user_games.count):
+        user_id = users.pick(rng)
+        created = max(user_games.created_at(game_id), users.created_at(user_id))
+        yield {
+            'id': game_id,
+            'title': f"{_text(rng, 1, 3)[:-1]} {game_id}"[:100],
+            'description': _text(rng, 10, 60),
+            'instructions': _text(rng, 5, 20),
+            'code': '',
+            'code_hash': code_hashes[rng.randint(CODE_LENGTHS.start, CODE_LENGTHS.stop - 1)],
+            'thumbnail': None,
+            'date_created': created,
+            'date_updated': created,
+            'is_published': rng.random() < 0.85,
+            'is_featured': rng.random() < 0.02,
+            'user_id': user_id,
+            'category_id': rng.choice(category_ids) if category_ids else None,
+        }
+
+def generate_plays(rng, count, users, user_games):
+    for _ in range(count):
+        game_id = user_games.pick(rng)
+        # Roughly one play in twenty is abandoned before a duration is reported
+        duration = int(rng.lognormvariate(4.5, 1.0)) if rng.random() >= 0.05 else None
+        yield {
+            'played_at': _after(rng, user_games.created_at(game_id)),
+            'duration': duration,
+            'user_id': users.pick(rng),
+            'game_id': game_id,
+        }
+
+def _ensure_code(connection):
+    codes = {length: generated_code(length) for length in CODE_LENGTHS}
+    hashes = {length: hashlib.sha256(code.encode('utf-8')).hexdigest() for length, code in codes.items()}
+    existing = set(connection.scalars(select(GameCode.hash).where(GameCode.hash.in_(list(hashes.values())))))
+    rows = [{'hash': hashes[length], 'code': code, 'size': len(code), 'date_created': START}
+            for length, code in codes.items() if hashes[length] not in existing]
+    if rows:
+        connection.execute(GameCode.__table__.insert(), rows)
+    connection.commit()
+    return hashes
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _copy(connection, table, batch):
+    # COPY takes the batch as one CSV stream instead of a statement per row
+    columns = list(batch[0])
+    preparer = connection.dialect.identifier_preparer
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    sql = (f"COPY {preparer.format_table(table)} ({', '.join(preparer.quote(c) for c in columns)}) "
+           f"FROM STDIN WITH (FORMAT csv)")
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+def _write(connection, model, rows, batch_size, expected):
+    table = model.__table__
+    use_copy = connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+    # Building a secondary index once after the load is much cheaper than updating it row by row,
+    # unless the table already holds more rows than we're adding. Unique indexes stay to guard the data.
+    existing = connection.execute(select(func.count()).select_from(table)).scalar()
+    deferred = [index for index in table.indexes if not index.unique] if expected >= existing else []
+    connection.commit()
+    written = 0
+    started = time.perf_counter()
+    with connection.begin():
+        for index in deferred:
+            index.drop(connection, checkfirst=True)
+    try:
+        for batch in _batches(rows, batch_size):
+            with connection.begin():
+                if use_copy:
+                    _copy(connection, table, batch)
+                else:
+                    connection.execute(table.insert(), batch)
+            written += len(batch)
+    finally:
+        # If the load fails part way, upgrade-schema would also put these back
+        with connection.begin():
+            for index in deferred:
+                index.create(connection, checkfirst=True)
+    elapsed = time.perf_counter() - started
+    logging.debug(f"Loaded {written} {table.name} rows in {elapsed:.1f}s")
+    return written, elapsed
+
+def _fix_sequence(connection, model):
+    # Rows loaded with explicit ids leave PostgreSQL's id sequence behind
+    if connection.dialect.name != 'postgresql':
+        return
+    name = connection.dialect.identifier_preparer.format_table(model.__table__)
+    with connection.begin():
+        connection.execute(text(f"SELECT setval(pg_get_serial_sequence(:name, 'id'), "
+                                f"(SELECT max(id) FROM {name}))"), {'name': name})
+
+def _population(connection, model, count):
+    """Where new rows go if ``count`` > 0, otherwise the existing rows to reference."""
+    low, high = connection.execute(select(func.min(model.id), func.max(model.id))).one()
+    if count:
+        return Population((high or 0) + 1, count)
+    if high is None:
+        return None
+    return Population(low, high - low + 1)
+
+def load_synthetic(counts=None, seed=1, batch_size=10000, password='password', progress=None):
+    """Bulk load deterministic synthetic data and return ``{table: rows written}``.
+
+    Rows are generated lazily and written ``batch_size`` at a time, with COPY
+    on PostgreSQL and executemany elsewhere, so memory use doesn't grow with
+    the row count. Each table draws from its own seeded generator, so the same
+    seed and counts always produce the same rows. Scores, ratings and comments
+    reference the new users (or the existing ones if ``users`` is 0) and
+    assume their ids are contiguous, as they are for users loaded here.
+    Every generated user's password is ``password``.
+    """
+    counts = dict(DEFAULT_COUNTS, **(counts or {}))
+    written = {}
+    with db.engine.connect() as connection:
+        games = list(connection.execute(select(Game.id, Game.game_type).order_by(Game.id)))
+        category_ids = list(connection.scalars(select(GameCategory.id).order_by(GameCategory.id)))
+        users = _population(connection, User, counts['users'])
+        if users is None and any(counts[name] for name in ('scores', 'ratings', 'comments', 'user_games', 'plays')):
+            raise ValueError("No users to attach generated rows to")
+        if not games and any(counts[name] for name in ('scores', 'ratings', 'comments')):
+            raise ValueError("No games yet; run bootstrap first")
+        user_games = _population(connection, UserGame, counts['user_games'])
+        if user_games is None and counts['plays']:
+            raise ValueError("No user games to attach generated plays to")
+
+        def rng(name):
+            return random.Random(f"{seed}:{name}")
+
+        # Hashing is deliberately slow, so every generated user shares one hash
+        tables = [
+            (User, 'users', lambda: generate_users(rng('users'), users, generate_password_hash(password)), True),
+            (Score, 'scores', lambda: generate_scores(rng('scores'), counts['scores'], users, games), False),
+            (Rating, 'ratings', lambda: generate_ratings(rng('ratings'), counts['ratings'], users, games), False),
+            (Comment, 'comments', lambda: generate_comments(rng('comments'), counts['comments'], users, games), False),
+            (UserGame, 'user_games', lambda: generate_user_games(rng('user_games'), user_games, users, category_ids,
+                                                                 _ensure_code(connection)), True),
+            (UserGamePlay, 'plays', lambda: generate_plays(rng('plays'), counts['plays'], users, user_games), False),
+        ]
+        for model, name, rows, explicit_ids in tables:
+            if not counts[name]:
+                continue
+            written[name], elapsed = _write(connection, model, rows(), batch_size, counts[name])
+            if explicit_ids:
+                _fix_sequence(connection, model)
+            if progress:
+                progress(name, written[name], elapsed)
+
+    # The bulk inserts bypass the play rollups, denormalized counters and trending scores, so rebuild them
+    if counts['plays']:
+        backfill_play_rollups()
+    reconcile_stats()
+    rebuild_trending()
+    return written
@@ -0,0 +1,230 @@
+"""Token-bucket limits on incoming socket events and detection of clients that can't keep up."""
+import logging
+import threading
+import time
+
+DROP = 'drop'
+MERGE = 'merge'
+
+# Limits by event name, or "event:action" for individual game actions.
+# rate is in events per second; burst is the bucket size. Over the limit,
+# 'drop' discards the event and 'merge' keeps only the latest one per client
+# and handles it once the bucket refills.
+DEFAULT_LIMITS = {
+    'game_action': {'rate': 30, 'burst': 60, 'policy': DROP},
+    'game_action:move': {'rate': 20, 'burst': 20, 'policy': MERGE},
+    'game_action:aim': {'rate': 20, 'burst': 20, 'policy': MERGE},
+    'game_action:update_state': {'rate': 20, 'burst': 20, 'policy': MERGE},
+    'chat_message': {'rate': 1, 'burst': 5, 'policy': DROP},
+    'create_room': {'rate': 0.2, 'burst': 3, 'policy': DROP},
+    'join_room': {'rate': 1, 'burst': 5, 'policy': DROP},
+    'find_match': {'rate': 1, 'burst': 3, 'policy': DROP},
+}
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class SocketThrottle:
+    """Rate limits events per connection and tracks slow consumers.
+
+    A client whose Engine.IO send queue grows past ``slow_queue`` packets is
+    marked slow; high-volume broadcasts skip it via ``skip()`` until the
+    backlog drains below a quarter of that, when it gets a ``resync`` event
+    telling it to fetch the room state it missed with ``sync_state``. Queue
+    sizes are read through ``_send_backlogs()`` only; where the Engine.IO
+    server doesn't expose them, nobody is ever marked slow.
+    """
+
+    def __init__(self, socketio, limits=None, slow_queue=256, sweep_interval=0.5):
+        self.socketio = socketio
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.slow_queue = slow_queue
+        self.sweep_interval = sweep_interval
+        self._buckets = {}  # (sid, limit name) -> TokenBucket
+        self._held = {}  # (sid, limit name) -> latest merged event waiting for a token
+        self._slow = frozenset()
+        self._lock = threading.Lock()
+        self._task = None
+        self._wakeup = None
+        self._clients = 0
+        self._backpressure_off = False
+        self._counts = {name: {'dropped': 0, 'merged': 0, 'deferred': 0} for name in self.limits}
+        self._slow_marked = 0
+
+    def _limit_name(self, event, key):
+        if key is not None and f"{event}:{key}" in self.limits:
+            return f"{event}:{key}"
+        if event in self.limits:
+            return event
+        return None
+
+    def admit(self, sid, event, key=None, deferred=None):
+        """Return True if the event may be handled now.
+
+        Under a 'merge' policy ``deferred`` is kept in place of any earlier
+        held event from this client and called without a request context
+        once a token is available.
+        """
+        name = self._limit_name(event, key)
+        if name is None:
+            return True
+        limit = self.limits[name]
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((sid, name))
+            if bucket is None:
+                bucket = self._buckets[(sid, name)] = TokenBucket(limit['rate'], limit['burst'], now)
+            # A held event must go first, so newer ones replace it rather than overtake it
+            if (sid, name) not in self._held and bucket.take(now):
+                return True
+            counts = self._counts[name]
+            if limit['policy'] != MERGE or deferred is None:
+                counts['dropped'] += 1
+                return False
+            held = (sid, name) in self._held
+            if held:
+                counts['merged'] += 1
+            else:
+                counts['deferred'] += 1
+            self._held[(sid, name)] = deferred
+        self._ensure_task()
+        if not held:
+            self._wakeup.set()
+        return False
+
+    def skip(self, *sids):
+        """skip_sid list for a broadcast: the given sids plus every slow consumer."""
+        return list(self._slow.union(sids))
+
+    def forget(self, sid):
+        with self._lock:
+            for name in self.limits:
+                self._buckets.pop((sid, name), None)
+                self._held.pop((sid, name), None)
+
+    def _ensure_task(self):
+        if self._task is None:
+            with self._lock:
+                if self._task is None:
+                    self._wakeup = self.socketio.server.eio.create_event()
+                    self._task = self.socketio.start_background_task(self._run)
+
+    def start(self):
+        """Start the background release and slow-consumer sweep loop, or wake it for a new connection."""
+        self._ensure_task()
+        self._wakeup.set()
+
+    def _release_held(self):
+        """Handle held events that have a token again; returns seconds until the next one will, or None."""
+        now = time.monotonic()
+        ready = []
+        next_release = None
+        with self._lock:
+            for key, deferred in list(self._held.items()):
+                bucket = self._buckets[key]
+                if bucket.take(now):
+                    del self._held[key]
+                    ready.append(deferred)
+                else:
+                    wait = (1 - bucket.tokens) / bucket.rate
+                    if next_release is None or wait < next_release:
+                        next_release = wait
+        for deferred in ready:
+            try:
+                deferred()
+            except Exception as e:
+                logging.error(f"Error handling merged event: {str(e)}")
+        return next_release
+
+    def _send_backlogs(self):
+        """{sid: packets queued to send} for this worker's clients, or None if unavailable.
+
+        The queue sizes come from python-engineio's socket objects, which
+        aren't public API, so every lookup is guarded here and a server that
+        doesn't have them just runs without backpressure.
+        """
+        server = self.socketio.server
+        try:
+            participants = list(server.manager.get_participants('/', None))
+            sockets = server.eio.sockets
+        except (AttributeError, TypeError):
+            return None
+        backlogs = {}
+        for sid, eio_sid in participants:
+            sock = sockets.get(eio_sid)
+            if sock is None:
+                continue  # disconnected since the participants were listed
+            qsize = getattr(getattr(sock, 'queue', None), 'qsize', None)
+            if qsize is None:
+                return None
+            backlogs[sid] = qsize()
+        return backlogs
+
+    def _sweep(self):
+        backlogs = self._send_backlogs()
+        if backlogs is None:
+            if not self._backpressure_off:
+                self._backpressure_off = True
+                logging.warning("Engine.IO send queues aren't available; slow-consumer detection is off")
+            self._clients = 0
+            self._slow = frozenset()
+            return
+        self._clients = len(backlogs)
+        slow = set()
+        for sid, backlog in backlogs.items():
+            threshold = self.slow_queue // 4 if sid in self._slow else self.slow_queue
+            if backlog > threshold:
+                slow.add(sid)
+        marked = slow - self._slow
+        recovered = self._slow - slow
+        self._slow = frozenset(slow)
+        self._slow_marked += len(marked)
+        for sid in marked:
+            logging.debug(f"Slow consumer: {sid}")
+        for sid in recovered:
+            self.socketio.emit('resync', {}, to=sid)
+
+    def _run(self):
+        next_sweep = time.monotonic()
+        while True:
+            self._wakeup.clear()
+            next_release = self._release_held()
+            if time.monotonic() >= next_sweep:
+                try:
+                    self._sweep()
+                except Exception as e:
+                    logging.error(f"Error checking slow consumers: {str(e)}")
+                next_sweep = time.monotonic() + self.sweep_interval
+            # Sleep until a held event gets its token or the next sweep is due; with nothing
+            # held and nobody connected, until admit() holds an event or start() sees a client
+            delays = [] if next_release is None else [next_release]
+            if self._clients or self._slow:
+                delays.append(max(next_sweep - time.monotonic(), 0))
+            if delays:
+                self._wakeup.wait(min(delays))
+            else:
+                self._wakeup.wait()
+                next_sweep = time.monotonic()
+
+    def stats(self):
+        return {
+            'limits': self.limits,
+            'throttled': self._counts,
+            'held': len(self._held),
+            'slow_consumers': len(self._slow),
+            'slow_consumers_marked': self._slow_marked,
+        }
@@ -0,0 +1,307 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import send_file, url_for
+from sqlalchemy import select
+from app import db
+from models import UserGame
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Stored in UserGame.thumbnail as 'thumbnails/<digest>'; older rows hold a path under static/
+KEY_PREFIX = 'thumbnails/'
+
+# Fixed-size variants (width, height), cropped to fill
+DEFAULT_SIZES = {
+    'small': (160, 90),
+    'card': (320, 180),
+    'large': (640, 360),
+}
+
+# Leading bytes of each accepted format, and the extension its original is stored under
+SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+MIMETYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp'}
+
+class ThumbnailError(ValueError):
+    pass
+
+class ThumbnailStore:
+    """Content-addressed thumbnail storage with variants rendered off the request path.
+
+    ``save`` streams an upload to a temp file while hashing it, checks only the
+    image header and files the original under its SHA-256, so its cost doesn't
+    depend on the image's size and identical uploads share one set of files.
+    A small thread pool then renders the fixed-size WebP variants. Until a
+    variant exists its URL serves the original uncached. Files nothing refers
+    to are removed by ``collect_garbage``, which runs in the background every
+    ``gc_interval`` seconds and from ``flask gc-thumbnails``.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, sizes=None, max_bytes=5 * 1024 * 1024, max_pixels=40000000, workers=2,
+                 gc_interval=3600, gc_grace=3600, gc_batch_size=500):
+        self.sizes = dict(sizes or DEFAULT_SIZES)
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.workers = workers
+        self.gc_interval = gc_interval
+        self.gc_grace = gc_grace
+        self.gc_batch_size = gc_batch_size
+        self.root = None
+        self.app = None
+        self._pool = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._stored = 0
+        self._deduplicated = 0
+        self._rejected = 0
+        self._rendered = 0
+        self._failed = 0
+        self._last_render_ms = 0.0
+        self._max_render_ms = 0.0
+        self._collected = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.root = app.config.get('THUMBNAIL_DIR') or os.path.join(app.static_folder, 'uploads', 'thumbnails')
+        self.sizes = {name: tuple(size) for name, size in (app.config.get('THUMBNAIL_SIZES') or self.sizes).items()}
+        self.max_bytes = app.config.get('THUMBNAIL_MAX_BYTES', self.max_bytes)
+        self.workers = app.config.get('THUMBNAIL_WORKERS', self.workers)
+        self.gc_interval = app.config.get('THUMBNAIL_GC_INTERVAL', self.gc_interval)
+        self.gc_grace = app.config.get('THUMBNAIL_GC_GRACE', self.gc_grace)
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+
+    def _ensure_pool(self):
+        # Start lazily, and again after a fork, so each gunicorn worker has its own pool
+        if self._pool is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pool is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._inflight = set()
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='thumbnail')
+            if self.gc_interval:
+                threading.Thread(target=self._run_gc, name='thumbnail-gc', daemon=True).start()
+
+    def _path(self, digest, name):
+        return os.path.join(self.root, digest[:2], name)
+
+    def _original(self, digest):
+        for extension in MIMETYPES:
+            path = self._path(digest, f"{digest}.{extension}")
+            if os.path.exists(path):
+                return path, extension
+        return None, None
+
+    def _variant(self, digest, variant):
+        return self._path(digest, f"{digest}-{variant}.webp")
+
+    def save(self, upload):
+        """Store an uploaded FileStorage and return the value for ``UserGame.thumbnail``.
+
+        Raises ThumbnailError if the upload is too large or isn't a supported image.
+        """
+        self._ensure_pool()
+        digest = hashlib.sha256()
+        size = 0
+        temp = tempfile.NamedTemporaryFile(dir=os.path.join(self.root, 'tmp'), suffix='.partial', delete=False)
+        try:
+            with temp:
+                while True:
+                    chunk = upload.stream.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ThumbnailError(f"Thumbnail must be smaller than {self.max_bytes // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    temp.write(chunk)
+            extension = self._check_image(temp.name)
+            digest = digest.hexdigest()
+            original, _ = self._original(digest)
+            if original is None:
+                os.makedirs(os.path.dirname(self._path(digest, digest)), exist_ok=True)
+                os.replace(temp.name, self._path(digest, f"{digest}.{extension}"))
+                self._stored += 1
+            else:
+                # Already stored; refresh its age so a concurrent collect_garbage keeps it
+                os.utime(original)
+                self._deduplicated += 1
+        except ThumbnailError:
+            self._rejected += 1
+            raise
+        finally:
+            if os.path.exists(temp.name):
+                os.remove(temp.name)
+        self.render(digest)
+        return KEY_PREFIX + digest
+
+    def _check_image(self, path):
+        # Reads the header only, never the pixels
+        with open(path, 'rb') as f:
+            head = f.read(16)
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            extension = 'webp'
+        else:
+            extension = next((ext for signature, ext in SIGNATURES if head.startswith(signature)), None)
+        if extension is None:
+            raise ThumbnailError("Thumbnail must be a PNG, JPEG, GIF or WebP image")
+        if Image is not None:
+            try:
+                with Image.open(path) as image:
+                    width, height = image.size
+            except Exception:
+                raise ThumbnailError("Thumbnail image could not be read") from None
+            if width * height > self.max_pixels:
+                raise ThumbnailError("Thumbnail image dimensions are too large")
+        return extension
+
+    def render(self, digest):
+        """Queue any missing variants of a stored original. Returns False if there's nothing to do."""
+        if Image is None or all(os.path.exists(self._variant(digest, variant)) for variant in self.sizes):
+            return False
+        with self._lock:
+            if digest in self._inflight:
+                return True
+            self._inflight.add(digest)
+        self._pool.submit(self._render, digest)
+        return True
+
+    def _render(self, digest):
+        started = time.perf_counter()
+        try:
+            original, _ = self._original(digest)
+            if original is None:
+                return
+            with Image.open(original) as image:
+                # Lets JPEG decode straight at a reduced scale
+                image.draft('RGB', (max(w for w, _ in self.sizes.values()), max(h for _, h in self.sizes.values())))
+                image = ImageOps.exif_transpose(image)
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+                for variant, size in self.sizes.items():
+                    path = self._variant(digest, variant)
+                    partial = f"{path}.partial"
+                    ImageOps.fit(image, size, Image.LANCZOS).save(partial, 'WEBP', quality=80)
+                    os.replace(partial, path)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._rendered += 1
+            self._last_render_ms = elapsed_ms
+            self._max_render_ms = max(self._max_render_ms, elapsed_ms)
+            logging.debug(f"Rendered thumbnails for {digest} in {elapsed_ms:.1f}ms")
+        except Exception as e:
+            self._failed += 1
+            logging.error(f"Error rendering thumbnails for {digest}: {str(e)}")
+        finally:
+            with self._lock:
+                self._inflight.discard(digest)
+
+    def send(self, digest, variant):
+        """Response for one variant: cached forever once rendered, the original uncached until then."""
+        if variant not in self.sizes or len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            return None
+        self._ensure_pool()
+        path = self._variant(digest, variant)
+        if os.path.exists(path):
+            response = send_file(path, mimetype=MIMETYPES['webp'], max_age=31536000)
+            response.cache_control.immutable = True
+            return response
+        original, extension = self._original(digest)
+        if original is None:
+            return None
+        # Picks up renders lost to a restart
+        self.render(digest)
+        response = send_file(original, mimetype=MIMETYPES[extension], max_age=0)
+        response.cache_control.no_store = True
+        return response
+
+    def collect_garbage(self, grace=None):
+        """Delete stored images no game refers to anymore. Returns the number of images removed.
+
+        Each shard directory is checked against the database in batches of
+        ``gc_batch_size``. Anything touched within ``grace`` seconds is kept,
+        which covers uploads whose game hasn't been committed yet.
+        """
+        grace = self.gc_grace if grace is None else grace
+        cutoff = time.time() - grace
+        removed = 0
+        temp_dir = os.path.join(self.root, 'tmp')
+        for name in os.listdir(temp_dir):
+            path = os.path.join(temp_dir, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        for shard in sorted(os.listdir(self.root)):
+            shard_dir = os.path.join(self.root, shard)
+            if shard == 'tmp' or not os.path.isdir(shard_dir):
+                continue
+            files = {}
+            for name in os.listdir(shard_dir):
+                files.setdefault(name[:64], []).append(os.path.join(shard_dir, name))
+            candidates = [digest for digest, paths in files.items()
+                          if max(os.path.getmtime(path) for path in paths) < cutoff]
+            for start in range(0, len(candidates), self.gc_batch_size):
+                batch = candidates[start:start + self.gc_batch_size]
+                keys = [KEY_PREFIX + digest for digest in batch]
+                referenced = set(db.session.scalars(select(UserGame.thumbnail).where(UserGame.thumbnail.in_(keys))))
+                for digest in batch:
+                    if KEY_PREFIX + digest in referenced:
+                        continue
+                    for path in files[digest]:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    removed += 1
+        self._collected += removed
+        if removed:
+            logging.debug(f"Removed {removed} unreferenced thumbnails")
+        return removed
+
+    def _run_gc(self):
+        while True:
+            time.sleep(self.gc_interval)
+            try:
+                with self.app.app_context():
+                    self.collect_garbage()
+            except Exception as e:
+                logging.error(f"Error collecting thumbnails: {str(e)}")
+
+    def stats(self):
+        return {
+            'renderer': 'pillow' if Image is not None else None,
+            'inflight': len(self._inflight),
+            'stored': self._stored,
+            'deduplicated': self._deduplicated,
+            'rejected': self._rejected,
+            'rendered': self._rendered,
+            'failed': self._failed,
+            'last_render_ms': round(self._last_render_ms, 2),
+            'max_render_ms': round(self._max_render_ms, 2),
+            'collected': self._collected,
+        }
+
+def thumbnail_url(thumbnail, variant='card'):
+    """URL for a game's thumbnail in the given variant, or None if it has none."""
+    if not thumbnail:
+        return None
+    if thumbnail.startswith(KEY_PREFIX):
+        return url_for('thumbnail', digest=thumbnail[len(KEY_PREFIX):], variant=variant)
+    return url_for('static', filename=thumbnail)
+
+thumbnails = ThumbnailStore()
@@ -0,0 +1,112 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+class TickScheduler:
+    """Collects game actions per room and broadcasts them as one frame per tick.
+
+    Rooms whose game_type has a configured tick rate get a single
+    ``game_frame`` broadcast per tick instead of one ``game_action`` emit per
+    incoming action. Actions listed in ``coalesced_actions`` are keyed by
+    (player, action) so a newer one replaces the older one still waiting in
+    the same tick, e.g. position updates. Frames go to the whole room except
+    the sids returned by ``skip``; clients skip entries carrying their own
+    player_id.
+    """
+
+    def __init__(self, socketio, rates=None, coalesced_actions=('move', 'aim', 'update_state'), skip=None):
+        self.socketio = socketio
+        self.skip = skip
+        self.rates = dict(rates or {})
+        self.coalesced_actions = set(coalesced_actions)
+        self._pending = {}  # room_id -> {key: action}
+        self._due = []  # heap of (due time, room_id) for rooms with pending actions
+        self._ticks = {}  # room_id -> frames sent so far
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._task = None
+        self._wakeup = None
+        self._actions_in = 0
+        self._actions_superseded = 0
+        self._frames_out = 0
+
+    def rate_for(self, game_type):
+        return self.rates.get(game_type)
+
+    def submit(self, room_id, game_type, payload):
+        """Queue an action payload for the room's next frame. Returns False if the room isn't ticked."""
+        rate = self.rate_for(game_type)
+        if not rate:
+            return False
+        if payload['action'] in self.coalesced_actions:
+            key = (payload['player_id'], payload['action'])
+        else:
+            key = next(self._sequence)
+        woken = False
+        with self._lock:
+            pending = self._pending.get(room_id)
+            if pending is None:
+                pending = self._pending[room_id] = {}
+                heapq.heappush(self._due, (time.monotonic() + 1.0 / rate, room_id))
+                woken = self._due[0][1] == room_id
+            elif key in pending:
+                # Re-insert so the superseding action keeps its arrival order
+                del pending[key]
+                self._actions_superseded += 1
+            pending[key] = payload
+            self._actions_in += 1
+        self._ensure_task()
+        if woken:
+            # This room is due before whatever the loop is sleeping towards
+            self._wakeup.set()
+        return True
+
+    def forget(self, room_id):
+        with self._lock:
+            self._pending.pop(room_id, None)
+            self._ticks.pop(room_id, None)
+
+    def _ensure_task(self):
+        if self._task is None:
+            with self._lock:
+                if self._task is None:
+                    self._wakeup = self.socketio.server.eio.create_event()
+                    self._task = self.socketio.start_background_task(self._run)
+
+    def _take_due(self, now):
+        frames = []
+        with self._lock:
+            while self._due and self._due[0][0] <= now:
+                _, room_id = heapq.heappop(self._due)
+                pending = self._pending.pop(room_id, None)
+                if pending:
+                    tick = self._ticks.get(room_id, 0) + 1
+                    self._ticks[room_id] = tick
+                    frames.append((room_id, tick, list(pending.values())))
+            next_due = self._due[0][0] if self._due else None
+        return frames, next_due
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            frames, next_due = self._take_due(time.monotonic())
+            for room_id, tick, actions in frames:
+                try:
+                    self.socketio.emit('game_frame', {'tick': tick, 'actions': actions}, to=room_id,
+                                       skip_sid=self.skip() if self.skip else None)
+                    self._frames_out += 1
+                except Exception as e:
+                    logging.error(f"Error sending frame to room {room_id}: {str(e)}")
+            # Sleep until the next room is due, or until submit() brings in an earlier one
+            self._wakeup.wait(None if next_due is None else max(next_due - time.monotonic(), 0))
+
+    def stats(self):
+        return {
+            'rates': self.rates,
+            'active_rooms': len(self._pending),
+            'actions_in': self._actions_in,
+            'actions_superseded': self._actions_superseded,
+            'frames_out': self._frames_out,
+        }
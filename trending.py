@@ -0,0 +1,439 @@
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select, update
+from app import db
+from models import UserGame, UserGameTrend, UserGameDeletion, UserGamePlayRollup, UserGameRating, UserGameComment
+
+# Scores are measured in hours from this fixed point; any fixed moment works
+EPOCH = datetime(2024, 1, 1)
+
+# How much each event adds to each ranking. "top_rated" counts a rating by
+# how far it is above or below 3 stars, so only well-rated games climb it
+WEIGHTS = {
+    'play': {'trending': 1.0},
+    'comment': {'trending': 3.0},
+    'rating': {'trending': 2.0},
+}
+
+# Values this close to zero count as zero, which takes a game out of the ranking
+MIN_VALUE = 1e-6
+
+def _hours(moment):
+    return (moment - EPOCH).total_seconds() / 3600
+
+def decayed_value(score, hours, half_life):
+    """Value at ``hours`` of a stored score (None is zero).
+
+    A value v is stored as log2(|v|) + hours / half-life, negated when v is
+    negative. That magnitude is positive for any moment more than 20
+    half-lives after EPOCH, so scores sort in the same order as values.
+    """
+    if score is None:
+        return 0.0
+    magnitude = 2 ** (abs(score) - hours / half_life)
+    return magnitude if score > 0 else -magnitude
+
+def decayed_score(value, hours, half_life):
+    """Inverse of ``decayed_value``: the stored score of ``value`` at ``hours``."""
+    if abs(value) <= MIN_VALUE:
+        return None
+    magnitude = math.log2(abs(value)) + hours / half_life
+    return magnitude if value > 0 else -magnitude
+
+class Ranking:
+    """User games ordered by one decayed score, best first.
+
+    Keys are ``(-score, game_id)`` in a sorted list, like the leaderboards.
+    Scores don't change as time passes, only when the game gets an event, so
+    an update moves one key and reading the top ``n`` is a slice.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._scores = {}  # game_id -> score
+
+    def __len__(self):
+        return len(self._keys)
+
+    def set(self, game_id, score):
+        old = self._scores.pop(game_id, None)
+        if old is not None:
+            index = bisect_left(self._keys, (-old, game_id))
+            if index < len(self._keys) and self._keys[index] == (-old, game_id):
+                del self._keys[index]
+        if score is not None:
+            self._scores[game_id] = score
+            insort(self._keys, (-score, game_id))
+
+    def load(self, scores):
+        self._scores = {game_id: score for game_id, score in scores if score is not None}
+        self._keys = sorted((-score, game_id) for game_id, score in self._scores.items())
+
+    def top(self, n):
+        return [(game_id, -key) for key, game_id in self._keys[:n]]
+
+class TrendingIndex:
+    """Time-decayed "trending" and "top rated" rankings of published user games.
+
+    Every play, rating and comment adds its weight to the game's scores, and
+    scores halve every ``half_lives[name]`` hours. Rankings, overall and per
+    category, are kept in process memory and updated in place as events
+    happen, so reads never aggregate the raw tables. Events are also queued
+    as deltas and merged into ``user_game_trend`` every ``sync_interval``
+    seconds by a background thread, which then pulls rows other workers
+    changed, and games they deleted, since the last sync. The index is loaded from that snapshot on
+    first read; ``rebuild_trending`` recomputes it from the raw tables.
+    """
+
+    def __init__(self, trending_half_life=24, top_rated_half_life=7 * 24, sync_interval=5, sync_margin=60,
+                 batch_size=500, deletion_retention_days=7):
+        self.half_lives = {'trending': trending_half_life, 'top_rated': top_rated_half_life}
+        self.sync_interval = sync_interval
+        self.sync_margin = sync_margin
+        self.batch_size = batch_size
+        self.deletion_retention_days = deletion_retention_days
+        self.app = None
+        self._loaded = False
+        self._scores = {}  # game_id -> {ranking: score}
+        self._listed = {}  # game_id -> category_id, for published games
+        self._rankings = {}  # (ranking, category_id or None) -> Ranking
+        self._pending = {}  # game_id -> {ranking: [value, hours]} not yet in the snapshot
+        self._synced_at = None
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._events = 0
+        self._flushes = 0
+        self._pulled = 0
+        self._last_flush_ms = 0.0
+        self._last_pull_ms = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self.half_lives['trending'] = app.config.get('TRENDING_HALF_LIFE_HOURS', self.half_lives['trending'])
+        self.half_lives['top_rated'] = app.config.get('TOP_RATED_HALF_LIFE_HOURS', self.half_lives['top_rated'])
+        self.sync_interval = app.config.get('TRENDING_SYNC_INTERVAL', self.sync_interval)
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        # Start lazily, and again after a fork, so each gunicorn worker has its own syncer
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='trending-sync', daemon=True)
+            self._thread.start()
+
+    def _ranking(self, name, category_id=None):
+        ranking = self._rankings.get((name, category_id))
+        if ranking is None:
+            ranking = self._rankings[(name, category_id)] = Ranking()
+        return ranking
+
+    def _place(self, game_id, listed, category_id):
+        # Move the game's keys to match its current scores and listing
+        previous = self._listed.pop(game_id, False)
+        scores = self._scores.get(game_id, {})
+        for name in self.half_lives:
+            if previous is not False:
+                for scope in {None, previous}:
+                    self._ranking(name, scope).set(game_id, None)
+            if listed:
+                for scope in {None, category_id}:
+                    self._ranking(name, scope).set(game_id, scores.get(name))
+        if listed:
+            self._listed[game_id] = category_id
+
+    def _record(self, game_id, weights, moment=None):
+        hours = _hours(moment or datetime.utcnow())
+        self._ensure_thread()
+        with self._lock:
+            self._events += 1
+            pending = self._pending.setdefault(game_id, {})
+            scores = self._scores.setdefault(game_id, {})
+            for name, weight in weights.items():
+                half_life = self.half_lives[name]
+                value, at = pending.get(name, (0.0, hours))
+                pending[name] = [value * 2 ** ((at - hours) / half_life) + weight, hours]
+                scores[name] = decayed_score(decayed_value(scores.get(name), hours, half_life) + weight,
+                                             hours, half_life)
+            if game_id in self._listed:
+                self._place(game_id, True, self._listed[game_id])
+
+    def record_play(self, game_id):
+        self._record(game_id, WEIGHTS['play'])
+
+    def record_comment(self, game_id):
+        self._record(game_id, WEIGHTS['comment'])
+
+    def record_rating(self, game_id, rating, previous=None):
+        """A new rating, or a changed one when ``previous`` is given."""
+        if previous is None:
+            self._record(game_id, dict(WEIGHTS['rating'], top_rated=rating - 3))
+        elif rating != previous:
+            self._record(game_id, {'top_rated': rating - previous})
+
+    def update_listing(self, game):
+        """Follow a game being published, unpublished or moved to another category."""
+        with self._lock:
+            if self._loaded:
+                self._place(game.id, game.is_published, game.category_id)
+            # An empty delta still touches the snapshot row, so other workers see the change
+            self._pending.setdefault(game.id, {})
+        self._ensure_thread()
+
+    def log_deletion(self, game_id, now=None):
+        """Record a game's deletion in the current transaction, for other workers to pull.
+
+        Records older than ``deletion_retention_days`` are pruned at the same time.
+        """
+        now = now or datetime.utcnow()
+        db.session.execute(delete(UserGameDeletion).where(
+            UserGameDeletion.deleted_at < now - timedelta(days=self.deletion_retention_days)))
+        db.session.add(UserGameDeletion(game_id=game_id, deleted_at=now))
+
+    def remove(self, game_id):
+        """Drop a game once its deletion, logged with ``log_deletion``, has committed."""
+        with self._lock:
+            self._drop(game_id)
+
+    def _drop(self, game_id):
+        self._place(game_id, False, None)
+        self._scores.pop(game_id, None)
+        self._pending.pop(game_id, None)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            self._synced_at = datetime.utcnow()
+            rows = db.session.execute(
+                select(UserGameTrend.game_id, UserGameTrend.trending, UserGameTrend.top_rated, UserGame.category_id)
+                .join(UserGame, UserGame.id == UserGameTrend.game_id)
+                .where(UserGame.is_published == True)).all()
+            self._scores = {}
+            self._listed = {}
+            for game_id, trending, top_rated, category_id in rows:
+                self._scores[game_id] = {'trending': trending, 'top_rated': top_rated}
+                self._listed[game_id] = category_id
+            # Games whose first events haven't been flushed have no row yet
+            unsynced = [game_id for game_id in self._pending if game_id not in self._listed]
+            for offset in range(0, len(unsynced), self.batch_size):
+                self._listed.update(db.session.execute(
+                    select(UserGame.id, UserGame.category_id)
+                    .where(UserGame.id.in_(unsynced[offset:offset + self.batch_size]), UserGame.is_published == True))
+                    .all())
+            # Events recorded before the load aren't in the snapshot yet
+            hours = _hours(self._synced_at)
+            for game_id, deltas in self._pending.items():
+                self._scores[game_id] = self._merge(self._scores.get(game_id, {}), deltas, hours)
+            self._rankings = {}
+            for name in self.half_lives:
+                by_scope = {}
+                for game_id, category_id in self._listed.items():
+                    score = self._scores.get(game_id, {}).get(name)
+                    by_scope.setdefault(None, []).append((game_id, score))
+                    if category_id is not None:
+                        by_scope.setdefault(category_id, []).append((game_id, score))
+                for scope, scores in by_scope.items():
+                    self._ranking(name, scope).load(scores)
+            self._loaded = True
+            logging.debug(f"Trending index loaded with {len(self._listed)} games "
+                          f"in {time.perf_counter() - started:.3f}s")
+        self._ensure_thread()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.flush()
+                if self._loaded:
+                    with self.app.app_context():
+                        self._pull()
+            except Exception as e:
+                logging.error(f"Error syncing trending scores: {str(e)}")
+
+    def flush(self):
+        """Merge queued deltas into user_game_trend. Returns the number of rows written."""
+        if self.app is None:
+            return 0
+        with self._flush_lock, self.app.app_context():
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            started = time.perf_counter()
+            now = datetime.utcnow()
+            hours = _hours(now)
+            game_ids = list(pending)
+            written = 0
+            try:
+                for offset in range(0, len(game_ids), self.batch_size):
+                    batch = game_ids[offset:offset + self.batch_size]
+                    # Skip games deleted since their events were recorded
+                    batch = list(db.session.scalars(select(UserGame.id).where(UserGame.id.in_(batch))))
+                    rows = {row.game_id: row for row in db.session.scalars(
+                        select(UserGameTrend).where(UserGameTrend.game_id.in_(batch)).with_for_update())}
+                    for game_id in batch:
+                        row = rows.get(game_id)
+                        if row is None:
+                            row = UserGameTrend(game_id=game_id)
+                            db.session.add(row)
+                        current = {name: getattr(row, name) for name in self.half_lives}
+                        merged = self._merge(current, pending[game_id], hours)
+                        for name in self.half_lives:
+                            setattr(row, name, merged[name])
+                        row.updated_at = now
+                    written += len(batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Put the deltas back so the next flush retries them
+                with self._lock:
+                    for game_id, deltas in pending.items():
+                        self._pending[game_id] = self._combine(deltas, self._pending.get(game_id, {}))
+                raise
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._flushes += 1
+            self._last_flush_ms = elapsed_ms
+            logging.debug(f"Flushed trending deltas of {written} games in {elapsed_ms:.1f}ms")
+            return written
+
+    def _merge(self, scores, deltas, hours):
+        merged = dict(scores)
+        for name, (value, at) in deltas.items():
+            half_life = self.half_lives[name]
+            merged[name] = decayed_score(decayed_value(scores.get(name), hours, half_life)
+                                         + value * 2 ** ((at - hours) / half_life), hours, half_life)
+        return merged
+
+    def _combine(self, older, newer):
+        combined = {name: list(delta) for name, delta in newer.items()}
+        for name, (value, at) in older.items():
+            if name in combined:
+                half_life = self.half_lives[name]
+                combined[name][0] += value * 2 ** ((at - combined[name][1]) / half_life)
+            else:
+                combined[name] = [value, at]
+        return combined
+
+    def _pull(self):
+        # Rows written since the last sync, by any worker; the margin covers clock
+        # skew and slow commits, and applying a row twice is harmless
+        started = time.perf_counter()
+        since = self._synced_at - timedelta(seconds=self.sync_margin)
+        synced_at = datetime.utcnow()
+        rows = db.session.execute(
+            select(UserGameTrend.game_id, UserGameTrend.trending, UserGameTrend.top_rated,
+                   UserGame.is_published, UserGame.category_id)
+            .join(UserGame, UserGame.id == UserGameTrend.game_id)
+            .where(UserGameTrend.updated_at > since)).all()
+        # Deleting a game removes its snapshot row, so deletions come from their own log
+        deleted = db.session.scalars(
+            select(UserGameDeletion.game_id).where(UserGameDeletion.deleted_at > since)).all()
+        db.session.commit()
+        hours = _hours(synced_at)
+        with self._lock:
+            # Rows are of games that exist now, so they win over a deletion of the same id
+            for game_id in deleted:
+                self._drop(game_id)
+            for game_id, trending, top_rated, is_published, category_id in rows:
+                self._scores[game_id] = self._merge({'trending': trending, 'top_rated': top_rated},
+                                                    self._pending.get(game_id, {}), hours)
+                self._place(game_id, is_published, category_id)
+            self._synced_at = synced_at
+        self._pulled += len(rows) + len(deleted)
+        self._last_pull_ms = (time.perf_counter() - started) * 1000
+
+    def top(self, name='trending', n=10, category_id=None):
+        """[(game_id, value)] of the best ``n`` published games with a positive score, and each one's current value."""
+        self._ensure_loaded()
+        hours = _hours(datetime.utcnow())
+        with self._lock:
+            ranked = self._ranking(name, category_id).top(n)
+        # Games rated below 3 stars on balance rank last in "top_rated" but aren't shown
+        return [(game_id, round(decayed_value(score, hours, self.half_lives[name]), 3))
+                for game_id, score in ranked if score > 0]
+
+    def clear(self):
+        with self._lock:
+            self._loaded = False
+            self._scores = {}
+            self._listed = {}
+            self._rankings = {}
+
+    def stats(self):
+        return {
+            'loaded': self._loaded,
+            'games': len(self._listed),
+            'ranked': {name: len(self._rankings[(name, None)]) for name in self.half_lives
+                       if (name, None) in self._rankings},
+            'pending': len(self._pending),
+            'events': self._events,
+            'flushes': self._flushes,
+            'pulled': self._pulled,
+            'last_flush_ms': round(self._last_flush_ms, 2),
+            'last_pull_ms': round(self._last_pull_ms, 2),
+        }
+
+def rebuild_trending(now=None):
+    """Recompute every game's trending scores from the raw events. Returns the number of rows written.
+
+    For events that bypassed the index, such as bulk loads, or after
+    changing the weights. Plays come from the hourly rollups, so this reads
+    nothing older than their retention.
+    """
+    now = now or datetime.utcnow()
+    hours = _hours(now)
+    half_lives = trending.half_lives
+    values = {}
+
+    def add(game_id, moment, weights):
+        game = values.setdefault(game_id, dict.fromkeys(half_lives, 0.0))
+        for name, weight in weights.items():
+            game[name] += weight * 2 ** ((_hours(moment) - hours) / half_lives[name])
+
+    plays = (db.session.query(UserGamePlayRollup.game_id, UserGamePlayRollup.bucket, UserGamePlayRollup.plays)
+             .filter(UserGamePlayRollup.period == 'hour').yield_per(10000))
+    for game_id, bucket, count in plays:
+        add(game_id, bucket + timedelta(minutes=30), {name: weight * count for name, weight in WEIGHTS['play'].items()})
+    for game_id, date, rating in db.session.query(UserGameRating.game_id, UserGameRating.date,
+                                                  UserGameRating.rating).yield_per(10000):
+        add(game_id, date or now, dict(WEIGHTS['rating'], top_rated=rating - 3))
+    for game_id, date in db.session.query(UserGameComment.game_id, UserGameComment.date).yield_per(10000):
+        add(game_id, date or now, WEIGHTS['comment'])
+
+    existing = set(db.session.scalars(select(UserGameTrend.game_id)))
+    games = set(db.session.scalars(select(UserGame.id)))
+    rows = []
+    for game_id in existing | (set(values) & games):
+        game = values.get(game_id, {})
+        rows.append(dict({name: decayed_score(game.get(name, 0.0), hours, half_life)
+                          for name, half_life in half_lives.items()}, game_id=game_id, updated_at=now))
+    for offset in range(0, len(rows), 1000):
+        batch = rows[offset:offset + 1000]
+        changed = [row for row in batch if row['game_id'] in existing]
+        new = [row for row in batch if row['game_id'] not in existing]
+        if changed:
+            db.session.execute(update(UserGameTrend), changed)
+        if new:
+            db.session.execute(insert(UserGameTrend), new)
+    db.session.commit()
+    trending.clear()
+    logging.debug(f"Rebuilt trending scores of {len(rows)} user games")
+    return len(rows)
+
+trending = TrendingIndex()